@@ -0,0 +1,440 @@
+"""
+Headless batch runner for directories or lists of MRI images.
+
+Run from the project root:
+
+    python -m backend.batch_runner data_samples --out results.jsonl
+    python -m backend.batch_runner --file-list todo.txt --out results.parquet
+
+Images are decoded in a thread pool that stays ahead of inference, pushed
+through full_pipeline_batch in batches, and written as one record per
+image (JSONL, or Parquet when pyarrow is installed). Segmentation masks go
+to a compact binary sidecar next to the output (<out>.masks.bin); each
+record holds the offset and length of its mask there, see read_mask().
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from backend import metrics
+from backend.classification_inference import CLASS_NAMES
+from backend.pipeline import full_pipeline_batch
+from utils.preprocessing import PreprocessContext
+
+VALID_EXTS = {".png", ".jpg", ".jpeg"}
+
+
+# ----------------------------------------------------------------------
+# Inputs
+# ----------------------------------------------------------------------
+
+def iter_image_paths(root: str) -> Iterator[str]:
+    """
+    Walk a directory tree lazily, yielding image paths in sorted order.
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for fname in sorted(filenames):
+            if os.path.splitext(fname)[1].lower() in VALID_EXTS:
+                yield os.path.join(dirpath, fname)
+
+
+def iter_file_list(list_path: str) -> Iterator[str]:
+    """
+    Yield paths from a text file, one per line ("-" reads stdin).
+    """
+    f = sys.stdin if list_path == "-" else open(list_path)
+    try:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def _decode(path: str):
+    """
+    Decode one image and prepare its detection input (runs in a worker thread).
+    """
+    start = time.perf_counter()
+    try:
+        ctx = PreprocessContext.from_path(path)
+        ctx.detection_input()
+        error = None
+    except Exception as exc:  # unreadable / corrupt file: report, don't stop
+        ctx, error = None, f"{type(exc).__name__}: {exc}"
+    return path, ctx, error, time.perf_counter() - start
+
+
+def prefetch_decoded(paths: Iterable[str], workers: int, depth: int):
+    """
+    Decode images in a thread pool, keeping up to `depth` in flight ahead
+    of the consumer. Yields (path, context or None, error or None, seconds)
+    in input order.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for path in paths:
+            pending.append(pool.submit(_decode, path))
+            if len(pending) >= depth:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+# ----------------------------------------------------------------------
+# Outputs
+# ----------------------------------------------------------------------
+
+def _encode_mask(mask: np.ndarray) -> bytes:
+    return zlib.compress(np.packbits(mask.astype(bool), axis=None).tobytes())
+
+
+def read_mask(sidecar_path: str, record: dict) -> Optional[np.ndarray]:
+    """
+    Load one record's mask from the sidecar written by the batch runner.
+
+    Returns
+    -------
+    mask : np.ndarray or None
+        (H, W) uint8 {0, 1}, or None if the record has no mask.
+    """
+    if record.get("mask_offset") is None:
+        return None
+    with open(sidecar_path, "rb") as f:
+        f.seek(record["mask_offset"])
+        data = f.read(record["mask_nbytes"])
+    h, w = record["mask_height"], record["mask_width"]
+    bits = np.frombuffer(zlib.decompress(data), dtype=np.uint8)
+    return np.unpackbits(bits, count=h * w).reshape(h, w)
+
+
+def _record(path: str, result: Optional[dict], error: Optional[str]) -> dict:
+    record = {
+        "path": path,
+        "error": error,
+        "has_tumor": None,
+        "detection_prob": None,
+        "predicted_label": None,
+    }
+    for cls in CLASS_NAMES:
+        record[f"prob_{cls}"] = None
+    record.update(
+        tumor_pixels=None, mask_height=None, mask_width=None, mask_offset=None, mask_nbytes=None
+    )
+
+    if result is not None:
+        record["has_tumor"] = bool(result["has_tumor"])
+        record["detection_prob"] = float(result["detection_prob"])
+        record["predicted_label"] = result["predicted_label"]
+        for cls, p in (result["class_probs"] or {}).items():
+            record[f"prob_{cls}"] = float(p)
+    return record
+
+
+class ResultWriter:
+    """
+    Stream records to JSONL or Parquet, and masks to a binary sidecar.
+    """
+
+    def __init__(self, out_path: str):
+        self.out_path = out_path
+        self.sidecar_path = out_path + ".masks.bin"
+        self.parquet = out_path.endswith(".parquet")
+
+        self._sidecar = open(self.sidecar_path, "wb")
+        self._offset = 0
+        if self.parquet:
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError as exc:
+                raise SystemExit("Parquet output needs pyarrow: pip install pyarrow") from exc
+            self._writer = None
+        else:
+            self._out = open(out_path, "w")
+
+    def write_mask(self, record: dict, mask: np.ndarray) -> None:
+        data = _encode_mask(mask)
+        self._sidecar.write(data)
+        record.update(
+            tumor_pixels=int(np.count_nonzero(mask)),
+            mask_height=int(mask.shape[0]),
+            mask_width=int(mask.shape[1]),
+            mask_offset=self._offset,
+            mask_nbytes=len(data),
+        )
+        self._offset += len(data)
+
+    def write_batch(self, records: List[dict]) -> None:
+        if not records:
+            return
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pylist(records, schema=self._schema(records[0]))
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.out_path, table.schema)
+            self._writer.write_table(table)
+        else:
+            for record in records:
+                self._out.write(json.dumps(record) + "\n")
+            self._out.flush()
+
+    def _schema(self, record: dict):
+        import pyarrow as pa
+
+        types = {
+            "path": pa.string(),
+            "error": pa.string(),
+            "has_tumor": pa.bool_(),
+            "predicted_label": pa.string(),
+        }
+        int_fields = {"tumor_pixels", "mask_height", "mask_width", "mask_offset", "mask_nbytes"}
+        fields = []
+        for name in record:
+            if name in types:
+                fields.append(pa.field(name, types[name]))
+            elif name in int_fields:
+                fields.append(pa.field(name, pa.int64()))
+            else:
+                fields.append(pa.field(name, pa.float64()))
+        return pa.schema(fields)
+
+    def close(self) -> None:
+        self._sidecar.close()
+        if self.parquet:
+            if self._writer is not None:
+                self._writer.close()
+        else:
+            self._out.close()
+
+
+# ----------------------------------------------------------------------
+# Runner
+# ----------------------------------------------------------------------
+
+def _batches(decoded, batch_size: int):
+    batch = []
+    for item in decoded:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _write_result(writer: ResultWriter, path: str, result: dict) -> dict:
+    record = _record(path, result, None)
+    if result["segmentation_mask"] is not None:
+        writer.write_mask(record, result["segmentation_mask"])
+    return record
+
+
+def _process(contexts: List, timings: dict) -> List[Tuple[Optional[dict], Optional[str]]]:
+    """
+    full_pipeline_batch as (result, error) pairs. If the batch raises, its
+    images are rerun one at a time, so only the failing ones get an error.
+    """
+    try:
+        results = full_pipeline_batch(contexts, with_overlay=False, timings=timings)
+        return [(result, None) for result in results]
+    except Exception as exc:  # report, don't stop the run
+        if len(contexts) == 1:
+            return [(None, f"{type(exc).__name__}: {exc}")]
+    return [outcome for ctx in contexts for outcome in _process([ctx], timings)]
+
+
+def _run_batched(decoded, writer: ResultWriter, batch_size: int, timings: dict):
+    """
+    Run full_pipeline_batch batch by batch; yields (records, errors)
+    written per batch.
+    """
+    for batch in _batches(decoded, batch_size):
+        records = []
+        ok = []
+        for path, ctx, error, decode_s in batch:
+            timings["decode"] = timings.get("decode", 0.0) + decode_s
+            records.append(_record(path, None, error))
+            if ctx is not None:
+                ok.append((len(records) - 1, ctx))
+
+        if ok:
+            outcomes = _process([ctx for _, ctx in ok], timings)
+            for (idx, _), (result, error) in zip(ok, outcomes):
+                path = records[idx]["path"]
+                records[idx] = _record(path, None, error) if error else _write_result(writer, path, result)
+
+        writer.write_batch(records)
+        yield len(records), sum(record["error"] is not None for record in records)
+
+
+def _run_streaming(decoded, writer: ResultWriter, batch_size: int, depth: int, timings: dict):
+    """
+    Push decoded images through a StreamingPipeline (overlapping stages),
+    writing records in input order; yields (records, errors) written per
+    group of batch_size records.
+    """
+    from backend.streaming import StreamingPipeline
+
+    # (path, error) in input order; the stream only sees decoded images
+    pending = deque()
+
+    def contexts():
+        for path, ctx, error, decode_s in decoded:
+            timings["decode"] = timings.get("decode", 0.0) + decode_s
+            pending.append((path, error))
+            if ctx is not None:
+                yield ctx
+
+    records = []
+    n_errors = 0
+
+    def take_errors():
+        nonlocal n_errors
+        while pending and pending[0][1] is not None:
+            path, error = pending.popleft()
+            records.append(_record(path, None, error))
+            n_errors += 1
+
+    # Decoding already runs in the prefetch pool; one stream thread hands
+    # the contexts on
+    stream = StreamingPipeline(batch_size=batch_size, queue_depth=depth, decode_workers=1)
+    for result in stream.imap(contexts()):
+        take_errors()
+        path, _ = pending.popleft()
+        records.append(_write_result(writer, path, result))
+        if len(records) >= batch_size:
+            writer.write_batch(records)
+            yield len(records), n_errors
+            records, n_errors = [], 0
+    take_errors()
+    writer.write_batch(records)
+    yield len(records), n_errors
+
+    for stage, counters in stream.stats().items():
+        if stage != "wall_seconds":
+            timings[f"{stage}_occupancy"] = counters["occupancy"]
+
+
+def run_batch(
+    paths: Iterable[str],
+    out_path: str,
+    batch_size: int = 16,
+    workers: int = 4,
+    prefetch: int = 64,
+    log_every: float = 5.0,
+    stream: bool = False,
+) -> Dict[str, float]:
+    """
+    Run the pipeline over `paths` and write results to `out_path`.
+
+    With stream=True, detection and classification + segmentation run as
+    overlapping stages (see backend.streaming) instead of batch by batch.
+
+    Returns
+    -------
+    stats : dict
+        "images", "errors", "seconds", "images_per_sec" and per-stage
+        wall seconds (decode time is summed over decoder threads). Stream
+        mode reports "<stage>_occupancy" fractions instead of model stage
+        times.
+    """
+    writer = ResultWriter(out_path)
+    timings: Dict[str, float] = {}
+    n_images = n_errors = 0
+    start = last_log = time.perf_counter()
+
+    try:
+        depth = max(prefetch, batch_size)
+        decoded = prefetch_decoded(paths, workers=workers, depth=depth)
+        if stream:
+            runner = _run_streaming(decoded, writer, batch_size, depth, timings)
+        else:
+            runner = _run_batched(decoded, writer, batch_size, timings)
+
+        for records, errors in runner:
+            n_images += records
+            n_errors += errors
+
+            now = time.perf_counter()
+            if now - last_log >= log_every:
+                last_log = now
+                rate = n_images / (now - start)
+                print(f"[batch] {n_images} images, {rate:.1f} img/s", file=sys.stderr, flush=True)
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        "images": n_images,
+        "errors": n_errors,
+        "seconds": elapsed,
+        "images_per_sec": n_images / elapsed if elapsed > 0 else 0.0,
+    }
+    stats.update(timings)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the diagnosis pipeline over many images.")
+    parser.add_argument("root", nargs="?", help="Directory tree of PNG/JPG images")
+    parser.add_argument("--file-list", help="Text file with one image path per line ('-' for stdin)")
+    parser.add_argument("--out", required=True, help="Output .jsonl or .parquet")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=4, help="Decoder threads")
+    parser.add_argument("--prefetch", type=int, default=64, help="Images decoded ahead of inference")
+    parser.add_argument("--log-every", type=float, default=5.0, help="Seconds between progress lines")
+    parser.add_argument(
+        "--stream", action="store_true",
+        help="Overlap detection and classification + segmentation (pipelined stages)",
+    )
+    parser.add_argument("--metrics", metavar="FILE", help="Write stage histograms (Prometheus text) here")
+    args = parser.parse_args()
+
+    if bool(args.root) == bool(args.file_list):
+        parser.error("give exactly one of ROOT or --file-list")
+
+    if args.metrics:
+        metrics.enable()
+
+    paths = iter_image_paths(args.root) if args.root else iter_file_list(args.file_list)
+    stats = run_batch(
+        paths,
+        args.out,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        prefetch=args.prefetch,
+        log_every=args.log_every,
+        stream=args.stream,
+    )
+
+    n = max(stats["images"] - stats["errors"], 1)
+    print(
+        f"Done: {stats['images']} images ({stats['errors']} errors) in "
+        f"{stats['seconds']:.1f}s, {stats['images_per_sec']:.1f} img/s"
+    )
+    for stage in ("decode", "preprocess", "detection", "classification", "segmentation"):
+        if stage in stats:
+            print(f"  {stage:15s} {stats[stage]:8.2f}s  {stats[stage] / n * 1000:8.2f} ms/img")
+    for stage in ("decode", "detection", "classify_segment"):
+        if f"{stage}_occupancy" in stats:
+            print(f"  {stage:17s} occupancy {stats[f'{stage}_occupancy']:6.1%}")
+    if args.metrics:
+        with open(args.metrics, "w") as f:
+            f.write(metrics.render())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Memory-mapped PyTorch checkpoints, shared between worker processes.
+
+torch.load copies every weight into private process memory, so N worker
+processes hold N copies of the UNet. A checkpoint converted to the
+safetensors layout (JSON header + raw little-endian tensor data) is
+instead mapped copy-on-write and wrapped as tensors without a copy
+(load_state_dict(assign=True)): the weight pages come from the page cache
+and every process mapping the same file shares them.
+
+    python -m backend.checkpoints        # writes <checkpoint>.safetensors next to each .pth
+
+The files open with the safetensors library too, but it is not needed
+here. A converted file records the size and mtime of the checkpoint it
+came from and is ignored (with a warning) once the .pth changes. Set
+BTD_MMAP_WEIGHTS=0 to always use torch.load.
+
+Pages stay shared only while the weights are not rewritten: on CUDA, in
+channels_last mode (backend.torch_execution converts the conv weights) and
+for compiled models (backend.compiled_models holds fused copies) each
+process ends up with private weights as before.
+"""
+import argparse
+import json
+import os
+import time
+import warnings
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+_enabled = os.environ.get("BTD_MMAP_WEIGHTS", "1") != "0"
+
+_ALIGN = 64  # bytes
+
+# safetensors dtype tags -> numpy dtypes used to map the data
+# (bfloat16 is mapped as uint16 and reinterpreted by torch)
+_NUMPY_DTYPES = {
+    "F64": np.float64,
+    "F32": np.float32,
+    "F16": np.float16,
+    "BF16": np.uint16,
+    "I64": np.int64,
+    "I32": np.int32,
+    "I16": np.int16,
+    "I8": np.int8,
+    "U8": np.uint8,
+    "BOOL": np.bool_,
+}
+
+
+def _torch_tags():
+    import torch
+
+    return {
+        torch.float64: "F64",
+        torch.float32: "F32",
+        torch.float16: "F16",
+        torch.bfloat16: "BF16",
+        torch.int64: "I64",
+        torch.int32: "I32",
+        torch.int16: "I16",
+        torch.int8: "I8",
+        torch.uint8: "U8",
+        torch.bool: "BOOL",
+    }
+
+
+def mmap_path(checkpoint: str) -> str:
+    """
+    Where the converted copy of a checkpoint lives.
+    """
+    return os.path.splitext(checkpoint)[0] + ".safetensors"
+
+
+# ----------------------------------------------------------------------
+# safetensors layout
+# ----------------------------------------------------------------------
+
+def save(state: Dict[str, object], path: str, metadata: Optional[Dict[str, str]] = None) -> None:
+    """
+    Write a dict of CPU tensors in the safetensors layout.
+
+    The data section starts 64-byte aligned, followed by every tensor
+    whose size is a multiple of 64 bytes (typically all weights), so they
+    stay aligned for the CPU kernels (oneDNN copies misaligned weights
+    on every call); the rest follow, largest element size first.
+    """
+    import torch
+
+    tags = _torch_tags()
+    def order(item):
+        name, t = item
+        return t.numel() * t.element_size() % _ALIGN != 0, -t.element_size(), name
+
+    tensors = sorted(((name, t.detach().cpu().contiguous()) for name, t in state.items()), key=order)
+    header: Dict[str, object] = {"__metadata__": dict(metadata or {})}
+    offset = 0
+    for name, t in tensors:
+        nbytes = t.numel() * t.element_size()
+        header[name] = {"dtype": tags[t.dtype], "shape": list(t.shape), "data_offsets": [offset, offset + nbytes]}
+        offset += nbytes
+
+    raw = json.dumps(header, separators=(",", ":")).encode()
+    raw += b" " * (-(8 + len(raw)) % _ALIGN)
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(len(raw).to_bytes(8, "little"))
+        f.write(raw)
+        for _, t in tensors:
+            if t.dtype == torch.bfloat16:
+                t = t.view(torch.int16)
+            f.write(t.numpy().tobytes())
+    os.replace(tmp, path)
+
+
+def read_header(path: str) -> Tuple[dict, int]:
+    """
+    The JSON header of a safetensors file and the offset of its data.
+    """
+    with open(path, "rb") as f:
+        size = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(size))
+    return header, 8 + size
+
+
+def load_mmap(path: str) -> Dict[str, object]:
+    """
+    Tensors of a safetensors file, backed by a copy-on-write memory map of
+    it (nothing is read until a page is touched).
+    """
+    import torch
+
+    header, start = read_header(path)
+    header.pop("__metadata__", None)
+    data = np.memmap(path, dtype=np.uint8, mode="c", offset=start) if header else None
+
+    state = {}
+    for name, info in header.items():
+        begin, end = info["data_offsets"]
+        array = data[begin:end].view(_NUMPY_DTYPES[info["dtype"]]).reshape(info["shape"])
+        tensor = torch.from_numpy(array)
+        if info["dtype"] == "BF16":
+            tensor = tensor.view(torch.bfloat16)
+        state[name] = tensor
+    return state
+
+
+# ----------------------------------------------------------------------
+# Conversion / loading
+# ----------------------------------------------------------------------
+
+def _source_stamp(checkpoint: str) -> Dict[str, str]:
+    st = os.stat(checkpoint)
+    return {"source_size": str(st.st_size), "source_mtime_ns": str(st.st_mtime_ns)}
+
+
+def convert(checkpoint: str) -> str:
+    """
+    Write the memory-mappable copy of a torch.load checkpoint (a state
+    dict, or a dict with one under "state_dict").
+    """
+    import torch
+
+    state = torch.load(checkpoint, map_location="cpu")
+    if isinstance(state, dict) and "state_dict" in state:
+        state = state["state_dict"]
+
+    path = mmap_path(checkpoint)
+    meta = {"source": os.path.basename(checkpoint), **_source_stamp(checkpoint)}
+    save(state, path, meta)
+    return path
+
+
+def _is_current(path: str, checkpoint: str) -> bool:
+    if not os.path.exists(checkpoint):
+        # Deployed without the original checkpoint
+        return True
+    meta = read_header(path)[0].get("__metadata__", {})
+    stamp = _source_stamp(checkpoint)
+    return all(meta.get(key) == value for key, value in stamp.items())
+
+
+def load_state_dict(checkpoint: str, device="cpu") -> Tuple[Dict[str, object], bool]:
+    """
+    The state dict of a checkpoint, memory-mapped from its converted copy
+    when there is a current one and the model runs on CPU, otherwise read
+    with torch.load. A {"state_dict": ...} wrapper is removed.
+
+    Returns
+    -------
+    state : dict
+        Parameter / buffer name -> tensor.
+    mapped : bool
+        Whether the tensors are memory-mapped; pass it as
+        model.load_state_dict(state, assign=mapped) so the model keeps
+        them instead of copying into its own parameters.
+    """
+    import torch
+
+    path = mmap_path(checkpoint)
+    if _enabled and torch.device(device).type == "cpu" and os.path.exists(path):
+        if _is_current(path, checkpoint):
+            return load_mmap(path), True
+        warnings.warn(
+            f"{path} is older than {checkpoint}; loading the checkpoint instead "
+            f"(re-run python -m backend.checkpoints)"
+        )
+
+    state = torch.load(checkpoint, map_location=device)
+    if isinstance(state, dict) and "state_dict" in state:
+        state = state["state_dict"]
+    return state, False
+
+
+def _checkpoints() -> Dict[str, str]:
+    from backend import classification_inference, segmentation_inference
+
+    return {
+        "classification": classification_inference.MODEL_PATH,
+        "segmentation": segmentation_inference.MODEL_PATH,
+    }
+
+
+def main():
+    checkpoints = _checkpoints()
+    parser = argparse.ArgumentParser(description="Convert the PyTorch checkpoints for memory-mapped loading.")
+    parser.add_argument("--models", nargs="+", choices=list(checkpoints), default=list(checkpoints))
+    args = parser.parse_args()
+
+    for stage in args.models:
+        start = time.perf_counter()
+        path = convert(checkpoints[stage])
+        size = os.path.getsize(path) / (1024 * 1024)
+        print(f"{stage:15s} -> {path} ({size:.1f} MB, {time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,84 +1,14 @@
 import os
-from typing import Dict, Tuple
-import cv2
+from typing import Dict, List, Optional, Sequence, Tuple, Union
 import numpy as np
-import torch
-import torch.nn as nn
-
-# ------------- Model definition (must match training script) -------------
-
-
-class SEBlock(nn.Module):
-    def __init__(self, channels: int, reduction: int = 16):
-        super().__init__()
-        self.fc1 = nn.Linear(channels, channels // reduction)
-        self.fc2 = nn.Linear(channels // reduction, channels)
-
-    def forward(self, x: torch.Tensor) -> torch.Tensor:
-        b, c, _, _ = x.size()
-        y = x.mean((2, 3))
-        y = torch.relu(self.fc1(y))
-        y = torch.sigmoid(self.fc2(y))
-        y = y.view(b, c, 1, 1)
-        return x * y
-
-
-class ResidualBlock(nn.Module):
-    def __init__(self, in_channels: int, out_channels: int, stride: int = 1):
-        super().__init__()
-        self.conv1 = nn.Conv2d(in_channels, out_channels, 3, stride, 1, bias=False)
-        self.bn1 = nn.BatchNorm2d(out_channels)
-        self.conv2 = nn.Conv2d(out_channels, out_channels, 3, 1, 1, bias=False)
-        self.bn2 = nn.BatchNorm2d(out_channels)
-        self.se = SEBlock(out_channels)
-
-        self.shortcut = nn.Sequential()
-        if stride != 1 or in_channels != out_channels:
-            self.shortcut = nn.Conv2d(in_channels, out_channels, 1, stride, bias=False)
-
-    def forward(self, x: torch.Tensor) -> torch.Tensor:
-        out = torch.relu(self.bn1(self.conv1(x)))
-        out = self.bn2(self.conv2(out))
-        out = self.se(out)
-        out += self.shortcut(x)
-        return torch.relu(out)
-
-
-class SmallResNetSE(nn.Module):
-    def __init__(self, num_classes: int = 3):
-        # 3 classes: glioma, meningioma, pituitary
-        super().__init__()
-        # NOTE: in_channels=1 to match the trained checkpoint
-        self.stem = nn.Sequential(
-            nn.Conv2d(1, 32, 3, stride=2, padding=1, bias=False),
-            nn.BatchNorm2d(32),
-            nn.ReLU(),
-            nn.MaxPool2d(3, stride=2, padding=1),
-        )
-        self.layer1 = self._make_layer(32, 64, blocks=2, stride=1)
-        self.layer2 = self._make_layer(64, 128, blocks=2, stride=2)
-        self.layer3 = self._make_layer(128, 256, blocks=2, stride=2)
-        self.pool = nn.AdaptiveAvgPool2d(1)
-        self.fc = nn.Sequential(
-            nn.Dropout(0.5),
-            nn.Linear(256, num_classes),
-        )
-
-    def _make_layer(self, in_c: int, out_c: int, blocks: int, stride: int):
-        layers = [ResidualBlock(in_c, out_c, stride)]
-        for _ in range(1, blocks):
-            layers.append(ResidualBlock(out_c, out_c))
-        return nn.Sequential(*layers)
-
-    def forward(self, x: torch.Tensor) -> torch.Tensor:
-        x = self.stem(x)
-        x = self.layer1(x)
-        x = self.layer2(x)
-        x = self.layer3(x)
-        x = self.pool(x).flatten(1)
-        x = self.fc(x)
-        return x
 
+from backend import checkpoints, compiled_models, onnx_runtime, quantization, torch_execution
+from backend.model_registry import registry
+from utils.preprocessing import (
+    PreprocessContext,
+    ResolutionPolicy,
+    as_preprocess_context,
+)
 
 # ------------------------- Inference utilities ---------------------------
 
@@ -89,31 +19,107 @@ CLASS_NAMES = ["glioma", "meningioma", "pituitary"]
 # MODEL_PATH = os.path.join("../models", "classification", "best_model_unified.pth")
 MODEL_PATH = os.path.join("models", "classification", "best_model_unified.pth")
 
+# Input resolution for the classifier: "native" (default), "max_side:<N>"
+# or "fixed:<N>". Bounding it caps worst-case latency and memory on large
+# uploads; see benchmarks/classification_drift.py for the effect on
+# class probabilities.
+INPUT_RESOLUTION = ResolutionPolicy.parse(os.environ.get("BTD_CLS_RESOLUTION", "native"))
 
-_device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-_model = SmallResNetSE(num_classes=len(CLASS_NAMES))
 
-# Load weights
-# state = torch.load(MODEL_PATH, map_location=_device)
-state = torch.load(str(MODEL_PATH), map_location=_device)
-if isinstance(state, dict) and "state_dict" in state:
-    _model.load_state_dict(state["state_dict"])
-else:
-    _model.load_state_dict(state)
+def _load_eager_model():
+    # PyTorch is imported here so the ONNX backend never loads it
+    import torch
+    from backend.classification_model import SmallResNetSE
 
-_model.to(_device)
-_model.eval()
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model = SmallResNetSE(num_classes=len(CLASS_NAMES))
 
+    # Load weights (memory-mapped when converted, see backend.checkpoints)
+    # state = torch.load(MODEL_PATH, map_location=device)
+    state, mapped = checkpoints.load_state_dict(str(MODEL_PATH), device)
+    model.load_state_dict(state, assign=mapped)
 
-def run_classification(image: np.ndarray) -> Tuple[str, Dict[str, float]]:
+    model.to(device)
+    model.eval()
+    return model
+
+
+def _load_model():
+    # Fused, frozen build from backend.compiled_models when one is cached
+    # for this checkpoint, otherwise the eager model
+    model = compiled_models.load_cached("classification", MODEL_PATH)
+    return model if model is not None else _load_eager_model()
+
+
+# Loaded on first use, see backend.model_registry
+registry.register("classification", _load_model)
+
+
+def __getattr__(name):
+    # The model classes moved to backend.classification_model; keep
+    # `from backend.classification_inference import SmallResNetSE` working
+    if name in ("SEBlock", "ResidualBlock", "SmallResNetSE"):
+        from backend import classification_model
+
+        return getattr(classification_model, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _to_prediction(probs: np.ndarray) -> Tuple[str, Dict[str, float]]:
+    pred_idx = int(np.argmax(probs))
+    pred_label = CLASS_NAMES[pred_idx]
+    probs_dict = {cls: float(p) for cls, p in zip(CLASS_NAMES, probs)}
+    return pred_label, probs_dict
+
+
+def classify_batch(batch: np.ndarray) -> np.ndarray:
+    """
+    Run one forward pass over a stacked batch.
+
+    Parameters
+    ----------
+    batch : np.ndarray
+        Shape (N, 1, H, W), float32, values in [0, 1].
+
+    Returns
+    -------
+    probs : np.ndarray
+        Shape (N, len(CLASS_NAMES)), softmax probabilities.
+    """
+    if onnx_runtime.get_backend() == "onnx":
+        logits = registry.get("classification_onnx").predict(batch)
+        e = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return e / e.sum(axis=1, keepdims=True)
+
+    import torch
+
+    # Float model, or its INT8 version (CPU only), see backend.quantization
+    name = quantization.model_name("classification")
+    model = registry.get(name)
+    device = next(model.parameters(), torch.empty(0)).device
+    tensor = torch.from_numpy(batch).to(device)
+
+    with torch.no_grad():
+        logits = torch_execution.forward(model, tensor, quantized=name != "classification")
+        probs = torch.softmax(logits, dim=1).cpu().numpy()
+
+    return probs
+
+
+def run_classification(
+    image: Union[np.ndarray, PreprocessContext],
+    resolution: Optional[ResolutionPolicy] = None,
+) -> Tuple[str, Dict[str, float]]:
     """
     Run classification on a single image.
 
     Parameters
     ----------
-    image : np.ndarray
+    image : np.ndarray or PreprocessContext
         Shape (H, W, 3) RGB or (H, W) grayscale.
         If values are 0–255 they are scaled to [0, 1].
+    resolution : ResolutionPolicy, optional
+        Input resolution policy, defaults to INPUT_RESOLUTION.
 
     Returns
     -------
@@ -122,28 +128,50 @@ def run_classification(image: np.ndarray) -> Tuple[str, Dict[str, float]]:
     probs_dict : dict
         Mapping from class name to probability.
     """
-    # Convert to grayscale because the model is 1-channel
-    if image.ndim == 3 and image.shape[2] == 3:
-        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-    else:
-        gray = image
+    x = as_preprocess_context(image).classification_input(resolution or INPUT_RESOLUTION)
+    probs = classify_batch(x)[0]
+    return _to_prediction(probs)
 
-    x = gray.astype("float32")
-    if x.max() > 1.0:
-        x = x / 255.0
 
-    # (H, W) -> (1, 1, H, W)
-    x = np.expand_dims(x, axis=0)   # (1, H, W)
-    x = np.expand_dims(x, axis=0)   # (1, 1, H, W)
+def run_classification_batch(
+    images: Sequence[Union[np.ndarray, PreprocessContext]],
+    resolution: Optional[ResolutionPolicy] = None,
+) -> List[Tuple[str, Dict[str, float]]]:
+    """
+    Run classification on several images with as few forward passes as
+    possible.
 
-    tensor = torch.from_numpy(x).to(_device)
+    Inputs may differ in size (always under the "native" policy), so they
+    are grouped by (H, W) and each group is stacked into a single batch.
+    With a "fixed" policy the whole list is one forward pass.
 
-    with torch.no_grad():
-        logits = _model(tensor)
-        probs = torch.softmax(logits, dim=1)[0].cpu().numpy()
-
-    pred_idx = int(np.argmax(probs))
-    pred_label = CLASS_NAMES[pred_idx]
-    probs_dict = {cls: float(p) for cls, p in zip(CLASS_NAMES, probs)}
+    Parameters
+    ----------
+    images : sequence of np.ndarray or PreprocessContext
+        Each (H, W, 3) RGB or (H, W) grayscale, as for run_classification.
+    resolution : ResolutionPolicy, optional
+        Input resolution policy, defaults to INPUT_RESOLUTION.
 
-    return pred_label, probs_dict
+    Returns
+    -------
+    predictions : list of (pred_label, probs_dict)
+        One entry per input image, in input order.
+    """
+    resolution = resolution or INPUT_RESOLUTION
+    inputs = [
+        as_preprocess_context(image).classification_input(resolution)
+        for image in images
+    ]
+
+    groups: Dict[Tuple[int, ...], List[int]] = {}
+    for i, x in enumerate(inputs):
+        groups.setdefault(x.shape, []).append(i)
+
+    results: List[Tuple[str, Dict[str, float]]] = [None] * len(inputs)
+    for indices in groups.values():
+        batch = np.concatenate([inputs[i] for i in indices], axis=0)
+        probs = classify_batch(batch)
+        for i, p in zip(indices, probs):
+            results[i] = _to_prediction(p)
+
+    return results
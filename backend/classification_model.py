@@ -0,0 +1,77 @@
+import torch
+import torch.nn as nn
+
+
+# ------------- Model definition (must match training script) -------------
+
+
+class SEBlock(nn.Module):
+    def __init__(self, channels: int, reduction: int = 16):
+        super().__init__()
+        self.fc1 = nn.Linear(channels, channels // reduction)
+        self.fc2 = nn.Linear(channels // reduction, channels)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        b, c, _, _ = x.size()
+        y = x.mean((2, 3))
+        y = torch.relu(self.fc1(y))
+        y = torch.sigmoid(self.fc2(y))
+        y = y.view(b, c, 1, 1)
+        return x * y
+
+
+class ResidualBlock(nn.Module):
+    def __init__(self, in_channels: int, out_channels: int, stride: int = 1):
+        super().__init__()
+        self.conv1 = nn.Conv2d(in_channels, out_channels, 3, stride, 1, bias=False)
+        self.bn1 = nn.BatchNorm2d(out_channels)
+        self.conv2 = nn.Conv2d(out_channels, out_channels, 3, 1, 1, bias=False)
+        self.bn2 = nn.BatchNorm2d(out_channels)
+        self.se = SEBlock(out_channels)
+
+        self.shortcut = nn.Sequential()
+        if stride != 1 or in_channels != out_channels:
+            self.shortcut = nn.Conv2d(in_channels, out_channels, 1, stride, bias=False)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        out = torch.relu(self.bn1(self.conv1(x)))
+        out = self.bn2(self.conv2(out))
+        out = self.se(out)
+        out += self.shortcut(x)
+        return torch.relu(out)
+
+
+class SmallResNetSE(nn.Module):
+    def __init__(self, num_classes: int = 3):
+        # 3 classes: glioma, meningioma, pituitary
+        super().__init__()
+        # NOTE: in_channels=1 to match the trained checkpoint
+        self.stem = nn.Sequential(
+            nn.Conv2d(1, 32, 3, stride=2, padding=1, bias=False),
+            nn.BatchNorm2d(32),
+            nn.ReLU(),
+            nn.MaxPool2d(3, stride=2, padding=1),
+        )
+        self.layer1 = self._make_layer(32, 64, blocks=2, stride=1)
+        self.layer2 = self._make_layer(64, 128, blocks=2, stride=2)
+        self.layer3 = self._make_layer(128, 256, blocks=2, stride=2)
+        self.pool = nn.AdaptiveAvgPool2d(1)
+        self.fc = nn.Sequential(
+            nn.Dropout(0.5),
+            nn.Linear(256, num_classes),
+        )
+
+    def _make_layer(self, in_c: int, out_c: int, blocks: int, stride: int):
+        layers = [ResidualBlock(in_c, out_c, stride)]
+        for _ in range(1, blocks):
+            layers.append(ResidualBlock(out_c, out_c))
+        return nn.Sequential(*layers)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        x = self.stem(x)
+        x = self.layer1(x)
+        x = self.layer2(x)
+        x = self.layer3(x)
+        x = self.pool(x).flatten(1)
+        x = self.fc(x)
+        return x
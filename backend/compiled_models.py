@@ -0,0 +1,144 @@
+"""
+Inference-optimized builds of the PyTorch models, cached on disk.
+
+Both SmallResNetSE and the UNet are chains of Conv -> BatchNorm -> ReLU.
+Compiling folds every BatchNorm into the weights and bias of the conv in
+front of it (torch.fx fusion), traces the result and freezes it
+(parameters become graph constants), then saves the TorchScript file to
+the cache directory:
+
+    python -m backend.compiled_models
+
+Artifacts are keyed by the checkpoint's size and modification time, the
+PyTorch version and the memory layout (channels_last, see
+backend.torch_execution), so replacing a checkpoint or upgrading torch
+simply misses the cache (as does copying the checkpoint elsewhere: build
+the artifacts where they are deployed).
+The inference modules load a matching artifact automatically (CPU only)
+and fall back to the eager model otherwise. Set BTD_COMPILED=0 to
+ignore the cache, BTD_COMPILED_DIR to move it (default models/compiled).
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+from backend import torch_execution
+
+COMPILED_DIR = os.environ.get("BTD_COMPILED_DIR", os.path.join("models", "compiled"))
+STAGES = ("classification", "segmentation")
+
+_enabled = os.environ.get("BTD_COMPILED", "1") != "0"
+
+
+def _checkpoint_stamp(path: str) -> str:
+    # Size and mtime, as for the result cache and memory-mapped copies:
+    # hashing the contents would read the whole checkpoint on every load,
+    # the startup I/O compiling is meant to save
+    st = os.stat(path)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def artifact_path(stage: str, checkpoint: str) -> str:
+    import torch
+
+    layout = "channels_last" if torch_execution.channels_last() else "contiguous"
+    key = hashlib.blake2b(
+        f"{stage}:{_checkpoint_stamp(checkpoint)}:{torch.__version__}:{layout}".encode(), digest_size=8
+    ).hexdigest()
+    return os.path.join(COMPILED_DIR, f"{stage}-{key}.pt")
+
+
+# ----------------------------------------------------------------------
+# Compile / load
+# ----------------------------------------------------------------------
+
+def compile_model(model, image_size: int = 224, channels_last: bool = False):
+    """
+    Fuse Conv+BN pairs, trace and freeze an eager model (float32, CPU).
+
+    Height and width stay dynamic: the trace contains no shape-dependent
+    Python logic for either model. With channels_last the frozen weights
+    are stored in that layout.
+    """
+    import torch
+    from torch.fx.experimental.optimization import fuse
+
+    model = model.cpu().eval()
+    example = torch.zeros(1, 1, image_size, image_size)
+    with torch.no_grad():
+        fused = fuse(model)
+        if channels_last:
+            fused = fused.to(memory_format=torch.channels_last)
+            example = example.contiguous(memory_format=torch.channels_last)
+        traced = torch.jit.trace(fused, (example,))
+    return torch.jit.freeze(traced)
+
+
+def _eager_loader(stage: str):
+    from backend import classification_inference, segmentation_inference
+
+    module = classification_inference if stage == "classification" else segmentation_inference
+    return module._load_eager_model, module.MODEL_PATH
+
+
+def build(stage: str) -> str:
+    """
+    Compile one model from its checkpoint for the current memory layout
+    and write the artifact. Other artifacts of the same stage are removed.
+    """
+    import torch
+
+    load_eager, checkpoint = _eager_loader(stage)
+    compiled = compile_model(load_eager(), channels_last=torch_execution.channels_last())
+
+    os.makedirs(COMPILED_DIR, exist_ok=True)
+    path = artifact_path(stage, checkpoint)
+    meta = {
+        "stage": stage,
+        "checkpoint": checkpoint,
+        "torch": torch.__version__,
+        "channels_last": torch_execution.channels_last(),
+    }
+    tmp = path + ".tmp"
+    torch.jit.save(compiled, tmp, _extra_files={"compiled.json": json.dumps(meta)})
+    os.replace(tmp, path)
+
+    for old in glob.glob(os.path.join(COMPILED_DIR, f"{stage}-*.pt")):
+        if old != path:
+            os.remove(old)
+    return path
+
+
+def load_cached(stage: str, checkpoint: str):
+    """
+    The compiled artifact for this checkpoint, or None when there is none,
+    the cache is disabled, or the models run on GPU.
+    """
+    if not _enabled or not os.path.isdir(COMPILED_DIR):
+        return None
+
+    import torch
+
+    if torch.cuda.is_available():
+        return None
+    path = artifact_path(stage, checkpoint)
+    if not os.path.exists(path):
+        return None
+    return torch.jit.load(path, map_location="cpu")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the PyTorch models into the artifact cache.")
+    parser.add_argument("--models", nargs="+", choices=STAGES, default=list(STAGES))
+    args = parser.parse_args()
+
+    for stage in args.models:
+        start = time.perf_counter()
+        path = build(stage)
+        print(f"{stage:15s} -> {path} ({time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,36 @@
 import os
+from typing import Sequence
+
 import numpy as np
-import tensorflow as tf
+
+from backend import onnx_runtime
+from backend.detection_engine import DetectionEngine
+from backend.model_registry import registry
 
 # Adjusted to use your actual file name
 # MODEL_PATH = os.path.join("../models", "detection", "final_model.keras")
 # detection_inference.py
 MODEL_PATH = os.path.join("models", "detection", "final_model.keras")
 
+IMAGE_SIZE = 224  # detector input is (N, 224, 224, 1)
 
-# Load the Keras detection model once at import time
-_det_model = tf.keras.models.load_model(MODEL_PATH)
 
+def _load_model() -> DetectionEngine:
+    # TensorFlow is imported here so that importing this module (or
+    # backend.pipeline) does not pay for it until detection is needed.
+    import tensorflow as tf
 
-def run_detection(image: np.ndarray) -> float:
-    """
-    Run tumor detection on a single image.
+    model = tf.keras.models.load_model(MODEL_PATH)
+    return DetectionEngine(model, image_size=IMAGE_SIZE)
 
-    Parameters
-    ----------
-    image : np.ndarray
-        Expected shape (H, W) or (H, W, 1), grayscale, values in [0, 255] or [0, 1].
-        Our preprocessing will ensure it is 224x224 and grayscale.
 
-    Returns
-    -------
-    prob_tumor : float
-        Probability that tumor is present (0.0 – 1.0).
+# Loaded on first use, see backend.model_registry
+registry.register("detection", _load_model)
+
+
+def _to_input(image: np.ndarray) -> np.ndarray:
+    """
+    Turn a grayscale image into a float32 (N, H, W, 1) batch scaled to [0, 1].
     """
     x = image.astype("float32")
 
@@ -59,9 +64,68 @@ def run_detection(image: np.ndarray) -> float:
     else:
         raise ValueError(f"Unexpected input shape for detection: {x.shape}")
 
+    return x
+
+
+def detect_batch(batch: np.ndarray) -> np.ndarray:
+    """
+    Run one forward pass over a stacked batch.
+
+    Parameters
+    ----------
+    batch : np.ndarray
+        Shape (N, 224, 224, 1), float32, values in [0, 1].
+
+    Returns
+    -------
+    probs : np.ndarray
+        Shape (N,), tumor probability per image.
+    """
+    if onnx_runtime.get_backend() == "onnx":
+        preds = registry.get("detection_onnx").predict(batch)
+    else:
+        # Traced fixed-signature forward pass, see backend.detection_engine
+        preds = registry.get("detection").predict(batch)
+
+    # Common case: model outputs shape (N, 1) with sigmoid
+    return np.asarray(preds, dtype="float32").reshape(len(batch), -1)[:, 0]
+
+
+def run_detection(image: np.ndarray) -> float:
+    """
+    Run tumor detection on a single image.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        Expected shape (H, W) or (H, W, 1), grayscale, values in [0, 255] or [0, 1].
+        Our preprocessing will ensure it is 224x224 and grayscale.
+
+    Returns
+    -------
+    prob_tumor : float
+        Probability that tumor is present (0.0 – 1.0).
+    """
+    x = _to_input(image)
+
     # Forward pass
-    preds = _det_model.predict(x)
+    return float(detect_batch(x)[0])
+
+
+def run_detection_batch(images: Sequence[np.ndarray]) -> np.ndarray:
+    """
+    Run tumor detection on several images with a single model call.
+
+    Parameters
+    ----------
+    images : sequence of np.ndarray
+        Each accepted by run_detection, e.g. the (1, 224, 224, 1) output
+        of prepare_for_detection.
 
-    # Common case: model outputs shape (1, 1) with sigmoid
-    prob_tumor = float(preds[0][0])
-    return prob_tumor
+    Returns
+    -------
+    probs : np.ndarray
+        Shape (N,), tumor probability per image, in input order.
+    """
+    batch = np.concatenate([_to_input(image) for image in images], axis=0)
+    return detect_batch(batch)
@@ -0,0 +1,238 @@
+"""
+In-process pipeline metrics: per-stage latency histograms and counters,
+exported in the Prometheus text format.
+
+Off by default; enable() or BTD_METRICS=1 turns it on. While off, the
+pipeline's stage timers do not even read the clock. While on:
+
+- every stage call (decode, preprocess, detection, classification,
+  segmentation, overlay) is recorded in a wall-time histogram, with CPU
+  seconds and images processed as counters,
+- every pipeline result carries result["timings"] =
+  {stage: {"wall_seconds", "cpu_seconds"}} for the stages it went
+  through (batched calls report each image's share of the batch),
+- render() returns everything, plus per-model load state from the model
+  registry, as Prometheus text; backend.server serves it at GET /metrics.
+
+CPU seconds are process-wide (they include the framework thread pools),
+so with several requests in flight they also include the others' work;
+compare wall times under load.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+STAGES = ("decode", "preprocess", "detection", "classification", "segmentation", "overlay")
+
+# Seconds; the Prometheus client defaults
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_enabled = os.environ.get("BTD_METRICS", "0") == "1"
+_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable() -> None:
+    global _enabled
+    _enabled = True
+
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+
+
+# ----------------------------------------------------------------------
+# Collectors
+# ----------------------------------------------------------------------
+
+class Histogram:
+    """
+    Fixed-bucket histogram (not thread-safe on its own, see _lock).
+    """
+
+    def __init__(self, buckets: Iterable[float] = BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[int]:
+        total, out = 0, []
+        for n in self.counts:
+            total += n
+            out.append(total)
+        return out
+
+
+_stage_wall: Dict[str, Histogram] = {}
+_stage_cpu: Dict[str, float] = {}
+_stage_items: Dict[str, int] = {}
+_results: Dict[str, int] = {}
+
+
+def reset() -> None:
+    """
+    Drop everything recorded so far.
+    """
+    with _lock:
+        _stage_wall.clear()
+        _stage_cpu.clear()
+        _stage_items.clear()
+        _results.clear()
+
+
+def observe_stage(stage: str, wall: float, cpu: float, items: int = 1) -> None:
+    """
+    Record one call of a stage that processed `items` images.
+    """
+    with _lock:
+        hist = _stage_wall.get(stage)
+        if hist is None:
+            hist = _stage_wall[stage] = Histogram()
+        hist.observe(wall)
+        _stage_cpu[stage] = _stage_cpu.get(stage, 0.0) + cpu
+        _stage_items[stage] = _stage_items.get(stage, 0) + items
+
+
+def count_result(outcome: str, n: int = 1) -> None:
+    """
+    Count pipeline results by outcome ("negative", "positive", "cached").
+    """
+    with _lock:
+        _results[outcome] = _results.get(outcome, 0) + n
+
+
+# ----------------------------------------------------------------------
+# Per-call stage times
+# ----------------------------------------------------------------------
+
+class StageTimes(dict):
+    """
+    Wall seconds per stage, like the plain dict full_pipeline_batch has
+    always accepted as `timings`, plus CPU seconds and images per stage.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.cpu: Dict[str, float] = {}
+        self.images: Dict[str, int] = {}
+
+    def add(self, stage: str, wall: float, cpu: float, items: int = 1) -> None:
+        self[stage] = self.get(stage, 0.0) + wall
+        self.cpu[stage] = self.cpu.get(stage, 0.0) + cpu
+        self.images[stage] = self.images.get(stage, 0) + items
+
+    def per_image(self, stages: Optional[Iterable[str]] = None) -> Dict[str, dict]:
+        """
+        Each stage's times divided by the images it processed.
+        """
+        out = {}
+        for stage in stages if stages is not None else STAGES:
+            if stage in self:
+                n = max(self.images.get(stage, 1), 1)
+                out[stage] = {"wall_seconds": self[stage] / n, "cpu_seconds": self.cpu[stage] / n}
+        return out
+
+
+def stage_times() -> Optional[StageTimes]:
+    """
+    A fresh StageTimes when metrics are enabled, else None.
+    """
+    return StageTimes() if _enabled else None
+
+
+@contextmanager
+def timed(timings: Optional[Dict[str, float]], stage: str, items: int = 1):
+    """
+    Time the block as one call of `stage`: add its wall time to
+    timings[stage] (if timings is given; CPU time and items too for a
+    StageTimes) and record it in the histograms (if enabled).
+    """
+    if timings is None and not _enabled:
+        yield
+        return
+    start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        wall, cpu = time.perf_counter() - start, time.process_time() - cpu_start
+        if isinstance(timings, StageTimes):
+            timings.add(stage, wall, cpu, items)
+        elif timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + wall
+        if _enabled:
+            observe_stage(stage, wall, cpu, items)
+
+
+# ----------------------------------------------------------------------
+# Prometheus text format
+# ----------------------------------------------------------------------
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _header(lines: List[str], name: str, kind: str, help_text: str) -> None:
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+def render() -> str:
+    """
+    All metrics in the Prometheus text exposition format (version 0.0.4).
+    """
+    from backend.model_registry import registry
+
+    with _lock:
+        wall = {stage: (h.buckets, h.cumulative(), h.sum, h.count) for stage, h in _stage_wall.items()}
+        cpu, items, results = dict(_stage_cpu), dict(_stage_items), dict(_results)
+
+    lines: List[str] = []
+    name = "btd_stage_duration_seconds"
+    _header(lines, name, "histogram", "Wall time of pipeline stage calls.")
+    for stage, (buckets, cumulative, total, count) in sorted(wall.items()):
+        for bound, n in zip(buckets + ("+Inf",), cumulative):
+            lines.append(f'{name}_bucket{{stage="{_label(stage)}",le="{bound}"}} {n}')
+        lines.append(f'{name}_sum{{stage="{_label(stage)}"}} {total!r}')
+        lines.append(f'{name}_count{{stage="{_label(stage)}"}} {count}')
+
+    name = "btd_stage_cpu_seconds_total"
+    _header(lines, name, "counter", "Process CPU time spent in pipeline stage calls.")
+    for stage, value in sorted(cpu.items()):
+        lines.append(f'{name}{{stage="{_label(stage)}"}} {value!r}')
+
+    name = "btd_stage_images_total"
+    _header(lines, name, "counter", "Images processed per pipeline stage.")
+    for stage, value in sorted(items.items()):
+        lines.append(f'{name}{{stage="{_label(stage)}"}} {value}')
+
+    name = "btd_results_total"
+    _header(lines, name, "counter", "Pipeline results by outcome.")
+    for outcome, value in sorted(results.items()):
+        lines.append(f'{name}{{outcome="{_label(outcome)}"}} {value}')
+
+    report = registry.memory_report()
+    gauges = (
+        ("btd_model_loaded", "1 if the model is loaded.", lambda r: int(r["loaded"])),
+        ("btd_model_weight_bytes", "Weight memory of the loaded model.", lambda r: r["weight_bytes"]),
+        ("btd_model_load_seconds", "Time the model took to load.", lambda r: r["load_seconds"]),
+    )
+    for name, help_text, value in gauges:
+        _header(lines, name, "gauge", help_text)
+        for model, row in sorted(report.items()):
+            if value(row) is not None:
+                lines.append(f'{name}{{model="{_label(model)}"}} {value(row)!r}')
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,132 @@
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+import numpy as np
+
+
+# ----------------------------------------------------------------------
+# Lazy model registry
+# ----------------------------------------------------------------------
+#
+# Each inference module registers a loader for its model at import time.
+# Nothing is loaded until the first call to get() (or an explicit warmup),
+# so importing backend.pipeline no longer pulls in TensorFlow and reads
+# three checkpoints before anything else can happen.
+
+
+def _model_nbytes(model) -> int:
+    """
+    Approximate memory held by a model's weights, in bytes.
+
+    Works for PyTorch modules (parameters + buffers), Keras models
+    (weights) and anything exposing an `nbytes` attribute. Anything else
+    reports 0.
+    """
+    if hasattr(model, "nbytes"):
+        return int(model.nbytes)
+
+    if hasattr(model, "parameters") and hasattr(model, "buffers"):
+        tensors = list(model.parameters()) + list(model.buffers())
+        return int(sum(t.numel() * t.element_size() for t in tensors))
+
+    if hasattr(model, "weights"):
+        total = 0
+        for w in model.weights:
+            dtype = np.dtype(getattr(w.dtype, "as_numpy_dtype", w.dtype))
+            total += int(np.prod(w.shape)) * dtype.itemsize
+        return total
+
+    return 0
+
+
+class ModelRegistry:
+    """
+    Load models on first use and keep them for the life of the process.
+
+    Models are registered by name with a zero-argument loader. The
+    registry is thread-safe: concurrent first calls to get() load once.
+    """
+
+    def __init__(self):
+        self._loaders: Dict[str, Callable[[], object]] = {}
+        self._models: Dict[str, object] = {}
+        self._load_seconds: Dict[str, float] = {}
+        self._lock = threading.RLock()
+
+    def register(self, name: str, loader: Callable[[], object]) -> None:
+        """
+        Register (or replace) the loader for a model. A model that is
+        already loaded under this name is dropped.
+        """
+        with self._lock:
+            self._loaders[name] = loader
+            self._models.pop(name, None)
+            self._load_seconds.pop(name, None)
+
+    def names(self):
+        return list(self._loaders)
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._models
+
+    def get(self, name: str):
+        """
+        Return the model registered under name, loading it if needed.
+        """
+        model = self._models.get(name)
+        if model is not None:
+            return model
+
+        with self._lock:
+            model = self._models.get(name)
+            if model is None:
+                if name not in self._loaders:
+                    raise KeyError(f"No model registered under {name!r}")
+                start = time.perf_counter()
+                model = self._loaders[name]()
+                self._load_seconds[name] = time.perf_counter() - start
+                self._models[name] = model
+        return model
+
+    def warmup(self, names: Optional[Iterable[str]] = None) -> None:
+        """
+        Eagerly load the given models (default: every registered model).
+        """
+        for name in names if names is not None else self.names():
+            self.get(name)
+
+    def unload(self, name: Optional[str] = None) -> None:
+        """
+        Drop a loaded model (default: all of them). The next get() reloads it.
+        """
+        with self._lock:
+            if name is None:
+                self._models.clear()
+                self._load_seconds.clear()
+            else:
+                self._models.pop(name, None)
+                self._load_seconds.pop(name, None)
+
+    def memory_report(self) -> Dict[str, dict]:
+        """
+        Report load state, weight memory and load time per registered model.
+
+        Returns
+        -------
+        report : dict
+            name -> {"loaded": bool, "weight_bytes": int, "load_seconds": float or None}
+        """
+        report = {}
+        for name in self.names():
+            model = self._models.get(name)
+            report[name] = {
+                "loaded": model is not None,
+                "weight_bytes": _model_nbytes(model) if model is not None else 0,
+                "load_seconds": self._load_seconds.get(name),
+            }
+        return report
+
+
+# Shared process-wide registry used by the inference modules
+registry = ModelRegistry()
@@ -0,0 +1,143 @@
+"""
+Export the three models to ONNX for the ONNX Runtime backend.
+
+Run from the project root (needs onnx, onnxscript and tf2onnx):
+
+    python -m backend.onnx_export --check
+
+Writes models/onnx/{detection,classification,segmentation}.onnx, then
+select the backend with BTD_BACKEND=onnx (or onnx_runtime.set_backend).
+--check runs the native and ONNX models on the same random batches and
+prints the largest absolute output difference per model.
+"""
+import argparse
+import os
+from typing import Callable, Dict, Sequence
+
+import numpy as np
+
+# Importing the inference modules registers the native model loaders
+from backend import classification_inference, detection_inference, onnx_runtime  # noqa: F401
+from backend import segmentation_inference
+from backend.model_registry import registry
+
+OPSET = 17
+
+
+# ----------------------------------------------------------------------
+# Exporters
+# ----------------------------------------------------------------------
+
+def _export_torch(model, sample: np.ndarray, path: str, dynamic_hw: bool) -> None:
+    import torch
+    from torch.export import Dim
+
+    model = model.cpu().eval()
+    dims = {0: Dim("batch")}
+    if dynamic_hw:
+        dims.update({2: Dim("height"), 3: Dim("width")})
+
+    program = torch.onnx.export(
+        model,
+        (torch.from_numpy(sample),),
+        input_names=["x"],
+        output_names=["y"],
+        dynamic_shapes={"x": dims},
+        opset_version=OPSET,
+        dynamo=True,
+    )
+    # Keep the weights inside the .onnx file (no external data sidecar)
+    program.save(path, external_data=False)
+
+
+def export_detection(path: str) -> None:
+    import tensorflow as tf
+    import tf2onnx
+
+    engine = registry.get("detection")
+    spec = (tf.TensorSpec([None, engine.image_size, engine.image_size, 1], tf.float32),)
+    tf2onnx.convert.from_function(
+        engine.forward, input_signature=spec, opset=OPSET, output_path=path
+    )
+
+
+def export_classification(path: str) -> None:
+    sample = np.zeros((2, 1, 224, 224), dtype="float32")
+    # Height / width stay dynamic: the native resolution policy feeds each
+    # image at its own size
+    _export_torch(classification_inference._load_eager_model(), sample, path, dynamic_hw=True)
+
+
+def export_segmentation(path: str) -> None:
+    size = segmentation_inference.IMAGE_SIZE
+    sample = np.zeros((2, 1, size, size), dtype="float32")
+    _export_torch(segmentation_inference._load_eager_model(), sample, path, dynamic_hw=False)
+
+
+EXPORTERS: Dict[str, Callable[[str], None]] = {
+    "detection": export_detection,
+    "classification": export_classification,
+    "segmentation": export_segmentation,
+}
+
+
+# ----------------------------------------------------------------------
+# Parity check
+# ----------------------------------------------------------------------
+
+def _native_forward(stage: str, batch: np.ndarray) -> np.ndarray:
+    if stage == "detection":
+        return registry.get("detection").predict(batch)
+
+    import torch
+
+    model = registry.get(stage)
+    with torch.no_grad():
+        return model(torch.from_numpy(batch)).numpy()
+
+
+def _check_batches(stage: str, rng: np.random.Generator) -> Sequence[np.ndarray]:
+    if stage == "detection":
+        return [rng.random((n, 224, 224, 1), dtype=np.float32) for n in (1, 4)]
+    if stage == "classification":
+        return [rng.random(shape, dtype=np.float32) for shape in ((1, 1, 224, 224), (3, 1, 256, 320))]
+    return [rng.random((n, 1, 224, 224), dtype=np.float32) for n in (1, 3)]
+
+
+def check_parity(stage: str, seed: int = 0) -> float:
+    """
+    Largest absolute difference between native and ONNX outputs (raw
+    logits / probabilities) over a few random batches.
+    """
+    rng = np.random.default_rng(seed)
+    onnx_model = registry.get(f"{stage}_onnx")
+    worst = 0.0
+    for batch in _check_batches(stage, rng):
+        ref = _native_forward(stage, batch)
+        out = onnx_model.predict(batch)
+        worst = max(worst, float(np.abs(ref - out).max()))
+    return worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the models to ONNX.")
+    parser.add_argument(
+        "--models", nargs="+", choices=sorted(EXPORTERS), default=list(EXPORTERS),
+    )
+    parser.add_argument("--check", action="store_true", help="Compare ONNX outputs with the native models")
+    args = parser.parse_args()
+
+    os.makedirs(onnx_runtime.ONNX_DIR, exist_ok=True)
+    for stage in args.models:
+        path = onnx_runtime.ONNX_PATHS[stage]
+        EXPORTERS[stage](path)
+        registry.unload(f"{stage}_onnx")  # pick up the new file
+        print(f"{stage:15s} -> {path} ({os.path.getsize(path) / 2**20:.1f} MB)")
+
+    if args.check:
+        for stage in args.models:
+            print(f"{stage:15s} max |native - onnx| = {check_parity(stage):.3g}")
+
+
+if __name__ == "__main__":
+    main()
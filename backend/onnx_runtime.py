@@ -0,0 +1,107 @@
+import os
+from typing import List
+
+import numpy as np
+
+from backend.model_registry import registry
+
+# ----------------------------------------------------------------------
+# Inference backend selection
+# ----------------------------------------------------------------------
+#
+# "native": Keras detector + PyTorch classifier / UNet (default)
+# "onnx":   all three models through ONNX Runtime on CPU. Export the
+#           models first with `python -m backend.onnx_export`. In this
+#           mode neither TensorFlow nor PyTorch is imported.
+
+BACKENDS = ("native", "onnx")
+
+ONNX_DIR = os.path.join("models", "onnx")
+ONNX_PATHS = {
+    "detection": os.path.join(ONNX_DIR, "detection.onnx"),
+    "classification": os.path.join(ONNX_DIR, "classification.onnx"),
+    "segmentation": os.path.join(ONNX_DIR, "segmentation.onnx"),
+}
+
+_backend = os.environ.get("BTD_BACKEND", "native")
+
+
+def get_backend() -> str:
+    return _backend
+
+
+def set_backend(name: str) -> None:
+    """
+    Select the inference backend for run_detection / run_classification /
+    run_segmentation and their batch variants.
+    """
+    global _backend
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend {name!r}, expected one of {BACKENDS}")
+    _backend = name
+
+
+def active_models() -> List[str]:
+    """
+    Registry names of the models the current backend runs, e.g. for
+    registry.warmup(active_models()).
+    """
+    if _backend == "onnx":
+        return [f"{stage}_onnx" for stage in ONNX_PATHS]
+
+    from backend import quantization
+
+    return ["detection"] + [quantization.model_name(stage) for stage in quantization.STAGES]
+
+
+class OnnxModel:
+    """
+    ONNX Runtime CPU session with a single input and a single output.
+
+    Parameters
+    ----------
+    path : str
+        Path to the .onnx file.
+    intra_op_threads : int
+        Threads per operator; 0 lets ONNX Runtime use all cores.
+    """
+
+    def __init__(self, path: str, intra_op_threads: int = 0):
+        import onnxruntime as ort
+
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                f"{path} not found; export it with `python -m backend.onnx_export`"
+            )
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = intra_op_threads
+
+        self.path = path
+        self.session = ort.InferenceSession(
+            path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    @property
+    def nbytes(self) -> int:
+        # Lets ModelRegistry.memory_report size the session (weights are
+        # stored in the graph file)
+        return os.path.getsize(self.path)
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        x = np.ascontiguousarray(batch, dtype="float32")
+        return self.session.run(None, {self.input_name: x})[0]
+
+
+def _loader(stage: str):
+    def load() -> OnnxModel:
+        threads = int(os.environ.get("BTD_ONNX_THREADS", "0"))
+        return OnnxModel(ONNX_PATHS[stage], intra_op_threads=threads)
+
+    return load
+
+
+for _stage in ONNX_PATHS:
+    registry.register(f"{_stage}_onnx", _loader(_stage))
@@ -1,24 +1,351 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set, Tuple, Union
+
 import numpy as np
 
 from utils.preprocessing import (
-    load_image_from_path,
-    prepare_for_detection,
+    PreprocessContext,
+    as_preprocess_context,
     # prepare_for_classification,  # not needed anymore
 )
 from utils.visualization import overlay_mask_on_image
-from backend.classification_inference import run_classification
-from backend.detection_inference import run_detection
-from backend.segmentation_inference import run_segmentation
+from backend import (
+    classification_inference,
+    detection_inference,
+    metrics,
+    onnx_runtime,
+    quantization,
+    segmentation_inference,
+    torch_execution,
+)
+from backend.classification_inference import (
+    run_classification,
+    run_classification_batch,
+)
+from backend.detection_inference import run_detection, run_detection_batch
+from backend.segmentation_inference import run_segmentation, run_segmentation_batch
+from backend.result_cache import ResultCache, checkpoint_fingerprint, hash_bytes, hash_pixels
 
 # You can tune this later based on detection model performance
 TUMOR_THRESHOLD = 0.5
 
 
-def _run_pipeline_core(img_rgb: np.ndarray) -> dict:
+ImageInput = Union[str, Path, np.ndarray, PreprocessContext]
+
+# Optional persistent result cache (see backend.result_cache). Off unless
+# enabled with enable_result_cache() or BTD_RESULT_CACHE_DIR.
+_result_cache: Optional[ResultCache] = None
+
+
+def enable_result_cache(directory: str, max_bytes: int = 512 * 1024 * 1024) -> ResultCache:
+    """
+    Cache pipeline predictions on disk, keyed by decoded pixel data.
+
+    Entries are invalidated automatically when a checkpoint file or a
+    threshold / resolution setting changes.
+    """
+    global _result_cache
+    _result_cache = ResultCache(directory, max_bytes=max_bytes)
+    return _result_cache
+
+
+def disable_result_cache() -> None:
+    global _result_cache
+    _result_cache = None
+
+
+def _cache_fingerprint() -> str:
+    paths = [
+        detection_inference.MODEL_PATH,
+        classification_inference.MODEL_PATH,
+        segmentation_inference.MODEL_PATH,
+    ]
+    if quantization.get_mode() == "static":
+        paths += list(quantization.STATIC_PATHS.values())
+    return checkpoint_fingerprint(
+        paths,
+        tumor_threshold=TUMOR_THRESHOLD,
+        mask_threshold=segmentation_inference.MASK_THRESHOLD,
+        cls_resolution=classification_inference.INPUT_RESOLUTION,
+        backend=onnx_runtime.get_backend(),
+        quantization=quantization.get_mode(),
+        torch_execution=torch_execution.requested(),
+    )
+
+
+def _cache_key(ctx: PreprocessContext) -> str:
+    # The decode mode goes into the key rather than the fingerprint, so
+    # full and reduced results live side by side. Deferred JPEGs are keyed
+    # on their encoded bytes; hashing their pixels would force the full
+    # RGB decode that the reduced path exists to skip.
+    if ctx.reduced:
+        return "reduced-" + hash_bytes(ctx.encoded())
+    return hash_pixels(ctx.image)
+
+
+if os.environ.get("BTD_RESULT_CACHE_DIR"):
+    enable_result_cache(
+        os.environ["BTD_RESULT_CACHE_DIR"],
+        max_bytes=int(os.environ.get("BTD_RESULT_CACHE_MAX_MB", "512")) * 1024 * 1024,
+    )
+
+
+# Optional concurrent classification + segmentation. Off unless enabled
+# with enable_concurrent_stages() or BTD_CONCURRENT_STAGES=1.
+_stage_executors: Optional[Tuple[ThreadPoolExecutor, ThreadPoolExecutor]] = None
+
+# torch intra-op thread count to restore when concurrent stages are disabled
+_saved_torch_threads: Optional[int] = None
+
+
+def _uses_torch() -> bool:
+    # ONNX Runtime sessions size their own pools (BTD_ONNX_THREADS), and
+    # torch must not be imported in that mode
+    return onnx_runtime.get_backend() != "onnx"
+
+
+def enable_concurrent_stages(threads: Optional[int] = None) -> None:
+    """
+    Run classification and segmentation of tumor-positive images at the
+    same time, each on its own worker thread (PyTorch releases the GIL).
+
+    torch.set_num_threads sets the calling thread's intra-op count (per
+    thread under OpenMP) and the count threads started afterwards take up
+    when they first run torch work. It is therefore set to half the
+    combined budget here, before the stage threads start, so both stages
+    run with it; the calling thread and other threads started meanwhile
+    use it too until disable_concurrent_stages() restores the previous
+    count.
+
+    Parameters
+    ----------
+    threads : int, optional
+        Combined PyTorch intra-op threads of both stages running at once
+        (each gets threads // 2, at least one). Defaults to the number of
+        usable cores.
+    """
+    global _stage_executors, _saved_torch_threads
+    disable_concurrent_stages()
+    if threads is None:
+        if hasattr(os, "sched_getaffinity"):
+            threads = len(os.sched_getaffinity(0))
+        else:
+            threads = os.cpu_count() or 1
+
+    if _uses_torch():
+        import torch
+
+        _saved_torch_threads = torch.get_num_threads()
+        torch.set_num_threads(max(1, threads // 2))
+
+    _stage_executors = tuple(
+        ThreadPoolExecutor(max_workers=1, thread_name_prefix=stage)
+        for stage in ("classification", "segmentation")
+    )
+
+
+def disable_concurrent_stages() -> None:
+    global _stage_executors, _saved_torch_threads
+    if _stage_executors is not None:
+        for executor in _stage_executors:
+            executor.shutdown(wait=True)
+        _stage_executors = None
+    if _saved_torch_threads is not None:
+        import torch
+
+        torch.set_num_threads(_saved_torch_threads)
+        _saved_torch_threads = None
+
+
+if os.environ.get("BTD_CONCURRENT_STAGES", "0") == "1":
+    enable_concurrent_stages(
+        int(os.environ["BTD_CONCURRENT_THREADS"]) if os.environ.get("BTD_CONCURRENT_THREADS") else None
+    )
+
+
+# ----------------------------------------------------------------------
+# Stage API
+# ----------------------------------------------------------------------
+# The steps of the pipeline, for executors that schedule them on their
+# own (backend.streaming, backend.study_pipeline) instead of calling
+# full_pipeline_batch. The result helpers take the context rather than
+# the RGB image: a deferred JPEG (see PreprocessContext.from_path) is only
+# decoded in full when an overlay needs it.
+
+def is_tumor(prob_tumor: float) -> bool:
+    """
+    Whether a detection probability goes on to classification and
+    segmentation.
+    """
+    return float(prob_tumor) >= TUMOR_THRESHOLD
+
+
+def detect(
+    contexts: List[PreprocessContext],
+    timings: Optional[Dict[str, float]] = None,
+) -> np.ndarray:
+    """
+    Tumor probabilities of a batch of images, one batched model call.
+    """
+    with metrics.timed(timings, "preprocess", len(contexts)):
+        det_inputs = [ctx.detection_input() for ctx in contexts]
+    with metrics.timed(timings, "detection", len(contexts)):
+        return run_detection_batch(det_inputs)
+
+
+def classify_and_segment(
+    contexts: List[PreprocessContext],
+    timings: Optional[Dict[str, float]] = None,
+):
+    """
+    Classification and segmentation of the same images, one after the
+    other or, with concurrent stages enabled, at the same time.
+
+    Returns
+    -------
+    predictions : list of (label, class_probs)
+    masks : list of np.ndarray
+        (H, W) bool, at each image's original size.
+    """
+    def classify():
+        with metrics.timed(timings, "classification", len(contexts)):
+            return run_classification_batch(contexts)
+
+    def segment():
+        with metrics.timed(timings, "segmentation", len(contexts)):
+            return run_segmentation_batch(contexts)
+
+    if _stage_executors is None:
+        return classify(), segment()
+
+    cls_executor, seg_executor = _stage_executors
+    seg_future = seg_executor.submit(segment)
+    cls_future = cls_executor.submit(classify)
+    return cls_future.result(), seg_future.result()
+
+
+def negative_result(ctx: PreprocessContext, prob_tumor: float, with_overlay: bool = True) -> dict:
+    """
+    Result for an image below TUMOR_THRESHOLD.
+    """
+    return {
+        "has_tumor": False,
+        "detection_prob": float(prob_tumor),
+        "predicted_label": None,
+        "class_probs": None,
+        "segmentation_mask": None,
+        # just return original image as overlay
+        "overlay_image": ctx.image if with_overlay else None,
+    }
+
+
+def positive_result(
+    ctx: PreprocessContext,
+    prob_tumor: float,
+    pred_label: str,
+    probs: dict,
+    mask: np.ndarray,
+    with_overlay: bool = True,
+) -> dict:
+    """
+    Result for a tumor-positive image from its classification and mask.
+    """
+    overlay = overlay_mask_on_image(ctx.image, mask) if with_overlay else None
+
+    return {
+        "has_tumor": True,
+        "detection_prob": float(prob_tumor),
+        "predicted_label": pred_label,
+        "class_probs": probs,
+        "segmentation_mask": mask,
+        "overlay_image": overlay,
+    }
+
+
+def _from_cache_entry(ctx: PreprocessContext, entry: dict, with_overlay: bool = True) -> dict:
+    if entry["class_probs"] is None:
+        return negative_result(ctx, entry["detection_prob"], with_overlay)
+    return positive_result(
+        ctx,
+        entry["detection_prob"],
+        entry["predicted_label"],
+        entry["class_probs"],
+        entry["segmentation_mask"],
+        with_overlay,
+    )
+
+
+def cached_result(ctx: PreprocessContext, with_overlay: bool = True) -> Tuple[Optional[str], Optional[dict]]:
+    """
+    Look an image up in the result cache.
+
+    Returns
+    -------
+    key : str or None
+        Pass it to cache_result once the image is processed; None when
+        the cache is disabled.
+    result : dict or None
+        The cached result, None on a miss.
+    """
+    cache = _result_cache
+    if cache is None:
+        return None, None
+    key = _cache_key(ctx)
+    entry = cache.get(key, _cache_fingerprint())
+    return key, None if entry is None else _from_cache_entry(ctx, entry, with_overlay)
+
+
+def cache_result(key: Optional[str], result: dict) -> None:
+    """
+    Store a result under the key cached_result returned (no-op for None
+    or with the cache disabled).
+    """
+    cache = _result_cache
+    if cache is not None and key is not None:
+        cache.put(key, _cache_fingerprint(), result)
+
+
+# ----------------------------------------------------------------------
+# Pipeline
+# ----------------------------------------------------------------------
+
+# Stages that contributed to each kind of result (for result["timings"])
+_RESULT_STAGES = {
+    "negative": ("decode", "preprocess", "detection"),
+    "positive": metrics.STAGES,
+    "cached": ("decode",),
+}
+
+
+def _outcome(result: dict, cached: bool = False) -> str:
+    if cached:
+        return "cached"
+    return "positive" if result["has_tumor"] else "negative"
+
+
+def _attach_timings(result: dict, timings: metrics.StageTimes, outcome: str) -> dict:
+    """
+    Count the result and attach its per-image stage times (metrics enabled).
+    """
+    metrics.count_result(outcome)
+    result["timings"] = timings.per_image(_RESULT_STAGES[outcome])
+    return result
+
+
+def _run_pipeline_core(
+    image: Union[np.ndarray, PreprocessContext],
+    with_overlay: bool = True,
+    timings: Optional[metrics.StageTimes] = None,
+) -> dict:
     """
     Core pipeline logic operating on an in-memory RGB image.
 
+    `image` is either the RGB array or a PreprocessContext wrapping it; the
+    context is shared by all three stages so the image is converted and
+    resized only once per model input.
+
     Steps:
     1. Run detection:
        - If no tumor: return early, no classification/segmentation.
@@ -26,57 +353,195 @@ def _run_pipeline_core(img_rgb: np.ndarray) -> dict:
     2. Run classification to get tumor type.
     3. Run segmentation to get binary mask.
     4. Create overlay image (original + green tumor region).
+
+    When the result cache is enabled, steps 1-3 are skipped for images
+    whose pixels were already processed with the same checkpoints.
+
+    With metrics enabled (backend.metrics), the result also carries
+    "timings": wall and CPU seconds per stage.
     """
+    ctx = as_preprocess_context(image)
+    if timings is None:
+        timings = metrics.stage_times()
 
-    # 1. Detection
-    det_input = prepare_for_detection(img_rgb)
-    prob_tumor = run_detection(det_input)
+    key, result = cached_result(ctx, with_overlay)
+    cached = result is not None
+    if not cached:
+        result = _run_models(ctx, with_overlay, timings)
+        cache_result(key, result)
+
+    if timings is None:
+        return result
+    return _attach_timings(result, timings, _outcome(result, cached))
 
-    has_tumor = float(prob_tumor) >= TUMOR_THRESHOLD
+
+def _run_models(
+    ctx: PreprocessContext,
+    with_overlay: bool = True,
+    timings: Optional[metrics.StageTimes] = None,
+) -> dict:
+    # 1. Detection
+    with metrics.timed(timings, "preprocess"):
+        det_input = ctx.detection_input()
+    with metrics.timed(timings, "detection"):
+        prob_tumor = run_detection(det_input)
 
     # If no tumor: skip classification and segmentation
-    if not has_tumor:
-        return {
-            "has_tumor": False,
-            "detection_prob": float(prob_tumor),
-            "predicted_label": None,
-            "class_probs": None,
-            "segmentation_mask": None,
-            # just return original image as overlay
-            "overlay_image": img_rgb,
-        }
-
-    # 2. Tumor present -> classification
-    # run_classification expects an unbatched image (H, W, 3) or (H, W)
-    pred_label, probs = run_classification(img_rgb)
-
-    # 3. Segmentation
-    mask = run_segmentation(img_rgb)  # (H, W) binary {0,1}
+    if not is_tumor(prob_tumor):
+        return negative_result(ctx, prob_tumor, with_overlay)
+
+    if _stage_executors is not None:
+        # 2. + 3. Classification and segmentation side by side
+        predictions, masks = classify_and_segment([ctx], timings)
+        (pred_label, probs), mask = predictions[0], masks[0]
+    else:
+        # 2. Tumor present -> classification
+        with metrics.timed(timings, "classification"):
+            pred_label, probs = run_classification(ctx)
+
+        # 3. Segmentation
+        with metrics.timed(timings, "segmentation"):
+            mask = run_segmentation(ctx)  # (H, W) bool
 
     # 4. Overlay
-    overlay = overlay_mask_on_image(img_rgb, mask)
+    with metrics.timed(timings, "overlay"):
+        return positive_result(ctx, prob_tumor, pred_label, probs, mask, with_overlay)
 
-    return {
-        "has_tumor": True,
-        "detection_prob": float(prob_tumor),
-        "predicted_label": pred_label,
-        "class_probs": probs,
-        "segmentation_mask": mask,
-        "overlay_image": overlay,
-    }
+
+def _run_models_batch(
+    contexts: List[PreprocessContext],
+    with_overlay: bool = True,
+    timings: Optional[Dict[str, float]] = None,
+) -> List[dict]:
+    # 1. Detection for the whole batch
+    probs_tumor = detect(contexts, timings)
+
+    results: List[dict] = [None] * len(contexts)
+    positive = []
+    for i, (ctx, prob_tumor) in enumerate(zip(contexts, probs_tumor)):
+        if is_tumor(prob_tumor):
+            positive.append(i)
+        else:
+            results[i] = negative_result(ctx, prob_tumor, with_overlay)
+
+    if not positive:
+        return results
+
+    # 2. + 3. Classification and segmentation on tumor-positive images only
+    pos_contexts = [contexts[i] for i in positive]
+    predictions, masks = classify_and_segment(pos_contexts, timings)
+
+    # 4. Overlay
+    with metrics.timed(timings, "overlay", len(positive)):
+        for i, (pred_label, probs), mask in zip(positive, predictions, masks):
+            results[i] = positive_result(
+                contexts[i], probs_tumor[i], pred_label, probs, mask, with_overlay
+            )
+
+    return results
 
 
 def full_pipeline(image_path: str) -> dict:
     """
     Pipeline entry point when you have an image path on disk.
     """
-    img_rgb = load_image_from_path(image_path)
-    return _run_pipeline_core(img_rgb)
+    timings = metrics.stage_times()
+    with metrics.timed(timings, "decode"):
+        ctx = PreprocessContext.from_path(image_path)
+    return _run_pipeline_core(ctx, timings=timings)
 
 
-def full_pipeline_from_array(img_rgb: np.ndarray) -> dict:
+def full_pipeline_from_array(img_rgb: np.ndarray, with_overlay: bool = True) -> dict:
     """
     Pipeline entry point when you already have an RGB numpy image
     (e.g. from Streamlit file uploader). Shape (H, W, 3), dtype uint8.
+
+    With with_overlay=False, "overlay_image" is None (for callers that
+    render their own overlay or show the original image themselves).
     """
-    return _run_pipeline_core(img_rgb)
+    return _run_pipeline_core(img_rgb, with_overlay)
+
+
+def full_pipeline_batch(
+    images: Sequence[ImageInput],
+    with_overlay: bool = True,
+    timings: Optional[Dict[str, float]] = None,
+) -> List[dict]:
+    """
+    Pipeline entry point for many images at once (e.g. archive reprocessing).
+
+    Each item may be an image path, an RGB numpy array (H, W, 3), uint8,
+    or a PreprocessContext.
+    Detection runs as a single batched model call over all images; only the
+    tumor-positive images are then stacked through classification and
+    segmentation. Results match full_pipeline / full_pipeline_from_array
+    item for item, in input order.
+
+    Parameters
+    ----------
+    with_overlay : bool
+        If False, skip building overlays ("overlay_image" is None, and
+        deferred JPEGs are never decoded at full resolution). Useful for
+        headless batch jobs.
+    timings : dict, optional
+        If given, wall seconds spent per stage ("decode", "preprocess",
+        "detection", "classification", "segmentation", "overlay") are
+        added to it.
+
+    With metrics enabled (backend.metrics), each result also carries
+    "timings": its share of each batched stage's wall and CPU seconds.
+    """
+    stage_times = metrics.stage_times()
+    if stage_times is None:
+        return _run_batch(images, with_overlay, timings)[0]
+
+    results, hits = _run_batch(images, with_overlay, stage_times)
+    for i, result in enumerate(results):
+        _attach_timings(result, stage_times, _outcome(result, i in hits))
+    if timings is not None:
+        for stage, seconds in stage_times.items():
+            timings[stage] = timings.get(stage, 0.0) + seconds
+    return results
+
+
+def _run_batch(
+    images: Sequence[ImageInput],
+    with_overlay: bool,
+    timings: Optional[Dict[str, float]],
+) -> Tuple[List[dict], Set[int]]:
+    """
+    full_pipeline_batch without the metrics bookkeeping: the results and
+    the indices served from the result cache.
+    """
+    with metrics.timed(timings, "decode", len(images)):
+        contexts = [
+            PreprocessContext.from_path(img) if isinstance(img, (str, Path))
+            else as_preprocess_context(img)
+            for img in images
+        ]
+    if not contexts:
+        return [], set()
+
+    cache = _result_cache
+    if cache is None:
+        return _run_models_batch(contexts, with_overlay, timings), set()
+
+    # Serve cached images directly, run the models on the rest only
+    fingerprint = _cache_fingerprint()
+    keys = [_cache_key(ctx) for ctx in contexts]
+    results: List[dict] = [None] * len(contexts)
+    misses = []
+    for i, (ctx, key) in enumerate(zip(contexts, keys)):
+        entry = cache.get(key, fingerprint)
+        if entry is None:
+            misses.append(i)
+        else:
+            results[i] = _from_cache_entry(ctx, entry, with_overlay)
+
+    if misses:
+        computed = _run_models_batch([contexts[i] for i in misses], with_overlay, timings)
+        for i, result in zip(misses, computed):
+            cache.put(keys[i], fingerprint, result)
+            results[i] = result
+
+    return results, set(range(len(contexts))) - set(misses)
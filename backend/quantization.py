@@ -0,0 +1,367 @@
+"""
+INT8 post-training quantization for the PyTorch models (UNet, SmallResNetSE).
+
+Modes (BTD_QUANT environment variable, or set_mode()):
+
+- "off":     float32 models (default)
+- "dynamic": nn.Linear weights stored as int8, activations quantized on
+             the fly. Built from the float checkpoint at load time, no
+             calibration. PyTorch has no dynamic kernels for convolutions,
+             so this only touches the classifier's SE and head layers; the
+             UNet (no Linear layers) keeps its float32 model.
+- "static":  convolutions and activations in int8 with activation ranges
+             fixed by calibration (FX graph mode, fbgemm / x86 kernels, or
+             qnnpack on ARM). Needs the artifacts written by
+
+                 python -m backend.quantization data_samples --json quant_report.json
+
+The command calibrates on a folder of sample images, saves
+models/quantized/{classification,segmentation}_static.pt, and reports mask
+Dice, class-probability drift and latency of both modes against the float
+models. Quantized models always run on CPU.
+"""
+import argparse
+import copy
+import json
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from backend.model_registry import registry
+from backend.result_cache import checkpoint_fingerprint
+
+MODES = ("off", "dynamic", "static")
+STAGES = ("classification", "segmentation")
+DYNAMIC_STAGES = ("classification",)  # models with nn.Linear layers
+
+QUANT_DIR = os.path.join("models", "quantized")
+STATIC_PATHS = {stage: os.path.join(QUANT_DIR, f"{stage}_static.pt") for stage in STAGES}
+
+_mode = os.environ.get("BTD_QUANT", "off")
+
+
+def get_mode() -> str:
+    return _mode
+
+
+def set_mode(name: str) -> None:
+    """
+    Select float32 or an INT8 mode for the classifier and UNet.
+    """
+    global _mode
+    if name not in MODES:
+        raise ValueError(f"Unknown quantization mode {name!r}, expected one of {MODES}")
+    _mode = name
+
+
+def model_name(stage: str) -> str:
+    """
+    Registry name of the model `stage` runs under the current mode.
+    """
+    if _mode == "off" or (_mode == "dynamic" and stage not in DYNAMIC_STAGES):
+        return stage
+    return f"{stage}_int8_{_mode}"
+
+
+# ----------------------------------------------------------------------
+# Building quantized models
+# ----------------------------------------------------------------------
+
+def _engine() -> str:
+    import torch
+
+    engines = torch.backends.quantized.supported_engines
+    engine = "x86" if "x86" in engines else "qnnpack"
+    torch.backends.quantized.engine = engine
+    return engine
+
+
+def _float_checkpoint(stage: str) -> str:
+    from backend import classification_inference, segmentation_inference
+
+    module = classification_inference if stage == "classification" else segmentation_inference
+    return module.MODEL_PATH
+
+
+def load_float(stage: str):
+    """
+    A fresh float32 CPU copy of a model (the registry's copy is left alone).
+    """
+    from backend import classification_inference, segmentation_inference
+
+    module = classification_inference if stage == "classification" else segmentation_inference
+    return module._load_eager_model().cpu().eval()
+
+
+def quantize_dynamic(model):
+    import torch
+    from torch.ao.quantization import quantize_dynamic as _quantize_dynamic
+
+    _engine()
+    return _quantize_dynamic(copy.deepcopy(model), {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def quantize_static(model, calibration: Iterable[np.ndarray]):
+    """
+    Static post-training quantization of a float model.
+
+    Parameters
+    ----------
+    model : torch.nn.Module
+        Float32 model in eval mode, on CPU.
+    calibration : iterable of np.ndarray
+        Model inputs, each (1, 1, H, W) float32. Observers record the
+        activation ranges seen on these.
+
+    Returns
+    -------
+    model : torch.jit.ScriptModule
+        Traced and frozen INT8 model.
+    """
+    import torch
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    engine = _engine()
+    batches = [torch.from_numpy(x) for x in calibration]
+    if not batches:
+        raise ValueError("Static quantization needs at least one calibration input")
+
+    with torch.no_grad():
+        prepared = prepare_fx(
+            copy.deepcopy(model), get_default_qconfig_mapping(engine), (batches[0],)
+        )
+        for x in batches:
+            prepared(x)
+        quantized = convert_fx(prepared)
+        traced = torch.jit.trace(quantized, (batches[0],))
+    return torch.jit.freeze(traced)
+
+
+def save_static(stage: str, model, n_images: int) -> str:
+    """
+    Save a static INT8 model with the float checkpoint it was built from.
+    """
+    import torch
+
+    os.makedirs(QUANT_DIR, exist_ok=True)
+    meta = {
+        "checkpoint": checkpoint_fingerprint([_float_checkpoint(stage)]),
+        "engine": torch.backends.quantized.engine,
+        "calibration_images": n_images,
+    }
+    path = STATIC_PATHS[stage]
+    torch.jit.save(model, path, _extra_files={"quantization.json": json.dumps(meta)})
+    return path
+
+
+def load_static(stage: str):
+    import torch
+
+    path = STATIC_PATHS[stage]
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"{path} not found; calibrate with `python -m backend.quantization <image dir>`"
+        )
+
+    extra = {"quantization.json": ""}
+    model = torch.jit.load(path, map_location="cpu", _extra_files=extra)
+    meta = json.loads(extra["quantization.json"])
+    if meta["checkpoint"] != checkpoint_fingerprint([_float_checkpoint(stage)]):
+        raise RuntimeError(
+            f"{path} was calibrated for a different {stage} checkpoint; "
+            "re-run `python -m backend.quantization <image dir>`"
+        )
+    torch.backends.quantized.engine = meta["engine"]
+    return model
+
+
+def _dynamic_loader(stage: str):
+    def load():
+        return quantize_dynamic(load_float(stage))
+
+    return load
+
+
+def _static_loader(stage: str):
+    def load():
+        return load_static(stage)
+
+    return load
+
+
+for _stage in STAGES:
+    registry.register(f"{_stage}_int8_static", _static_loader(_stage))
+for _stage in DYNAMIC_STAGES:
+    registry.register(f"{_stage}_int8_dynamic", _dynamic_loader(_stage))
+
+
+# ----------------------------------------------------------------------
+# Calibration and drift report
+# ----------------------------------------------------------------------
+
+def _model_inputs(paths: Sequence[str]) -> Dict[str, List[np.ndarray]]:
+    from backend.classification_inference import INPUT_RESOLUTION
+    from utils.preprocessing import PreprocessContext
+
+    inputs = {stage: [] for stage in STAGES}
+    for path in paths:
+        ctx = PreprocessContext.from_path(path)
+        inputs["classification"].append(ctx.classification_input(INPUT_RESOLUTION))
+        inputs["segmentation"].append(ctx.segmentation_input())
+    return inputs
+
+
+def mask_dice(a: np.ndarray, b: np.ndarray) -> float:
+    """
+    Dice overlap of two binary masks (1.0 when both are empty).
+    """
+    a, b = a.astype(bool), b.astype(bool)
+    total = a.sum() + b.sum()
+    if total == 0:
+        return 1.0
+    return float(2.0 * np.logical_and(a, b).sum() / total)
+
+
+def _run(model, x: np.ndarray):
+    import torch
+
+    start = time.perf_counter()
+    with torch.no_grad():
+        out = model(torch.from_numpy(x))
+    return out.numpy(), time.perf_counter() - start
+
+
+def _latency_ms(seconds: List[float]) -> float:
+    # Median, so the first (warm-up) calls don't skew it
+    return float(np.median(seconds) * 1000.0)
+
+
+def compare(stage: str, reference, candidate, inputs: Sequence[np.ndarray]) -> dict:
+    """
+    Compare a quantized model against its float reference on `inputs`.
+
+    Returns
+    -------
+    report : dict
+        Segmentation: mean / min mask Dice. Classification: max / mean
+        absolute class-probability drift and top-1 agreement. Both:
+        median float and INT8 latency per image and the speedup.
+    """
+    from backend.segmentation_inference import MASK_THRESHOLD
+
+    ref_s, cand_s, scores = [], [], []
+    agree = 0
+    for x in inputs:
+        ref, t_ref = _run(reference, x)
+        out, t_out = _run(candidate, x)
+        ref_s.append(t_ref)
+        cand_s.append(t_out)
+        if stage == "segmentation":
+            scores.append(mask_dice(_sigmoid(ref) > MASK_THRESHOLD, _sigmoid(out) > MASK_THRESHOLD))
+        else:
+            p_ref, p_out = _softmax(ref), _softmax(out)
+            scores.append(float(np.abs(p_ref - p_out).max()))
+            agree += int(p_ref.argmax() == p_out.argmax())
+
+    report = {"images": len(inputs)}
+    if stage == "segmentation":
+        report.update(dice_mean=float(np.mean(scores)), dice_min=float(np.min(scores)))
+    else:
+        report.update(
+            prob_drift_max=float(np.max(scores)),
+            prob_drift_mean=float(np.mean(scores)),
+            top1_agreement=agree / len(inputs),
+        )
+    report.update(
+        float_ms=_latency_ms(ref_s),
+        int8_ms=_latency_ms(cand_s),
+    )
+    report["speedup"] = report["float_ms"] / report["int8_ms"]
+    return report
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def _softmax(x: np.ndarray) -> np.ndarray:
+    e = np.exp(x - x.max(axis=1, keepdims=True))
+    return e / e.sum(axis=1, keepdims=True)
+
+
+def calibrate_and_report(
+    calibration_paths: Sequence[str],
+    eval_paths: Optional[Sequence[str]] = None,
+) -> Dict[str, Dict[str, dict]]:
+    """
+    Build and save the static INT8 models, then compare both INT8 modes
+    with the float models.
+
+    Returns
+    -------
+    report : dict
+        report[mode][stage] as returned by compare() (dynamic mode covers
+        DYNAMIC_STAGES only).
+    """
+    calibration = _model_inputs(calibration_paths)
+    evaluation = _model_inputs(eval_paths) if eval_paths else calibration
+
+    report = {"dynamic": {}, "static": {}}
+    for stage in STAGES:
+        reference = load_float(stage)
+
+        static = quantize_static(reference, calibration[stage])
+        save_static(stage, static, len(calibration_paths))
+        registry.unload(f"{stage}_int8_static")  # pick up the new file
+
+        report["static"][stage] = compare(stage, reference, static, evaluation[stage])
+        if stage in DYNAMIC_STAGES:
+            report["dynamic"][stage] = compare(
+                stage, reference, quantize_dynamic(reference), evaluation[stage]
+            )
+    return report
+
+
+def main():
+    from backend.batch_runner import iter_image_paths
+
+    parser = argparse.ArgumentParser(description="Calibrate INT8 models and report drift.")
+    parser.add_argument("calibration_dir", help="Folder of sample images for calibration")
+    parser.add_argument("--eval-dir", help="Images for the drift report (default: calibration images)")
+    parser.add_argument("--max-images", type=int, default=200, help="Calibration images used")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    calibration = list(iter_image_paths(args.calibration_dir))[: args.max_images]
+    if not calibration:
+        raise SystemExit(f"No images found in {args.calibration_dir}")
+    evaluation = list(iter_image_paths(args.eval_dir)) if args.eval_dir else None
+
+    report = calibrate_and_report(calibration, evaluation)
+
+    print(f"Calibrated on {len(calibration)} images -> {QUANT_DIR}")
+    for mode, stages in report.items():
+        print(f"[{mode}]")
+        for stage, r in stages.items():
+            if stage == "segmentation":
+                quality = f"dice mean {r['dice_mean']:.4f} min {r['dice_min']:.4f}"
+            else:
+                quality = (
+                    f"prob drift max {r['prob_drift_max']:.4f} mean {r['prob_drift_mean']:.4f} "
+                    f"top-1 {r['top1_agreement']:.1%}"
+                )
+            print(
+                f"  {stage:15s} {quality}   "
+                f"{r['float_ms']:7.1f} -> {r['int8_ms']:7.1f} ms ({r['speedup']:.2f}x)"
+            )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,399 @@
+"""
+PDF diagnosis reports.
+
+The original scan and the tumor overlay are drawn in a 240 x 240 pt box,
+so they are embedded downsampled to print resolution (BTD_REPORT_DPI,
+default 150: at most 500 px across) as JPEG rather than as full-resolution
+PNG. reportlab copies JPEG data into the PDF as is, so rendering does no
+image work beyond the resize and one encode, and a report is tens of kB
+instead of megabytes. Grayscale scans are stored single-channel. Encoded
+images are cached per result (in-process LRU), so re-rendering a report,
+e.g. after editing the notes, only lays out the text again.
+
+    pdf_bytes = render_report(img_rgb, result, notes="...", key=result_id)
+
+Batch mode renders one PDF per record of a batch_runner output, in
+parallel worker processes:
+
+    python -m backend.report results.jsonl --out-dir reports/ --workers 4
+
+Needs reportlab (in requirements.txt).
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from io import BytesIO
+from typing import Hashable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from backend.result_cache import hash_pixels
+from utils.visualization import overlay_mask_on_image
+
+REPORT_DPI = int(os.environ.get("BTD_REPORT_DPI", "150"))
+
+IMAGE_BOX_PT = 240  # side of the box each image is drawn in
+JPEG_QUALITY = 90
+
+# Encoded images kept in memory (two per report)
+IMAGE_CACHE_SIZE = 128
+
+_image_cache: "OrderedDict[tuple, bytes]" = OrderedDict()
+_image_cache_lock = threading.Lock()
+
+
+# ----------------------------------------------------------------------
+# Images
+# ----------------------------------------------------------------------
+
+def print_size(shape: Tuple[int, ...], box_pt: float = IMAGE_BOX_PT, dpi: Optional[int] = None) -> Tuple[int, int]:
+    """
+    (width, height) in pixels an image of `shape` needs to fill a
+    box_pt x box_pt box at `dpi` (aspect kept, never upscaled).
+    """
+    h, w = shape[:2]
+    target = box_pt * (dpi or REPORT_DPI) / 72.0
+    scale = min(target / w, target / h, 1.0)
+    return max(1, round(w * scale)), max(1, round(h * scale))
+
+
+def encode_image(img: np.ndarray, box_pt: float = IMAGE_BOX_PT, dpi: Optional[int] = None) -> bytes:
+    """
+    JPEG of an (H, W, 3) RGB or (H, W) uint8 image at print resolution;
+    single-channel when the image is gray.
+    """
+    size = print_size(img.shape, box_pt, dpi)
+    if size != (img.shape[1], img.shape[0]):
+        img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    if img.ndim == 3 and (img[..., 0] == img[..., 1]).all() and (img[..., 1] == img[..., 2]).all():
+        img = np.ascontiguousarray(img[..., 0])
+
+    buf = BytesIO()
+    Image.fromarray(img).save(buf, format="JPEG", quality=JPEG_QUALITY)
+    return buf.getvalue()
+
+
+def _embedded(key: tuple, make) -> bytes:
+    """
+    encode_image(make()), cached under `key`.
+    """
+    with _image_cache_lock:
+        data = _image_cache.get(key)
+        if data is not None:
+            _image_cache.move_to_end(key)
+            return data
+
+    data = encode_image(make())
+    with _image_cache_lock:
+        _image_cache[key] = data
+        while len(_image_cache) > IMAGE_CACHE_SIZE:
+            _image_cache.popitem(last=False)
+    return data
+
+
+def clear_image_cache() -> None:
+    with _image_cache_lock:
+        _image_cache.clear()
+
+
+def _report_images(image: np.ndarray, result: dict, key: Optional[Hashable]) -> Tuple[bytes, bytes]:
+    """
+    Encoded original and overlay. Without an overlay in the result (e.g.
+    with_overlay=False), it is built from the mask, only if not cached;
+    the mask may be at a higher resolution than the image.
+    """
+    overlay = result.get("overlay_image")
+    mask = result.get("segmentation_mask")
+
+    if key is not None:
+        original_key, overlay_key = (key, "original"), (key, "overlay")
+    else:
+        original_key = (hash_pixels(image),)
+        if overlay is not None:
+            overlay_key = (hash_pixels(overlay),)
+        elif mask is not None:
+            overlay_key = (original_key[0], hash_pixels(np.asarray(mask)))
+        else:
+            overlay_key = original_key
+    original_key += (REPORT_DPI,)
+    overlay_key += (REPORT_DPI,)
+
+    def make_overlay():
+        if overlay is not None:
+            return overlay
+        if mask is None:
+            return image
+        if mask.shape != image.shape[:2]:
+            # Image decoded at reduced size (batch mode): scale a copy of
+            # the mask for the picture only, stats use the full mask
+            mask_u8 = np.asarray(mask, dtype=np.uint8)
+            small = cv2.resize(mask_u8, (image.shape[1], image.shape[0]), interpolation=cv2.INTER_NEAREST)
+            return overlay_mask_on_image(image, small)
+        return overlay_mask_on_image(image, mask)
+
+    return _embedded(original_key, lambda: image), _embedded(overlay_key, make_overlay)
+
+
+# ----------------------------------------------------------------------
+# Rendering
+# ----------------------------------------------------------------------
+
+_rl_config_lock = threading.Lock()
+
+
+@contextmanager
+def _binary_streams():
+    """
+    Write this PDF's streams as binary: reportlab's default ASCII85
+    encoding grows every embedded image by a quarter. useA85 is a
+    process-wide reportlab setting, read while drawing and saving, so it
+    is switched off only around one canvas and restored after.
+    """
+    from reportlab import rl_config
+
+    with _rl_config_lock:
+        saved = rl_config.useA85
+        rl_config.useA85 = 0
+        try:
+            yield
+        finally:
+            rl_config.useA85 = saved
+
+
+def render_report(
+    image: np.ndarray,
+    result: dict,
+    notes: str = "",
+    key: Optional[Hashable] = None,
+) -> bytes:
+    """
+    Render one diagnosis report.
+
+    Parameters
+    ----------
+    image : np.ndarray
+        The scan, (H, W, 3) RGB uint8.
+    result : dict
+        Pipeline result ("has_tumor", "detection_prob", "predicted_label",
+        "class_probs", "segmentation_mask", optionally "overlay_image").
+    notes : str
+        Doctor notes, printed as given (long lines wrapped).
+    key : hashable, optional
+        Identifies the result for the image cache. Without it, images are
+        cached by a hash of their pixels.
+
+    Returns
+    -------
+    pdf : bytes
+    """
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    images = _report_images(image, result, key)
+
+    buf = BytesIO()
+    with _binary_streams():
+        c = canvas.Canvas(buf, pagesize=letter)
+        _draw_page(c, result, notes, images)
+        c.save()
+    return buf.getvalue()
+
+
+def _draw_page(c, result: dict, notes: str, images: Tuple[bytes, bytes]) -> None:
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.utils import ImageReader
+
+    has_tumor = bool(result["has_tumor"])
+    label = result.get("predicted_label")
+    class_probs = result.get("class_probs")
+    mask = result.get("segmentation_mask")
+    width, height = letter
+
+    # Title
+    c.setFont("Helvetica-Bold", 18)
+    c.drawString(50, height - 60, "Brain Tumor Analysis Report")
+
+    # Detection info
+    y = height - 100
+    c.setFont("Helvetica-Bold", 13)
+    c.drawString(50, y, "AI Findings")
+    y -= 20
+    c.setFont("Helvetica", 11)
+    c.drawString(50, y, f"Tumor detected: {has_tumor}")
+    y -= 16
+    c.drawString(50, y, f"Detection confidence: {float(result['detection_prob']):.2%}")
+    y -= 16
+    if has_tumor and label:
+        c.drawString(50, y, f"Predicted tumor type: {label.upper()}")
+        y -= 20
+
+    if has_tumor and class_probs:
+        c.setFont("Helvetica-Bold", 12)
+        c.drawString(50, y, "Class probabilities:")
+        y -= 16
+        c.setFont("Helvetica", 10)
+        for cls, p in class_probs.items():
+            c.drawString(60, y, f"- {cls}: {float(p):.2%}")
+            y -= 14
+
+    # Segmentation stats
+    if mask is not None:
+        tumor_pixels = int(np.count_nonzero(mask))
+        total_pixels = int(mask.size)
+        coverage = tumor_pixels / total_pixels * 100 if total_pixels > 0 else 0.0
+        y -= 10
+        c.setFont("Helvetica-Bold", 12)
+        c.drawString(50, y, "Segmentation:")
+        y -= 16
+        c.setFont("Helvetica", 10)
+        c.drawString(60, y, f"Tumor pixels: {tumor_pixels:,}")
+        y -= 14
+        c.drawString(60, y, f"Coverage: {coverage:.2f}%")
+        y -= 24
+
+    # Doctor notes
+    c.setFont("Helvetica-Bold", 13)
+    c.drawString(50, y, "Doctor Notes")
+    y -= 18
+    c.setFont("Helvetica", 10)
+
+    text_obj = c.beginText(50, y)
+    wrap_width = 90  # characters per line approx
+    for line in notes.splitlines():
+        while len(line) > wrap_width:
+            text_obj.textLine(line[:wrap_width])
+            line = line[wrap_width:]
+        text_obj.textLine(line)
+    c.drawText(text_obj)
+
+    # Images at bottom
+    img_y = 140
+    for x, data in zip((50, 325), images):
+        c.drawImage(
+            ImageReader(BytesIO(data)), x, img_y,
+            width=IMAGE_BOX_PT, height=IMAGE_BOX_PT, preserveAspectRatio=True,
+        )
+
+    # Footer
+    c.setFont("Helvetica", 8)
+    c.drawString(50, 40, "Generated by Brain Tumor AI Diagnostic System")
+
+
+# ----------------------------------------------------------------------
+# Batch mode
+# ----------------------------------------------------------------------
+
+def _load_image(path: str) -> np.ndarray:
+    # JPEGs are decoded at a DCT-reduced scale still above print size
+    with Image.open(path) as im:
+        target = round(IMAGE_BOX_PT * REPORT_DPI / 72.0)
+        im.draft("RGB", (target, target))
+        return np.asarray(im.convert("RGB"))
+
+
+def _record_result(record: dict, sidecar_path: str) -> dict:
+    from backend.batch_runner import read_mask
+
+    # Full resolution: the printed stats must match the diagnosis; only the
+    # overlay picture is drawn from a downsampled copy
+    mask = read_mask(sidecar_path, record)
+    probs = {k[len("prob_"):]: v for k, v in record.items() if k.startswith("prob_") and v is not None}
+    return {
+        "has_tumor": record["has_tumor"],
+        "detection_prob": record["detection_prob"],
+        "predicted_label": record["predicted_label"],
+        "class_probs": probs or None,
+        "segmentation_mask": mask.astype(bool) if mask is not None else None,
+    }
+
+
+def _render_record(job: Tuple[dict, str, str, str]) -> str:
+    record, sidecar_path, notes, out_path = job
+    image = _load_image(record["path"])
+    result = _record_result(record, sidecar_path)
+    with open(out_path, "wb") as f:
+        f.write(render_report(image, result, notes))
+    return out_path
+
+
+def read_records(results_path: str) -> List[dict]:
+    """
+    Records of a batch_runner output (.jsonl, or .parquet with pyarrow).
+    """
+    if results_path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        return pq.read_table(results_path).to_pylist()
+    with open(results_path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def render_reports(
+    results_path: str,
+    out_dir: str,
+    notes: str = "",
+    workers: Optional[int] = None,
+) -> List[str]:
+    """
+    Render a PDF for every successful record of a batch_runner output.
+
+    Parameters
+    ----------
+    results_path : str
+        The batch_runner --out file; masks are read from its sidecar.
+    out_dir : str
+        Reports are written here as <image name>.pdf.
+    notes : str
+        Notes printed in every report.
+    workers : int, optional
+        Rendering processes, default one per core.
+
+    Returns
+    -------
+    paths : list of str
+        The written reports, in record order.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    sidecar_path = results_path + ".masks.bin"
+
+    jobs, used = [], set()
+    for i, record in enumerate(read_records(results_path)):
+        if record.get("error") is not None:
+            continue
+        name = os.path.splitext(os.path.basename(record["path"]))[0]
+        if name in used:
+            name = f"{name}_{i}"
+        used.add(name)
+        jobs.append((record, sidecar_path, notes, os.path.join(out_dir, name + ".pdf")))
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(jobs) < 2:
+        return [_render_record(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_render_record, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render PDF reports for a batch_runner output.")
+    parser.add_argument("results", help="batch_runner output (.jsonl or .parquet)")
+    parser.add_argument("--out-dir", required=True)
+    parser.add_argument("--notes", default="", help="Notes printed in every report")
+    parser.add_argument("--workers", type=int, default=None, help="Rendering processes (default: one per core)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    paths = render_reports(args.results, args.out_dir, args.notes, args.workers)
+    elapsed = time.perf_counter() - start
+    size = sum(os.path.getsize(p) for p in paths) / max(len(paths), 1) / 1024
+    print(f"{len(paths)} reports in {elapsed:.1f}s ({len(paths) / max(elapsed, 1e-9):.1f}/s), {size:.0f} kB each on average")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+
+# ----------------------------------------------------------------------
+# Content-addressed on-disk cache of pipeline results
+# ----------------------------------------------------------------------
+#
+# Layout:  <directory>/<model fingerprint>/<key>.npz
+#
+# The key is the pixel hash, or for images taken through the reduced JPEG
+# decode, "reduced-" plus the hash of the encoded file.
+#
+# The model fingerprint covers every checkpoint file (path, size, mtime)
+# plus the thresholds and settings that change the output. When any of
+# them changes, results land in a new fingerprint directory and the old
+# ones are deleted, so stale predictions are never served.
+
+
+def hash_pixels(img: np.ndarray) -> str:
+    """
+    Hash decoded pixel data (values, shape and dtype).
+    """
+    h = hashlib.blake2b(digest_size=20)
+    h.update(str((img.shape, img.dtype.str)).encode())
+    h.update(np.ascontiguousarray(img).data)
+    return h.hexdigest()
+
+
+def hash_bytes(data: bytes) -> str:
+    """
+    Hash encoded file data.
+    """
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def _is_fingerprint(name: str) -> bool:
+    # Only directories this cache created are ever deleted
+    return len(name) == 16 and all(c in "0123456789abcdef" for c in name)
+
+
+def checkpoint_fingerprint(paths: Iterable[str], **settings) -> str:
+    """
+    Fingerprint a set of checkpoint files plus any output-affecting settings.
+
+    Files are identified by path, size and modification time, so replacing
+    a checkpoint changes the fingerprint without hashing its contents.
+    """
+    h = hashlib.blake2b(digest_size=8)
+    for path in paths:
+        try:
+            st = os.stat(path)
+            h.update(f"{path}:{st.st_size}:{st.st_mtime_ns};".encode())
+        except OSError:
+            h.update(f"{path}:missing;".encode())
+    for name in sorted(settings):
+        h.update(f"{name}={settings[name]};".encode())
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    Persistent LRU cache of pipeline predictions.
+
+    Stores detection probability, predicted label, class probabilities and
+    the segmentation mask (bit-packed, zlib-compressed). Overlays are not
+    stored; they are cheap to rebuild from the mask.
+
+    Parameters
+    ----------
+    directory : str
+        Cache root, created if missing.
+    max_bytes : int
+        Size budget. Least recently used entries are evicted past it.
+
+    Each instance tallies the bytes it has written or read, and only
+    rescans the directory once that tally passes max_bytes. Entries that
+    other processes add to a shared directory therefore go unnoticed until
+    then, so a directory shared by N processes can grow to about N times
+    max_bytes.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._fingerprint: Optional[str] = None
+        self._sizes: Dict[str, int] = {}
+        self._total = 0
+        os.makedirs(directory, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # Fingerprint handling
+    # ------------------------------------------------------------------
+
+    def _activate(self, fingerprint: str) -> str:
+        """
+        Switch to `fingerprint`, deleting entries of any other one.
+        Must be called with the lock held.
+        """
+        fp_dir = os.path.join(self.directory, fingerprint)
+        if fingerprint == self._fingerprint:
+            return fp_dir
+
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name != fingerprint and _is_fingerprint(name) and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+
+        os.makedirs(fp_dir, exist_ok=True)
+        self._rescan(fp_dir)
+        self._fingerprint = fingerprint
+        return fp_dir
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def get(self, key: str, fingerprint: str) -> Optional[dict]:
+        """
+        Return the cached entry for `key`, or None.
+
+        Returns
+        -------
+        entry : dict or None
+            {"detection_prob", "predicted_label", "class_probs", "segmentation_mask"}
+        """
+        with self._lock:
+            fp_dir = self._activate(fingerprint)
+            name = key + ".npz"
+            path = os.path.join(fp_dir, name)
+            if not os.path.exists(path):
+                return None
+            try:
+                with np.load(path, allow_pickle=False) as data:
+                    entry = _decode(data)
+            except (OSError, ValueError, KeyError):
+                # Corrupt or concurrently evicted entry: drop it
+                self._remove(fp_dir, name)
+                return None
+            # Touch for LRU ordering; the entry may have been written, or
+            # since evicted, by another process sharing the directory
+            try:
+                os.utime(path)
+                if name not in self._sizes:
+                    self._sizes[name] = os.path.getsize(path)
+                    self._total += self._sizes[name]
+            except OSError:
+                pass
+        return entry
+
+    def put(self, key: str, fingerprint: str, result: dict) -> None:
+        """
+        Store the prediction fields of a pipeline result.
+        """
+        arrays = _encode(result)
+        with self._lock:
+            fp_dir = self._activate(fingerprint)
+            name = key + ".npz"
+
+            # Write to a temp file and rename, so readers never see a
+            # partial entry
+            fd, tmp = tempfile.mkstemp(dir=fp_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(f, **arrays)
+            os.replace(tmp, os.path.join(fp_dir, name))
+
+            size = os.path.getsize(os.path.join(fp_dir, name))
+            self._total += size - self._sizes.get(name, 0)
+            self._sizes[name] = size
+            self._evict(fp_dir)
+
+    def clear(self) -> None:
+        with self._lock:
+            for name in os.listdir(self.directory):
+                if _is_fingerprint(name):
+                    shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+            self._fingerprint = None
+            self._sizes = {}
+            self._total = 0
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _remove(self, fp_dir: str, name: str) -> None:
+        try:
+            os.remove(os.path.join(fp_dir, name))
+        except OSError:
+            pass
+        self._total -= self._sizes.pop(name, 0)
+
+    def _rescan(self, fp_dir: str) -> None:
+        self._sizes = {}
+        for name in os.listdir(fp_dir):
+            if name.endswith(".npz"):
+                try:
+                    self._sizes[name] = os.path.getsize(os.path.join(fp_dir, name))
+                except OSError:
+                    pass
+        self._total = sum(self._sizes.values())
+
+    def _evict(self, fp_dir: str) -> None:
+        if self._total <= self.max_bytes:
+            return
+        # Other processes may have added or evicted entries since the last
+        # scan; evict against what is on disk now
+        self._rescan(fp_dir)
+
+        def last_used(name):
+            try:
+                return os.path.getmtime(os.path.join(fp_dir, name))
+            except OSError:
+                return 0.0
+
+        for name in sorted(self._sizes, key=last_used):
+            if self._total <= self.max_bytes:
+                break
+            self._remove(fp_dir, name)
+
+
+def _encode(result: dict) -> Dict[str, np.ndarray]:
+    arrays = {"detection_prob": np.float64(result["detection_prob"])}
+
+    if result.get("class_probs") is not None:
+        arrays["predicted_label"] = np.array(result["predicted_label"])
+        arrays["class_names"] = np.array(list(result["class_probs"]))
+        arrays["class_probs"] = np.array(list(result["class_probs"].values()), dtype="float64")
+
+    mask = result.get("segmentation_mask")
+    if mask is not None:
+        arrays["mask_shape"] = np.array(mask.shape, dtype="int64")
+        arrays["mask_bits"] = np.packbits(mask.astype(bool), axis=None)
+
+    return arrays
+
+
+def _decode(data) -> dict:
+    entry = {
+        "detection_prob": float(data["detection_prob"]),
+        "predicted_label": None,
+        "class_probs": None,
+        "segmentation_mask": None,
+    }
+
+    if "class_probs" in data:
+        entry["predicted_label"] = str(data["predicted_label"])
+        entry["class_probs"] = {
+            str(name): float(p) for name, p in zip(data["class_names"], data["class_probs"])
+        }
+
+    if "mask_bits" in data:
+        shape = tuple(int(n) for n in data["mask_shape"])
+        bits = np.unpackbits(data["mask_bits"], count=int(np.prod(shape)))
+        entry["segmentation_mask"] = bits.reshape(shape).view(bool)  # same dtype as a fresh run
+
+    return entry
@@ -1,81 +1,223 @@
 import os
+from typing import List, Sequence, Tuple, Union
+
 import numpy as np
-import torch
-from torchvision import transforms
-from PIL import Image
 
-from backend.segmentation_model import UNet
+from backend import checkpoints, compiled_models, onnx_runtime, quantization, torch_execution
+from backend.model_registry import registry
+from utils.preprocessing import PreprocessContext, as_preprocess_context
 
 # --- CONFIGURATION (MUST MATCH TRAINING / predict.py) ---
 
 # MODEL_PATH = os.path.join("../models", "segmentation", "segmentation_model.pth")
 MODEL_PATH = os.path.join("models", "segmentation", "segmentation_model.pth")
 
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 IMAGE_SIZE = 224  # same as in your original predict.py
+MASK_THRESHOLD = 0.5  # sigmoid probability above which a pixel is tumor
 
 
-# Same transforms as in predict.py: resize + ToTensor ONLY
-_seg_transform = transforms.Compose(
-    [
-        transforms.Resize((IMAGE_SIZE, IMAGE_SIZE)),
-        transforms.ToTensor(),  # (1, H, W) in [0,1]
-    ]
-)
+# Inputs are prepared exactly as in predict.py (PIL grayscale, resize,
+# ToTensor) by utils.preprocessing.PreprocessContext.segmentation_input
 
 # --- MODEL LOADING ---
 
-# IMPORTANT: n_channels=1 because the model was trained on grayscale images
-_unet_model = UNet(n_channels=1, n_classes=1)
-_unet_model.load_state_dict(
-    torch.load(MODEL_PATH, map_location=torch.device(DEVICE))
-)
-_unet_model.to(DEVICE)
-_unet_model.eval()
+
+def _load_eager_model():
+    # PyTorch is imported here so the ONNX backend never loads it
+    import torch
+    from backend.segmentation_model import UNet
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+
+    # IMPORTANT: n_channels=1 because the model was trained on grayscale images
+    model = UNet(n_channels=1, n_classes=1)
+    # Memory-mapped when converted, see backend.checkpoints
+    state, mapped = checkpoints.load_state_dict(MODEL_PATH, device)
+    model.load_state_dict(state, assign=mapped)
+    model.to(device)
+    model.eval()
+    return model
+
+
+def _load_model():
+    # Fused, frozen build from backend.compiled_models when one is cached
+    # for this checkpoint, otherwise the eager model
+    model = compiled_models.load_cached("segmentation", MODEL_PATH)
+    return model if model is not None else _load_eager_model()
+
+
+# Loaded on first use, see backend.model_registry
+registry.register("segmentation", _load_model)
 
 
-def run_segmentation(rgb_image: np.ndarray) -> np.ndarray:
+def nearest_indices(n_in: int, n_out: int) -> np.ndarray:
     """
-    Run UNet segmentation on an in-memory RGB image.
+    Source index of every output pixel for a nearest-neighbor resize of
+    one axis from n_in to n_out pixels.
 
-    Parameters
-    ----------
-    rgb_image : np.ndarray
-        Shape (H, W, 3), dtype uint8, RGB.
+    Matches PIL's Image.resize(..., Image.NEAREST) exactly, including its
+    floating-point stepping (sample centers are accumulated one step at a
+    time, not computed as (i + 0.5) * scale).
+    """
+    step = n_in / n_out
+    centers = np.cumsum(np.concatenate([[step * 0.5], np.full(n_out - 1, step)]))
+    return np.minimum(centers.astype(np.int64), n_in - 1)
+
+
+def upsample_mask(mask: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    """
+    Nearest-neighbor resize of a low-resolution mask to (H, W) = size:
+    a row gather (H x IMAGE_SIZE) then a column gather, so the only
+    full-resolution allocation is the bool result.
 
     Returns
     -------
-    mask_resized : np.ndarray
-        Binary mask of shape (H, W), dtype uint8, values {0, 1},
-        resized back to the original image size.
+    mask : np.ndarray
+        Shape (H, W), dtype bool.
     """
+    h, w = size
+    rows = nearest_indices(mask.shape[0], h)
+    cols = nearest_indices(mask.shape[1], w)
+    return mask.astype(bool, copy=False)[rows][:, cols]
 
-    # Remember original size (for upsampling the mask later)
-    orig_h, orig_w = rgb_image.shape[:2]
 
-    # Convert numpy RGB -> PIL Image -> grayscale "L"
-    pil_image = Image.fromarray(rgb_image).convert("L")
+class LazyMask:
+    """
+    Low-resolution mask plus the size it should be upsampled to.
+
+    The full-resolution mask is only built when a consumer asks for it
+    (materialize(), np.asarray); counting tumor pixels works directly on
+    the low-resolution mask.
+
+    Parameters
+    ----------
+    low_res : np.ndarray
+        (IMAGE_SIZE, IMAGE_SIZE) bool mask as predicted by the model.
+    size : tuple of int
+        (H, W) of the original image.
+    """
+
+    def __init__(self, low_res: np.ndarray, size: Tuple[int, int]):
+        self.low_res = low_res
+        self.size = tuple(size)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.size
 
-    # Apply the SAME transforms as in predict.py
-    input_tensor = _seg_transform(pil_image)  # shape: (1, H, W)
+    def materialize(self) -> np.ndarray:
+        return upsample_mask(self.low_res, self.size)
 
-    # Add batch dimension and move to device: (1, 1, H, W)
-    input_batch = input_tensor.unsqueeze(0).to(DEVICE)
+    def __array__(self, dtype=None, copy=None):
+        mask = self.materialize()
+        return mask if dtype is None else mask.astype(dtype)
+
+    def count_nonzero(self) -> int:
+        """
+        Tumor pixels at full resolution, without building the full mask:
+        each low-resolution pixel counts as often as its row and column
+        are repeated by the upsampling.
+        """
+        h, w = self.size
+        rows = np.bincount(nearest_indices(self.low_res.shape[0], h), minlength=self.low_res.shape[0])
+        cols = np.bincount(nearest_indices(self.low_res.shape[1], w), minlength=self.low_res.shape[1])
+        return int(rows @ self.low_res.astype(np.int64) @ cols)
+
+
+def segment_batch(batch: np.ndarray) -> np.ndarray:
+    """
+    Run one forward pass over a stacked batch.
+
+    Parameters
+    ----------
+    batch : np.ndarray
+        Shape (N, 1, IMAGE_SIZE, IMAGE_SIZE), float32, values in [0, 1].
+
+    Returns
+    -------
+    masks : np.ndarray
+        Shape (N, IMAGE_SIZE, IMAGE_SIZE), dtype bool.
+    """
+    if onnx_runtime.get_backend() == "onnx":
+        logits = registry.get("segmentation_onnx").predict(batch)  # (N, 1, H, W)
+        probs = 1.0 / (1.0 + np.exp(-logits))
+        return probs[:, 0] > MASK_THRESHOLD
+
+    import torch
+
+    # Float model, or its INT8 version (CPU only), see backend.quantization
+    name = quantization.model_name("segmentation")
+    model = registry.get(name)
+    device = next(model.parameters(), torch.empty(0)).device
+    input_batch = torch.from_numpy(batch).to(device)
 
     # Inference
     with torch.no_grad():
-        output_logits = _unet_model(input_batch)  # (1, 1, H, W)
+        output_logits = torch_execution.forward(
+            model, input_batch, quantized=name != "segmentation"
+        )  # (N, 1, H, W)
         output_probs = torch.sigmoid(output_logits)
 
-    # Threshold at 0.5 to get binary mask
-    pred_mask = (output_probs > 0.5).float().cpu().squeeze(0).squeeze(0)  # (H, W)
+        # Threshold on the device; only the low-resolution bool mask is
+        # copied back
+        pred_mask = (output_probs > MASK_THRESHOLD).squeeze(1)  # (N, H, W)
+
+    return pred_mask.cpu().numpy()
+
+
+def run_segmentation(
+    rgb_image: Union[np.ndarray, PreprocessContext],
+    lazy: bool = False,
+) -> Union[np.ndarray, LazyMask]:
+    """
+    Run UNet segmentation on an in-memory RGB image.
+
+    Parameters
+    ----------
+    rgb_image : np.ndarray or PreprocessContext
+        Shape (H, W, 3), dtype uint8, RGB.
+    lazy : bool
+        Return a LazyMask instead of the full-resolution mask.
+
+    Returns
+    -------
+    mask_resized : np.ndarray or LazyMask
+        Binary mask of shape (H, W), dtype bool, resized back to the
+        original image size.
+    """
+    return run_segmentation_batch([rgb_image], lazy=lazy)[0]
+
+
+def run_segmentation_batch(
+    rgb_images: Sequence[Union[np.ndarray, PreprocessContext]],
+    lazy: bool = False,
+) -> List[Union[np.ndarray, LazyMask]]:
+    """
+    Run UNet segmentation on several RGB images with a single forward pass.
+
+    Every image is resized to IMAGE_SIZE, so the whole list is stacked into
+    one (N, 1, IMAGE_SIZE, IMAGE_SIZE) batch.
+
+    Parameters
+    ----------
+    rgb_images : sequence of np.ndarray or PreprocessContext
+        Each of shape (H, W, 3), dtype uint8, RGB. Sizes may differ.
+    lazy : bool
+        Return LazyMask objects instead of full-resolution masks.
+
+    Returns
+    -------
+    masks : list of np.ndarray or LazyMask
+        One (H, W) bool mask per image, at that image's size.
+    """
+    contexts = [as_preprocess_context(img) for img in rgb_images]
 
-    # Convert to numpy uint8
-    mask_np = pred_mask.numpy().astype(np.uint8)  # 0 or 1, size IMAGE_SIZE x IMAGE_SIZE
+    # Stack into one batch: (N, 1, H, W)
+    batch = np.concatenate([ctx.segmentation_input() for ctx in contexts], axis=0)
 
-    # Resize mask back to original image size using nearest neighbor
-    mask_pil = Image.fromarray(mask_np * 255)
-    mask_resized_pil = mask_pil.resize((orig_w, orig_h), Image.NEAREST)
-    mask_resized = (np.array(mask_resized_pil) > 0).astype(np.uint8)  # 0 or 1
+    masks = segment_batch(batch)
 
-    return mask_resized
+    if lazy:
+        return [LazyMask(mask, ctx.size) for mask, ctx in zip(masks, contexts)]
+    # Nearest-neighbor upsample back to each original image size
+    return [upsample_mask(mask, ctx.size) for mask, ctx in zip(masks, contexts)]
@@ -0,0 +1,302 @@
+"""
+Local HTTP inference service with dynamic micro-batching.
+
+Run from the project root (needs uvicorn):
+
+    python -m backend.server --port 8000 --max-batch-size 16 --max-wait-ms 10
+
+Endpoints:
+
+    POST /predict          raw PNG/JPG bytes in the body, e.g.
+                           curl --data-binary @scan.png localhost:8000/predict
+                           add ?mask=1 to get the mask as a base64 PNG
+    GET  /health           status and per-model memory report
+    GET  /metrics          per-stage latency histograms and counters in the
+                           Prometheus text format (see backend.metrics)
+
+Concurrent requests are gathered by an asyncio queue into micro-batches
+(up to max batch size, or whatever arrived within max wait time of the
+first request) and run through full_pipeline_batch on a single model
+thread, so many clients share one warm model process.
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+from urllib.parse import parse_qs
+
+import numpy as np
+from PIL import Image
+
+from backend import metrics, onnx_runtime
+from backend.model_registry import registry
+from backend.pipeline import full_pipeline_batch
+from utils.preprocessing import PreprocessContext
+
+MAX_BODY_BYTES = 50 * 1024 * 1024
+
+
+# ----------------------------------------------------------------------
+# Micro-batching
+# ----------------------------------------------------------------------
+
+class MicroBatcher:
+    """
+    Collect concurrent submissions into batches for one batch function.
+
+    Parameters
+    ----------
+    process_batch : callable
+        Takes a list of items and returns a list of results, same order.
+        Runs on a dedicated single worker thread. When it raises, the
+        batch is retried item by item and only the failing items' callers
+        get the exception.
+    max_batch_size : int
+        Largest batch passed to process_batch.
+    max_wait_ms : float
+        How long the first item of a batch waits for company.
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[List], List],
+        max_batch_size: int = 16,
+        max_wait_ms: float = 10.0,
+    ):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def start(self) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model")
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def submit(self, item):
+        """
+        Queue one item and wait for its result.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _next_batch(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _process(self, batch) -> None:
+        loop = asyncio.get_running_loop()
+        items = [item for item, _ in batch]
+        try:
+            results = await loop.run_in_executor(self._executor, self.process_batch, items)
+        except Exception as exc:
+            if len(batch) == 1:
+                _, future = batch[0]
+                if not future.done():
+                    future.set_exception(exc)
+                return
+            # Retry one item at a time, so a bad input only fails its own
+            # request and not everyone batched with it
+            for entry in batch:
+                await self._process([entry])
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _run(self) -> None:
+        while True:
+            await self._process(await self._next_batch())
+
+
+def _process_contexts(contexts: List[PreprocessContext]) -> List[dict]:
+    return full_pipeline_batch(contexts, with_overlay=False)
+
+
+def _decode(body: bytes) -> PreprocessContext:
+    # JPEGs are decoded at reduced size with BTD_FAST_DECODE=1
+    ctx = PreprocessContext.from_bytes(body)
+    ctx.detection_input()
+    return ctx
+
+
+def _to_json(result: dict, with_mask: bool) -> dict:
+    mask = result["segmentation_mask"]
+    out = {
+        "has_tumor": bool(result["has_tumor"]),
+        "detection_prob": float(result["detection_prob"]),
+        "predicted_label": result["predicted_label"],
+        "class_probs": result["class_probs"],
+        "tumor_pixels": int(np.count_nonzero(mask)) if mask is not None else 0,
+    }
+    if "timings" in result:
+        out["timings"] = result["timings"]
+    if with_mask and mask is not None:
+        buf = io.BytesIO()
+        Image.fromarray((mask > 0).astype(np.uint8) * 255).save(buf, format="PNG")
+        out["mask_png"] = base64.b64encode(buf.getvalue()).decode("ascii")
+    return out
+
+
+# ----------------------------------------------------------------------
+# ASGI application
+# ----------------------------------------------------------------------
+
+class InferenceApp:
+    """
+    Minimal ASGI app around a MicroBatcher (no web framework needed).
+    """
+
+    def __init__(self, max_batch_size: int = 16, max_wait_ms: float = 10.0, warmup: bool = False):
+        self.batcher = MicroBatcher(_process_contexts, max_batch_size, max_wait_ms)
+        self.warmup = warmup
+        # Decoding runs here so it never blocks the event loop or the model thread
+        self._decode_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="decode")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                if self.warmup:
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, registry.warmup, onnx_runtime.active_models()
+                    )
+                await self.batcher.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.batcher.stop()
+                self._decode_pool.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope, receive, send):
+        method, path = scope["method"], scope["path"]
+
+        if method == "GET" and path == "/health":
+            await _send_json(send, 200, {"status": "ok", "models": registry.memory_report()})
+            return
+
+        if method == "GET" and path == "/metrics":
+            await _send(send, 200, metrics.render().encode(), b"text/plain; version=0.0.4; charset=utf-8")
+            return
+
+        if path != "/predict":
+            await _send_json(send, 404, {"error": "not found"})
+            return
+        if method != "POST":
+            await _send_json(send, 405, {"error": "use POST"})
+            return
+
+        body = await _read_body(receive)
+        if body is None:
+            await _send_json(send, 413, {"error": f"body larger than {MAX_BODY_BYTES} bytes"})
+            return
+
+        loop = asyncio.get_running_loop()
+        try:
+            ctx = await loop.run_in_executor(self._decode_pool, _decode, body)
+        except Exception as exc:
+            await _send_json(send, 400, {"error": f"cannot decode image: {exc}"})
+            return
+
+        try:
+            result = await self.batcher.submit(ctx)
+        except Exception as exc:
+            await _send_json(send, 500, {"error": f"{type(exc).__name__}: {exc}"})
+            return
+
+        query = parse_qs(scope.get("query_string", b"").decode())
+        with_mask = query.get("mask", ["0"])[0] in ("1", "true", "yes")
+        await _send_json(send, 200, _to_json(result, with_mask))
+
+
+async def _read_body(receive) -> Optional[bytes]:
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+
+async def _send_json(send, status: int, payload: dict) -> None:
+    await _send(send, status, json.dumps(payload).encode(), b"application/json")
+
+
+async def _send(send, status: int, body: bytes, content_type: bytes) -> None:
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", content_type),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the diagnosis pipeline over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch-size", type=int, default=16)
+    parser.add_argument("--max-wait-ms", type=float, default=10.0)
+    parser.add_argument("--warmup", action="store_true", help="Load all models at startup")
+    parser.add_argument("--no-metrics", action="store_true", help="Do not record stage timings for /metrics")
+    args = parser.parse_args()
+
+    if not args.no_metrics:
+        metrics.enable()
+
+    try:
+        import uvicorn
+    except ImportError as exc:
+        raise SystemExit("The HTTP service needs uvicorn: pip install uvicorn") from exc
+
+    app = InferenceApp(args.max_batch_size, args.max_wait_ms, warmup=args.warmup)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="info")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""
+Stage-pipelined streaming execution for bulk workloads.
+
+Three stages run in their own worker threads, connected by bounded queues:
+
+    decode / preprocess  ->  detection  ->  classification + segmentation
+
+so image N+1 is decoded and detected while image N is being segmented,
+and TensorFlow and PyTorch are busy at the same time. Detection and the
+PyTorch stage each take whatever is queued (up to batch_size) as one
+batch. Results come out in input order and match full_pipeline_batch.
+
+    stream = StreamingPipeline(batch_size=8)
+    for result in stream.imap(paths):
+        ...
+    print(stream.stats())   # per-stage items, busy seconds, occupancy
+"""
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List
+
+from backend import metrics, pipeline
+from utils.preprocessing import PreprocessContext, as_preprocess_context
+
+STAGES = ("decode", "detection", "classify_segment")
+
+_DONE = object()  # end-of-stream marker
+
+
+class _Item:
+    __slots__ = ("ctx", "key", "prob", "result")
+
+    def __init__(self, ctx: PreprocessContext):
+        self.ctx = ctx
+        self.key = None
+        self.prob = None
+        self.result = None
+
+
+class _Failure:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+def _is_end(item) -> bool:
+    return item is _DONE or isinstance(item, _Failure)
+
+
+class StreamingPipeline:
+    """
+    Run the pipeline over a stream of images with overlapping stages.
+
+    Parameters
+    ----------
+    batch_size : int
+        Largest batch passed to detection and to classification +
+        segmentation.
+    queue_depth : int
+        Capacity of each inter-stage queue (images), bounding memory and
+        how far decoding runs ahead.
+    decode_workers : int
+        Threads decoding images inside the first stage.
+    with_overlay : bool
+        Build overlays (off by default for bulk runs; "overlay_image" is
+        then None).
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 8,
+        queue_depth: int = 32,
+        decode_workers: int = 2,
+        with_overlay: bool = False,
+    ):
+        self.batch_size = batch_size
+        self.queue_depth = queue_depth
+        self.decode_workers = decode_workers
+        self.with_overlay = with_overlay
+
+        self._busy: Dict[str, float] = {}
+        self._items: Dict[str, int] = {}
+        self._wall = 0.0
+
+    # ------------------------------------------------------------------
+    # Stats
+    # ------------------------------------------------------------------
+
+    def stats(self) -> Dict[str, dict]:
+        """
+        Per-stage counters of the last (or running) imap() call.
+
+        Returns
+        -------
+        stats : dict
+            stats[stage] = {"items", "busy_seconds", "occupancy"}, where
+            occupancy is the fraction of wall time the stage's workers
+            spent working rather than waiting on a queue; plus
+            stats["wall_seconds"].
+        """
+        wall = self._wall or 1e-9
+        out = {}
+        for stage in STAGES:
+            workers = self.decode_workers if stage == "decode" else 1
+            busy = self._busy.get(stage, 0.0)
+            out[stage] = {
+                "items": self._items.get(stage, 0),
+                "busy_seconds": busy,
+                "occupancy": min(busy / (wall * workers), 1.0),
+            }
+        out["wall_seconds"] = self._wall
+        return out
+
+    def _count(self, stage: str, items: int, seconds: float) -> None:
+        self._items[stage] = self._items.get(stage, 0) + items
+        self._busy[stage] = self._busy.get(stage, 0.0) + seconds
+
+    # ------------------------------------------------------------------
+    # Queue helpers (give up when the run is being torn down)
+    # ------------------------------------------------------------------
+
+    def _put(self, q: queue.Queue, item) -> None:
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q: queue.Queue):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _get_batch(self, q: queue.Queue) -> List:
+        """
+        Block for one item, then take whatever else is already queued.
+        """
+        batch = [self._get(q)]
+        while len(batch) < self.batch_size and not _is_end(batch[-1]):
+            try:
+                batch.append(q.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    # ------------------------------------------------------------------
+    # Stages
+    # ------------------------------------------------------------------
+
+    def _decode_one(self, image) -> tuple:
+        start = time.perf_counter()
+        # Detection inputs are prepared here, in the decode workers (for
+        # deferred JPEGs that is where the pixels get decoded), so they
+        # count as decode time; pipeline.detect then finds them ready
+        with metrics.timed(None, "decode"):
+            if isinstance(image, (str, Path)):
+                ctx = PreprocessContext.from_path(image)
+            else:
+                ctx = as_preprocess_context(image)
+            ctx.detection_input()
+        item = _Item(ctx)
+
+        item.key, item.result = pipeline.cached_result(ctx, self.with_overlay)
+        return item, time.perf_counter() - start
+
+    def _decode_stage(self, images: Iterable, out: queue.Queue) -> None:
+        try:
+            with ThreadPoolExecutor(self.decode_workers, thread_name_prefix="decode") as pool:
+                pending = deque()
+                for image in images:
+                    if self._stop.is_set():
+                        return
+                    pending.append(pool.submit(self._decode_one, image))
+                    if len(pending) >= self.queue_depth:
+                        self._emit_decoded(pending.popleft(), out)
+                while pending:
+                    self._emit_decoded(pending.popleft(), out)
+            self._put(out, _DONE)
+        except BaseException as exc:
+            self._put(out, _Failure(exc))
+
+    def _emit_decoded(self, future, out: queue.Queue) -> None:
+        item, seconds = future.result()
+        self._count("decode", 1, seconds)
+        self._put(out, item)
+
+    def _detection_stage(self, inbox: queue.Queue, out: queue.Queue) -> None:
+        try:
+            while True:
+                batch = self._get_batch(inbox)
+                end = batch[-1] if _is_end(batch[-1]) else None
+                items = batch[:-1] if end is not None else batch
+
+                start = time.perf_counter()
+                todo = [item for item in items if item.result is None]
+                if todo:
+                    probs = pipeline.detect([item.ctx for item in todo])
+                    for item, prob in zip(todo, probs):
+                        item.prob = prob
+                        if not pipeline.is_tumor(prob):
+                            item.result = pipeline.negative_result(item.ctx, prob, self.with_overlay)
+                            pipeline.cache_result(item.key, item.result)
+                        else:
+                            # Run on the detection thread so the next
+                            # stage starts from ready model inputs
+                            item.ctx.segmentation_input()
+                self._count("detection", len(todo), time.perf_counter() - start)
+
+                for item in items:
+                    self._put(out, item)
+                if end is not None:
+                    self._put(out, end)
+                    return
+        except BaseException as exc:
+            self._put(out, _Failure(exc))
+
+    def _classify_segment_stage(self, inbox: queue.Queue, out: queue.Queue) -> None:
+        try:
+            while True:
+                batch = self._get_batch(inbox)
+                end = batch[-1] if _is_end(batch[-1]) else None
+                items = batch[:-1] if end is not None else batch
+
+                start = time.perf_counter()
+                todo = [item for item in items if item.result is None]
+                if todo:
+                    predictions, masks = pipeline.classify_and_segment([item.ctx for item in todo])
+                    for item, (label, probs), mask in zip(todo, predictions, masks):
+                        item.result = pipeline.positive_result(
+                            item.ctx, item.prob, label, probs, mask, self.with_overlay
+                        )
+                        pipeline.cache_result(item.key, item.result)
+                self._count("classify_segment", len(todo), time.perf_counter() - start)
+
+                for item in items:
+                    self._put(out, item.result)
+                if end is not None:
+                    self._put(out, end)
+                    return
+        except BaseException as exc:
+            self._put(out, _Failure(exc))
+
+    # ------------------------------------------------------------------
+    # Driver
+    # ------------------------------------------------------------------
+
+    def imap(self, images: Iterable[pipeline.ImageInput]) -> Iterator[dict]:
+        """
+        Yield one result per image, in input order, as soon as it is ready.
+
+        Images may be paths, RGB arrays or PreprocessContexts, as for
+        full_pipeline_batch. An exception in any stage stops the stream
+        and is re-raised here.
+        """
+        self._busy, self._items = {}, {}
+        self._stop = threading.Event()
+        decoded = queue.Queue(self.queue_depth)
+        detected = queue.Queue(self.queue_depth)
+        results = queue.Queue(self.queue_depth)
+
+        workers = [
+            threading.Thread(target=self._decode_stage, args=(images, decoded), name="stream-decode"),
+            threading.Thread(target=self._detection_stage, args=(decoded, detected), name="stream-detection"),
+            threading.Thread(
+                target=self._classify_segment_stage, args=(detected, results), name="stream-classify-segment"
+            ),
+        ]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+
+        try:
+            while True:
+                result = self._get(results)
+                self._wall = time.perf_counter() - start
+                if result is _DONE:
+                    return
+                if isinstance(result, _Failure):
+                    raise result.exc
+                yield result
+        finally:
+            self._wall = time.perf_counter() - start
+            self._stop.set()
+            for worker in workers:
+                worker.join()
+
+
+def stream_pipeline(images: Iterable[pipeline.ImageInput], **options) -> Iterator[dict]:
+    """
+    Shorthand for StreamingPipeline(**options).imap(images).
+    """
+    return StreamingPipeline(**options).imap(images)
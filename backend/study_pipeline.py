@@ -0,0 +1,277 @@
+"""
+Per-study inference over MRI volumes (DICOM series, NIfTI).
+
+Most slices of a study show no tumor, so studies are scheduled in two
+passes instead of pushing every slice through all three models:
+
+1. Detection over every slice of every study, in large batches packed
+   across study boundaries.
+2. Classification and segmentation only on slices at or above
+   TUMOR_THRESHOLD plus `neighborhood` slices on either side of each
+   (tumor edges on adjacent slices often score just under the threshold
+   but still add to the segmented volume), again packed into full
+   batches across studies.
+
+Slices are read and windowed lazily (utils.volumes), so only one batch
+of them is held at a time; the slices selected in pass 2 are read again.
+The per-slice results are aggregated per study:
+
+    summaries = run_studies([open_volume("studies/patient1/"), open_volume("scan.nii.gz")])
+    summaries[0]["detection_curve"]     # tumor probability per slice
+    summaries[0]["tumor_volume_ml"]     # segmented voxels x voxel volume
+
+Run from the project root (needs pydicom and / or nibabel):
+
+    python -m backend.study_pipeline studies/patient1/ scans/patient2.nii.gz --neighborhood 1 --json studies.json
+"""
+import argparse
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from backend import pipeline
+from utils.preprocessing import PreprocessContext
+from utils.volumes import Volume, Window, open_volume
+
+
+def _batches(items: Iterable, size: int) -> Iterator[List]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def slice_record(
+    index: int,
+    detection_prob: float,
+    prediction: Optional[tuple] = None,
+    mask: Optional[np.ndarray] = None,
+) -> dict:
+    """
+    The per-slice fields kept in a study summary. `prediction` (label,
+    class probabilities) and `mask` are given for slices that went through
+    classification and segmentation.
+    """
+    label, class_probs = prediction or (None, None)
+    return {
+        "index": index,
+        "detection_prob": float(detection_prob),
+        "has_tumor": pipeline.is_tumor(detection_prob),
+        "analyzed": prediction is not None,
+        "predicted_label": label,
+        "class_probs": class_probs,
+        "tumor_pixels": int(np.count_nonzero(mask)) if mask is not None else 0,
+    }
+
+
+def gate(probs: np.ndarray, neighborhood: int = 1) -> np.ndarray:
+    """
+    Slices to classify and segment: those at or above TUMOR_THRESHOLD and
+    up to `neighborhood` slices before and after each of them.
+    """
+    positive = np.array([pipeline.is_tumor(p) for p in probs], dtype=bool)
+    selected = positive.copy()
+    for shift in range(1, neighborhood + 1):
+        selected[shift:] |= positive[:-shift]
+        selected[:-shift] |= positive[shift:]
+    return selected
+
+
+def summarize(volume: Volume, slices: List[dict]) -> dict:
+    """
+    Aggregate per-slice records (in slice order) into a study summary.
+
+    The study's class probabilities are the mean over tumor-positive
+    slices, weighted by their segmented area (plus one, so slices with an
+    empty mask still count). The tumor volume counts the masks of every
+    analyzed slice, neighbors included.
+    """
+    positive = [s for s in slices if s["has_tumor"] and s["class_probs"]]
+    voxels = sum(s["tumor_pixels"] for s in slices)
+
+    label, class_probs = None, None
+    if positive:
+        names = list(positive[0]["class_probs"])
+        weights = np.array([s["tumor_pixels"] for s in positive], dtype=np.float64) + 1.0
+        probs = np.array([[s["class_probs"][n] for n in names] for s in positive])
+        mean = weights @ probs / weights.sum()
+        class_probs = {n: float(p) for n, p in zip(names, mean)}
+        label = names[int(np.argmax(mean))]
+
+    return {
+        "study": volume.name,
+        "n_slices": len(volume),
+        "spacing_mm": list(volume.spacing),
+        "has_tumor": any(s["has_tumor"] for s in slices),
+        "predicted_label": label,
+        "class_probs": class_probs,
+        "detection_curve": [s["detection_prob"] for s in slices],
+        "positive_slices": [s["index"] for s in slices if s["has_tumor"]],
+        "analyzed_slices": [s["index"] for s in slices if s["analyzed"]],
+        "tumor_voxels": int(voxels),
+        "tumor_volume_ml": voxels * volume.voxel_mm3 / 1000.0,
+        "slices": slices,
+    }
+
+
+# ----------------------------------------------------------------------
+# Scheduling
+# ----------------------------------------------------------------------
+
+@dataclass
+class _Study:
+    volume: Volume
+    window: Window
+    probs: np.ndarray
+    predictions: Dict[int, tuple] = field(default_factory=dict)
+    masks: Dict[int, np.ndarray] = field(default_factory=dict)
+
+
+def _contexts(studies: List[_Study], selected: Optional[List[np.ndarray]] = None):
+    # (study number, slice index, context) over all studies in order
+    for s, study in enumerate(studies):
+        indices = None if selected is None else np.flatnonzero(selected[s]).tolist()
+        for index, image in study.volume.slices(study.window, indices):
+            yield s, index, PreprocessContext(image)
+
+
+def _detect(studies: List[_Study], batch_size: int, timings: Optional[Dict[str, float]]) -> None:
+    for batch in _batches(_contexts(studies), batch_size):
+        probs = pipeline.detect([ctx for _, _, ctx in batch], timings)
+        for (s, index, _), prob in zip(batch, probs):
+            studies[s].probs[index] = float(prob)
+
+
+def _analyze(
+    studies: List[_Study],
+    selected: List[np.ndarray],
+    batch_size: int,
+    timings: Optional[Dict[str, float]],
+) -> None:
+    for batch in _batches(_contexts(studies, selected), batch_size):
+        predictions, masks = pipeline.classify_and_segment([ctx for _, _, ctx in batch], timings)
+        for (s, index, _), prediction, mask in zip(batch, predictions, masks):
+            studies[s].predictions[index] = prediction
+            studies[s].masks[index] = mask
+
+
+def run_studies(
+    volumes: Sequence[Volume],
+    batch_size: int = 16,
+    detection_batch_size: int = 64,
+    neighborhood: int = 1,
+    window: Optional[Window] = None,
+    keep_masks: bool = False,
+    timings: Optional[Dict[str, float]] = None,
+) -> List[dict]:
+    """
+    Run the detection-gated pipeline over several studies at once.
+
+    Parameters
+    ----------
+    volumes : sequence of Volume
+        From utils.volumes.open_volume.
+    batch_size : int
+        Slices per classification / segmentation batch.
+    detection_batch_size : int
+        Slices per detection batch.
+    neighborhood : int
+        Also classify and segment this many slices on either side of
+        every tumor-positive slice (0: positive slices only).
+    window : Window, optional
+        Intensity window for every study, default each volume's
+        default_window().
+    keep_masks : bool
+        Also return the (H, W) bool masks of analyzed slices under
+        summary["masks"] (index -> mask).
+    timings : dict, optional
+        If given, wall seconds per stage ("preprocess", "detection",
+        "classification", "segmentation") are added to it.
+
+    Returns
+    -------
+    summaries : list of dict
+        One summarize() result per volume, in input order.
+    """
+    studies = [
+        _Study(volume, window or volume.default_window(), np.zeros(len(volume), dtype=np.float32))
+        for volume in volumes
+    ]
+
+    _detect(studies, detection_batch_size, timings)
+    selected = [gate(study.probs, neighborhood) for study in studies]
+    _analyze(studies, selected, batch_size, timings)
+
+    summaries = []
+    for study in studies:
+        records = [
+            slice_record(i, prob, study.predictions.get(i), study.masks.get(i))
+            for i, prob in enumerate(study.probs)
+        ]
+        summary = summarize(study.volume, records)
+        if keep_masks:
+            summary["masks"] = study.masks
+        summaries.append(summary)
+    return summaries
+
+
+def run_study(volume: Volume, **kwargs) -> dict:
+    """
+    run_studies for a single volume.
+    """
+    return run_studies([volume], **kwargs)[0]
+
+
+def _parse_window(values: Optional[List[float]]) -> Optional[Window]:
+    return Window(*values) if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the diagnosis pipeline over MRI volumes.")
+    parser.add_argument("studies", nargs="+", help="DICOM directories / files or NIfTI files")
+    parser.add_argument("--batch-size", type=int, default=16, help="Classification / segmentation batch size")
+    parser.add_argument("--detection-batch-size", type=int, default=64)
+    parser.add_argument("--neighborhood", type=int, default=1,
+                        help="Also analyze this many slices around each positive slice")
+    parser.add_argument("--window", type=float, nargs=2, metavar=("CENTER", "WIDTH"),
+                        help="Intensity window (default: DICOM tags or percentiles)")
+    parser.add_argument("--json", help="Write the study summaries to this file")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    timings: Dict[str, float] = {}
+    summaries = run_studies(
+        [open_volume(path) for path in args.studies],
+        batch_size=args.batch_size,
+        detection_batch_size=args.detection_batch_size,
+        neighborhood=args.neighborhood,
+        window=_parse_window(args.window),
+        timings=timings,
+    )
+    elapsed = time.perf_counter() - start
+
+    for summary in summaries:
+        print(
+            f"{summary['study'][-40:]:>40}  {summary['n_slices']:4d} slices  "
+            f"{len(summary['positive_slices']):4d} positive  {len(summary['analyzed_slices']):4d} analyzed  "
+            f"{summary['predicted_label'] or '-':>10}  {summary['tumor_volume_ml']:8.2f} ml"
+        )
+    n_slices = sum(s["n_slices"] for s in summaries)
+    n_analyzed = sum(len(s["analyzed_slices"]) for s in summaries)
+    print(f"\n{n_slices} slices, {n_analyzed} classified + segmented, {elapsed:.1f}s")
+    print("stage seconds: " + ", ".join(f"{stage} {seconds:.2f}" for stage, seconds in timings.items()))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summaries, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
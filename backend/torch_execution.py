@@ -0,0 +1,125 @@
+"""
+Opt-in execution modes for the PyTorch forward passes (classifier, UNet).
+
+- channels_last: models and inputs in NHWC memory layout, which oneDNN
+  convolutions on x86 prefer (BTD_CHANNELS_LAST=1)
+- bf16:          bfloat16 autocast, on CPUs with native bf16 support
+                 (AVX512-BF16 / AMX) or bf16-capable GPUs (BTD_BF16=1)
+
+Both are off by default. bf16 silently stays off where the hardware
+does not support it, and is switched off (with a warning) if a forward
+pass fails under autocast. INT8 models ignore both. Compare the modes
+with `python -m benchmarks.torch_modes`.
+"""
+import os
+import warnings
+import weakref
+from typing import Optional
+
+_channels_last = os.environ.get("BTD_CHANNELS_LAST", "0") == "1"
+_bf16 = os.environ.get("BTD_BF16", "0") == "1"
+_bf16_failed = False
+
+# Models already converted to channels_last (converted once, in place)
+_converted = weakref.WeakSet()
+
+
+def set_modes(channels_last: Optional[bool] = None, bf16: Optional[bool] = None) -> None:
+    """
+    Turn execution modes on or off; None leaves a mode unchanged.
+    """
+    global _channels_last, _bf16, _bf16_failed
+    if channels_last is not None:
+        _channels_last = channels_last
+    if bf16 is not None:
+        _bf16 = bf16
+        _bf16_failed = False
+
+
+def channels_last() -> bool:
+    return _channels_last
+
+
+def bf16_supported(device_type: str = "cpu") -> bool:
+    import torch
+
+    if device_type == "cuda":
+        return torch.cuda.is_available() and torch.cuda.is_bf16_supported()
+    try:
+        return torch.backends.mkldnn.is_available() and torch.ops.mkldnn._is_mkldnn_bf16_supported()
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def _join(channels_last: bool, bf16: bool) -> str:
+    modes = (["channels_last"] if channels_last else []) + (["bf16"] if bf16 else [])
+    return "+".join(modes) or "default"
+
+
+def requested() -> str:
+    """
+    Modes as configured, e.g. "channels_last+bf16" or "default". Used in
+    result-cache fingerprints: unlike describe() it does not import torch
+    and does not change when bf16 is dropped at runtime.
+    """
+    return _join(_channels_last, _bf16)
+
+
+def describe() -> str:
+    """
+    Modes actually in effect, e.g. "channels_last" when bf16 is requested
+    but unsupported or has failed.
+    """
+    return _join(_channels_last, _bf16 and not _bf16_failed and bf16_supported())
+
+
+def _prepare(model) -> None:
+    import torch
+
+    # Scripted models (backend.compiled_models) have their layout baked in
+    # when they are compiled
+    if isinstance(model, torch.jit.ScriptModule) or model in _converted:
+        return
+    model.to(memory_format=torch.channels_last)
+    _converted.add(model)
+
+
+def forward(model, x, quantized: bool = False):
+    """
+    Run model(x) under the active execution modes (call it inside
+    torch.no_grad()).
+
+    Parameters
+    ----------
+    model : torch.nn.Module
+        Eager or compiled float model (or an INT8 model, see `quantized`).
+    x : torch.Tensor
+        Input batch (N, C, H, W) on the model's device.
+    quantized : bool
+        The model is INT8; run it as is.
+
+    Returns
+    -------
+    out : torch.Tensor
+        Contiguous float32 output.
+    """
+    global _bf16_failed
+    import torch
+
+    if quantized:
+        return model(x)
+
+    if _channels_last:
+        _prepare(model)
+        x = x.contiguous(memory_format=torch.channels_last)
+
+    device_type = x.device.type
+    if _bf16 and not _bf16_failed and bf16_supported(device_type):
+        try:
+            with torch.autocast(device_type, dtype=torch.bfloat16):
+                return model(x).float().contiguous()
+        except RuntimeError as exc:
+            _bf16_failed = True
+            warnings.warn(f"bfloat16 autocast failed, falling back to float32: {exc}")
+
+    return model(x).contiguous()
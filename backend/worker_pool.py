@@ -0,0 +1,257 @@
+"""
+Multi-process inference worker pool with per-worker CPU thread budgets.
+
+TensorFlow and PyTorch each size their intra-/inter-op thread pools to all
+cores, so two overlapping requests in one process oversubscribe the CPU.
+The pool instead runs N pipeline workers as separate processes, each
+pinned to its own slice of cores with explicit torch and TF thread counts
+matching that slice.
+
+    with WorkerPool(n_workers=4) as pool:
+        for path, result in zip(paths, pool.imap(paths)):
+            ...
+"""
+import itertools
+import multiprocessing as mp
+import os
+import queue
+from typing import Iterable, Iterator, List, Optional, Sequence
+
+from backend.pipeline import ImageInput
+
+
+def available_cores() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def split_cores(cores: Sequence[int], n_workers: int) -> List[List[int]]:
+    """
+    Split cores into n_workers contiguous slices (sizes differ by at most 1).
+    With more workers than cores, cores are shared round-robin.
+    """
+    if n_workers > len(cores):
+        return [[cores[i % len(cores)]] for i in range(n_workers)]
+    base, extra = divmod(len(cores), n_workers)
+    slices, start = [], 0
+    for i in range(n_workers):
+        size = base + (1 if i < extra else 0)
+        slices.append(list(cores[start:start + size]))
+        start += size
+    return slices
+
+
+def configure_threads(threads: int, cores: Optional[Sequence[int]] = None) -> None:
+    """
+    Pin this process to `cores` and cap torch / TF / OpenMP thread pools.
+
+    Must run before either framework executes anything (TF refuses to
+    change its thread pools once its runtime is initialized).
+    """
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "BTD_ONNX_THREADS"):
+        os.environ[var] = str(threads)
+
+    from backend import onnx_runtime
+
+    if onnx_runtime.get_backend() == "onnx":
+        # ONNX Runtime sessions read BTD_ONNX_THREADS; don't import the
+        # frameworks just to configure them
+        return
+
+    import torch
+
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Already set (e.g. configure_threads called twice)
+        pass
+
+    import tensorflow as tf
+
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    except RuntimeError:
+        pass
+
+
+def _strip(result: dict) -> dict:
+    # Negative results carry the input image as their overlay; don't ship
+    # full images back over the pipe
+    result = dict(result)
+    result["overlay_image"] = None
+    return result
+
+
+def _run_task(items) -> List[dict]:
+    from backend.pipeline import full_pipeline_batch
+
+    try:
+        return [_strip(r) for r in full_pipeline_batch(items, with_overlay=False)]
+    except Exception as exc:
+        if len(items) == 1:
+            return [{"error": f"{type(exc).__name__}: {exc}"}]
+    # Rerun image by image, so only the failing images get error records
+    return [record for item in items for record in _run_task([item])]
+
+
+def _worker_main(cores, threads, warmup, tasks, results):
+    configure_threads(threads, cores)
+
+    from backend import onnx_runtime
+    from backend.model_registry import registry
+
+    if warmup:
+        registry.warmup(onnx_runtime.active_models())
+    results.put(("ready", os.getpid()))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        task_id, items = task
+        results.put((task_id, _run_task(items)))
+
+
+class WorkerPool:
+    """
+    Run full_pipeline_batch in N worker processes.
+
+    Parameters
+    ----------
+    n_workers : int
+        Number of worker processes.
+    threads_per_worker : int, optional
+        Torch / TF intra-op threads per worker. Defaults to the size of the
+        worker's core slice.
+    pin_cores : bool
+        Pin each worker to its own slice of the available cores.
+    batch_size : int
+        Images per task sent to a worker.
+    max_inflight : int, optional
+        Tasks dispatched but not yet returned. Dispatch blocks past this
+        (backpressure). Defaults to 2 per worker.
+    warmup : bool
+        Load all models in every worker before returning from __init__.
+    """
+
+    def __init__(
+        self,
+        n_workers: int,
+        threads_per_worker: Optional[int] = None,
+        pin_cores: bool = True,
+        batch_size: int = 8,
+        max_inflight: Optional[int] = None,
+        warmup: bool = True,
+    ):
+        self.n_workers = n_workers
+        self.batch_size = batch_size
+        self.max_inflight = max_inflight or 2 * n_workers
+        # Task ids are unique over the pool's lifetime, so results an
+        # earlier imap call never collected can't be taken for this one's
+        self._task_ids = itertools.count()
+
+        ctx = mp.get_context("spawn")  # never fork a process holding TF / torch state
+        self._tasks = ctx.Queue()
+        self._results = ctx.Queue()
+        self._procs = []
+
+        core_slices = split_cores(available_cores(), n_workers)
+        for cores in core_slices:
+            threads = threads_per_worker or len(cores)
+            proc = ctx.Process(
+                target=_worker_main,
+                args=(cores if pin_cores else None, threads, warmup, self._tasks, self._results),
+                daemon=True,
+            )
+            proc.start()
+            self._procs.append(proc)
+
+        for _ in range(n_workers):
+            self._get_result()
+
+    def _get_result(self):
+        while True:
+            try:
+                return self._results.get(timeout=1.0)
+            except queue.Empty:
+                dead = [p for p in self._procs if not p.is_alive()]
+                if dead:
+                    self.close()
+                    raise RuntimeError(f"Worker process {dead[0].pid} exited unexpectedly")
+
+    def imap(self, images: Iterable[ImageInput]) -> Iterator[dict]:
+        """
+        Yield one result per image, in input order. Images the pipeline
+        failed on yield {"error": "<type>: <message>"} instead, and the run
+        goes on.
+
+        Images (paths preferred, so decoding also happens in the workers)
+        are sent in tasks of batch_size; at most max_inflight tasks are
+        outstanding at any time.
+        """
+        pending = {}      # task_id -> results, for out-of-order completions
+        task_ids = []     # this call's tasks, in dispatch order
+        outstanding = set()
+        next_yield = 0
+
+        def chunks():
+            chunk = []
+            for img in images:
+                chunk.append(img)
+                if len(chunk) >= self.batch_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+
+        def collect_one():
+            task_id, out = self._get_result()
+            while task_id not in outstanding:
+                # Left over from an earlier call whose consumer stopped
+                # before collecting all its results: not ours, drop it
+                task_id, out = self._get_result()
+            outstanding.discard(task_id)
+            pending[task_id] = out
+
+        for chunk in chunks():
+            while len(outstanding) >= self.max_inflight:
+                collect_one()
+            task_id = next(self._task_ids)
+            self._tasks.put((task_id, chunk))
+            task_ids.append(task_id)
+            outstanding.add(task_id)
+
+            while next_yield < len(task_ids) and task_ids[next_yield] in pending:
+                yield from pending.pop(task_ids[next_yield])
+                next_yield += 1
+
+        while next_yield < len(task_ids):
+            while task_ids[next_yield] not in pending:
+                collect_one()
+            yield from pending.pop(task_ids[next_yield])
+            next_yield += 1
+
+    def map(self, images: Iterable[ImageInput]) -> List[dict]:
+        return list(self.imap(images))
+
+    def close(self) -> None:
+        for proc in self._procs:
+            if proc.is_alive():
+                self._tasks.put(None)
+        for proc in self._procs:
+            proc.join(timeout=10)
+            if proc.is_alive():
+                proc.terminate()
+        self._procs = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,101 @@
+"""
+Drift report: class probabilities and latency under each classification
+input-resolution policy, compared with the native resolution.
+
+Run from the project root:
+
+    python -m benchmarks.classification_drift --data-dir data_samples \
+        --policies max_side:1024 max_side:512 fixed:224 --json drift.json
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from backend.classification_inference import CLASS_NAMES, classify_batch
+from utils.preprocessing import PreprocessContext, ResolutionPolicy
+
+VALID_EXTS = {".png", ".jpg", ".jpeg"}
+
+
+def _list_images(data_dir: str):
+    files = [
+        os.path.join(data_dir, f)
+        for f in sorted(os.listdir(data_dir))
+        if os.path.splitext(f)[1].lower() in VALID_EXTS
+    ]
+    if not files:
+        raise SystemExit(f"No images found in {data_dir}")
+    return files
+
+
+def _probs_and_latency(ctx: PreprocessContext, policy: ResolutionPolicy):
+    start = time.perf_counter()
+    x = ctx.classification_input(policy)
+    probs = classify_batch(x)[0]
+    return probs, (time.perf_counter() - start) * 1000.0, x.shape[2:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--data-dir", default="data_samples")
+    parser.add_argument(
+        "--policies", nargs="+", default=["max_side:1024", "max_side:512", "fixed:224"]
+    )
+    parser.add_argument("--json", help="Optional path to write the full report")
+    args = parser.parse_args()
+
+    native = ResolutionPolicy()
+    policies = [ResolutionPolicy.parse(p) for p in args.policies]
+
+    per_image = []
+    for path in _list_images(args.data_dir):
+        ctx = PreprocessContext.from_path(path)
+        ref_probs, ref_ms, ref_shape = _probs_and_latency(ctx, native)
+        entry = {
+            "image": path,
+            "native": {"shape": list(ref_shape), "ms": ref_ms, "probs": ref_probs.tolist()},
+        }
+        for policy in policies:
+            probs, ms, shape = _probs_and_latency(ctx, policy)
+            entry[str(policy)] = {
+                "shape": list(shape),
+                "ms": ms,
+                "probs": probs.tolist(),
+                "max_abs_diff": float(np.abs(probs - ref_probs).max()),
+                "same_label": bool(np.argmax(probs) == np.argmax(ref_probs)),
+            }
+        per_image.append(entry)
+
+    summary = {}
+    print(f"{'policy':>14} {'mean ms':>9} {'max |dp|':>9} {'mean |dp|':>10} {'label agree':>12}")
+    ref_ms = np.mean([e["native"]["ms"] for e in per_image])
+    print(f"{'native':>14} {ref_ms:>9.2f} {'-':>9} {'-':>10} {'-':>12}")
+    for policy in policies:
+        rows = [e[str(policy)] for e in per_image]
+        diffs = np.array([r["max_abs_diff"] for r in rows])
+        summary[str(policy)] = {
+            "mean_ms": float(np.mean([r["ms"] for r in rows])),
+            "max_abs_diff": float(diffs.max()),
+            "mean_abs_diff": float(diffs.mean()),
+            "label_agreement": float(np.mean([r["same_label"] for r in rows])),
+        }
+        s = summary[str(policy)]
+        print(
+            f"{str(policy):>14} {s['mean_ms']:>9.2f} {s['max_abs_diff']:>9.4f} "
+            f"{s['mean_abs_diff']:>10.4f} {s['label_agreement']:>11.0%}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {"classes": CLASS_NAMES, "summary": summary, "images": per_image},
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
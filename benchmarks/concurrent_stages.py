@@ -0,0 +1,75 @@
+"""
+Single-request latency on tumor-positive scans: classification and
+segmentation one after the other vs. concurrently.
+
+Every configuration runs full_pipeline_from_array on each tumor-positive
+sample (decoded once up front), with models warmed first. Concurrent runs
+use each of the given combined thread budgets.
+
+Run from the project root:
+
+    python -m benchmarks.concurrent_stages --data-dir data_samples --threads 2 4 8 --repeats 5
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from backend import pipeline
+from backend.model_registry import registry
+from backend.onnx_runtime import active_models
+from utils.preprocessing import load_image_from_path
+
+VALID_EXTS = {".png", ".jpg", ".jpeg"}
+
+
+def _latencies(images, repeats: int):
+    samples = []
+    for img in images:
+        pipeline.full_pipeline_from_array(img)  # warm-up
+        for _ in range(repeats):
+            start = time.perf_counter()
+            pipeline.full_pipeline_from_array(img)
+            samples.append(time.perf_counter() - start)
+    return np.array(samples) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--data-dir", default="data_samples")
+    parser.add_argument("--threads", type=int, nargs="+", default=[os.cpu_count() or 1],
+                        help="Combined thread budgets to try in concurrent mode")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    pipeline.disable_result_cache()
+    pipeline.disable_concurrent_stages()
+    registry.warmup(active_models())
+
+    images = []
+    for f in sorted(os.listdir(args.data_dir)):
+        if os.path.splitext(f)[1].lower() in VALID_EXTS:
+            img = load_image_from_path(os.path.join(args.data_dir, f))
+            if pipeline.full_pipeline_from_array(img, with_overlay=False)["has_tumor"]:
+                images.append(img)
+    if not images:
+        raise SystemExit(f"No tumor-positive images found in {args.data_dir}")
+
+    print(f"{len(images)} tumor-positive images, {args.repeats} runs each")
+    print(f"{'mode':>22} {'p50 ms':>9} {'mean ms':>9} {'speedup':>8}")
+
+    serial = _latencies(images, args.repeats)
+    base = np.median(serial)
+    print(f"{'serial':>22} {base:>9.1f} {serial.mean():>9.1f} {1.0:>7.2f}x")
+
+    for threads in args.threads:
+        pipeline.enable_concurrent_stages(threads)
+        lat = _latencies(images, args.repeats)
+        label = f"concurrent ({threads} thr)"
+        print(f"{label:>22} {np.median(lat):>9.1f} {lat.mean():>9.1f} {base / np.median(lat):>7.2f}x")
+    pipeline.disable_concurrent_stages()
+
+
+if __name__ == "__main__":
+    main()
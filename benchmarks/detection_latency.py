@@ -0,0 +1,57 @@
+"""
+Micro-benchmark: per-image detection latency, Keras predict() vs DetectionEngine.
+
+Run from the project root:
+
+    python -m benchmarks.detection_latency --repeats 50
+"""
+import argparse
+import time
+
+import numpy as np
+
+from backend.detection_inference import IMAGE_SIZE
+from backend.model_registry import registry
+
+
+def _time_per_image(fn, batch: np.ndarray, repeats: int) -> float:
+    """
+    Median wall time per image in milliseconds over `repeats` calls.
+    """
+    fn(batch)  # warm-up
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(batch)
+        samples.append(time.perf_counter() - start)
+    return float(np.median(samples)) / len(batch) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--repeats", type=int, default=30)
+    args = parser.parse_args()
+
+    engine = registry.get("detection")
+    model = engine.model
+
+    rng = np.random.default_rng(0)
+
+    print(f"{'batch':>6} {'predict() ms/img':>18} {'engine ms/img':>15} {'speedup':>8}")
+    for n in args.batch_sizes:
+        batch = rng.random((n, IMAGE_SIZE, IMAGE_SIZE, 1), dtype=np.float32)
+
+        before = _time_per_image(lambda x: model.predict(x, verbose=0), batch, args.repeats)
+        after = _time_per_image(engine.predict, batch, args.repeats)
+
+        # Both paths must agree before the numbers mean anything
+        np.testing.assert_allclose(
+            engine.predict(batch), model.predict(batch, verbose=0), rtol=1e-5, atol=1e-6
+        )
+
+        print(f"{n:>6} {before:>18.3f} {after:>15.3f} {before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Decode time and prediction drift of reduced-resolution JPEG decoding.
+
+Every JPEG is run through the pipeline (with_overlay=False) twice: from a
+fully decoded context and from a deferred one (PreprocessContext.from_path
+with reduced=True, as with BTD_FAST_DECODE=1). Reports the time from file
+to detection input for both, and the change in detection probability,
+predicted class and mask Dice between them.
+
+Run from the project root:
+
+    python -m benchmarks.fast_decode --data-dir data_samples --repeats 5 --json fast_decode.json
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from backend import pipeline
+from backend.model_registry import registry
+from backend.onnx_runtime import active_models
+from backend.quantization import mask_dice
+from utils.preprocessing import PreprocessContext
+
+JPEG_EXTS = {".jpg", ".jpeg"}
+
+
+def _decode_ms(path: str, reduced: bool, repeats: int) -> float:
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        PreprocessContext.from_path(path, reduced=reduced).detection_input()
+        samples.append(time.perf_counter() - start)
+    return float(np.median(samples)) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--data-dir", default="data_samples")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    paths = [
+        os.path.join(args.data_dir, f)
+        for f in sorted(os.listdir(args.data_dir))
+        if os.path.splitext(f)[1].lower() in JPEG_EXTS
+    ]
+    if not paths:
+        raise SystemExit(f"No JPEG images found in {args.data_dir}")
+
+    pipeline.disable_result_cache()
+    registry.warmup(active_models())
+
+    print(f"{'image':>30} {'size':>11} {'full ms':>8} {'fast ms':>8} {'prob drift':>11} {'label':>6} {'dice':>7}")
+    rows = []
+    for path in paths:
+        full, fast = (
+            pipeline.full_pipeline_batch([PreprocessContext.from_path(path, reduced=r)], with_overlay=False)[0]
+            for r in (False, True)
+        )
+        h, w = PreprocessContext.from_path(path, reduced=True).size
+        row = {
+            "image": os.path.basename(path),
+            "size": [h, w],
+            "full_ms": _decode_ms(path, False, args.repeats),
+            "fast_ms": _decode_ms(path, True, args.repeats),
+            "prob_drift": abs(full["detection_prob"] - fast["detection_prob"]),
+            "same_decision": full["has_tumor"] == fast["has_tumor"],
+            "same_label": full["predicted_label"] == fast["predicted_label"],
+            "dice": None,
+        }
+        if full["has_tumor"] and fast["has_tumor"]:
+            row["dice"] = mask_dice(full["segmentation_mask"], fast["segmentation_mask"])
+        rows.append(row)
+        dice = "-" if row["dice"] is None else f"{row['dice']:.4f}"
+        print(
+            f"{row['image'][-30:]:>30} {f'{w}x{h}':>11} {row['full_ms']:>8.1f} {row['fast_ms']:>8.1f} "
+            f"{row['prob_drift']:>11.5f} {'same' if row['same_label'] else 'DIFF':>6} {dice:>7}"
+        )
+
+    full_ms = sum(r["full_ms"] for r in rows)
+    fast_ms = sum(r["fast_ms"] for r in rows)
+    print(f"\ndecode + detection input: {full_ms:.1f} ms -> {fast_ms:.1f} ms ({full_ms / fast_ms:.1f}x)")
+    print(f"detection decision changed on {sum(not r['same_decision'] for r in rows)} of {len(rows)} images")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
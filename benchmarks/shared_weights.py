@@ -0,0 +1,112 @@
+"""
+Memory per worker process with torch.load vs. memory-mapped checkpoints.
+
+For each worker count, that many processes load the classifier and the
+UNet (eager models, BTD_COMPILED=0), run one forward pass each so every
+weight page is touched, and report RSS and PSS (proportional set size:
+shared pages are split between the processes mapping them) while all of
+them are alive. The PSS added per extra worker is the memory a node
+really pays for each one. Linux only (reads /proc/self/smaps_rollup).
+
+Convert the checkpoints first (python -m backend.checkpoints), then run
+from the project root:
+
+    python -m benchmarks.shared_weights --workers 1 2 4 --json shared_weights.json
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+
+MODES = {"torch.load": "0", "mmap": "1"}
+
+
+def _memory_mb() -> dict:
+    out = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss"):
+                out[key.lower()] = int(rest.split()[0]) / 1024.0  # kB
+    return out
+
+
+def _worker(mmap_flag: str, loaded, release, results) -> None:
+    os.environ["BTD_COMPILED"] = "0"
+    os.environ["BTD_MMAP_WEIGHTS"] = mmap_flag
+
+    import torch
+
+    from backend import classification_inference, segmentation_inference  # noqa: F401  (registers loaders)
+    from backend.model_registry import registry
+
+    torch.set_num_threads(1)
+    with torch.no_grad():
+        registry.get("classification")(torch.zeros(1, 1, 224, 224))
+        registry.get("segmentation")(torch.zeros(1, 1, 224, 224))
+
+    loaded.wait()  # everyone is loaded: shared pages are now split n ways
+    results.put(_memory_mb())
+    release.wait()
+
+
+def measure(mmap_flag: str, n_workers: int) -> dict:
+    """
+    Per-process RSS / PSS of n_workers processes alive at the same time.
+    """
+    ctx = mp.get_context("spawn")
+    loaded = ctx.Barrier(n_workers + 1)
+    release = ctx.Event()
+    results = ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(mmap_flag, loaded, release, results)) for _ in range(n_workers)]
+    for p in procs:
+        p.start()
+    try:
+        loaded.wait()
+        rows = [results.get() for _ in range(n_workers)]
+    finally:
+        release.set()
+        for p in procs:
+            p.join()
+    return {
+        "workers": n_workers,
+        "rss_mb_per_worker": sum(r["rss"] for r in rows) / n_workers,
+        "pss_mb_total": sum(r["pss"] for r in rows),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    from backend import checkpoints
+
+    missing = [p for p in checkpoints._checkpoints().values() if not os.path.exists(checkpoints.mmap_path(p))]
+    if missing:
+        raise SystemExit(f"No converted checkpoint for {missing}; run python -m backend.checkpoints first")
+
+    counts = sorted(set(args.workers) | {1})
+    print(f"{'mode':>11} {'workers':>8} {'RSS MB/worker':>14} {'PSS MB total':>13} {'PSS MB/added worker':>20}")
+    results = {}
+    for mode, flag in MODES.items():
+        rows = [measure(flag, n) for n in counts]
+        base = rows[0]["pss_mb_total"]
+        for row in rows:
+            n = row["workers"]
+            row["pss_mb_per_added_worker"] = (row["pss_mb_total"] - base) / (n - 1) if n > 1 else None
+            added = row["pss_mb_per_added_worker"]
+            print(
+                f"{mode:>11} {n:>8} {row['rss_mb_per_worker']:>14.1f} {row['pss_mb_total']:>13.1f} "
+                f"{'-' if added is None else f'{added:.1f}':>20}"
+            )
+        results[mode] = rows
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,400 @@
+"""
+Benchmark suite for the pipeline and each of its stages, on synthetic images.
+
+Measures, and writes to JSON so runs can be compared over time:
+
+- cold import time of backend.pipeline, torch and tensorflow (fresh
+  interpreter per run),
+- load time and weight memory of every model,
+- p50 / p95 / p99 latency and throughput of prepare_for_detection,
+  run_detection, run_classification, run_segmentation,
+  overlay_mask_on_image and full_pipeline_from_array for each image size,
+- the batched entry points for each batch size,
+- peak RSS after each benchmark and for the whole run.
+
+Runs offline: a model whose checkpoint is missing (or every model, with
+--synthetic) is replaced by a randomly initialized SmallResNetSE / UNet
+and a small stand-in Keras detector with the real (N, 224, 224, 1) ->
+(N, 1) signature. The stand-in reports a tumor in every image, so
+full-pipeline numbers always cover all stages. Synthetic models run on
+the native backend with quantization off.
+
+Run from the project root:
+
+    python -m benchmarks.suite --sizes 256 512 1024 --batch-sizes 1 4 16 --json bench.json
+    python -m benchmarks.suite --json new.json --compare bench.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from backend import (
+    classification_inference,
+    detection_inference,
+    onnx_runtime,
+    pipeline,
+    quantization,
+    segmentation_inference,
+    torch_execution,
+)
+from backend.model_registry import registry
+from utils.preprocessing import prepare_for_detection
+from utils.visualization import overlay_mask_on_image
+
+IMPORT_TARGETS = ("backend.pipeline", "torch", "tensorflow")
+MODEL_PATHS = {
+    "detection": detection_inference.MODEL_PATH,
+    "classification": classification_inference.MODEL_PATH,
+    "segmentation": segmentation_inference.MODEL_PATH,
+}
+
+
+# ----------------------------------------------------------------------
+# Synthetic inputs and models
+# ----------------------------------------------------------------------
+
+def synthetic_image(size: int, seed: int = 0) -> np.ndarray:
+    """
+    A (size, size, 3) uint8 stand-in for a scan: a bright elliptical
+    "head" with a brighter blob inside it, plus noise.
+    """
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:size, 0:size] / size - 0.5
+    head = ((xx / 0.42) ** 2 + (yy / 0.46) ** 2) < 1.0
+    blob = ((xx - 0.1) ** 2 + (yy + 0.08) ** 2) < 0.12 ** 2
+    gray = 30.0 + 110.0 * head + 80.0 * blob + rng.normal(0.0, 12.0, (size, size))
+    gray = np.clip(gray, 0, 255).astype(np.uint8)
+    return np.repeat(gray[:, :, None], 3, axis=2)
+
+
+def synthetic_mask(size: int) -> np.ndarray:
+    """
+    A (size, size) bool mask covering roughly 5% of the image.
+    """
+    yy, xx = np.mgrid[0:size, 0:size] / size - 0.5
+    return ((xx - 0.1) ** 2 + (yy + 0.08) ** 2) < 0.125 ** 2
+
+
+def _stand_in_detector():
+    import tensorflow as tf
+
+    from backend.detection_engine import DetectionEngine
+
+    tf.keras.utils.set_random_seed(0)
+    size = detection_inference.IMAGE_SIZE
+    layers = tf.keras.layers
+    inputs = tf.keras.Input((size, size, 1))
+    x = inputs
+    for filters in (32, 64, 128):
+        x = layers.Conv2D(filters, 3, strides=2, padding="same", activation="relu")(x)
+    x = layers.GlobalAveragePooling2D()(x)
+    # Large positive bias: every image is "tumor-positive"
+    outputs = layers.Dense(1, activation="sigmoid", bias_initializer=tf.keras.initializers.Constant(4.0))(x)
+    return DetectionEngine(tf.keras.Model(inputs, outputs), image_size=size)
+
+
+def _random_torch_model(stage: str):
+    def load():
+        import torch
+
+        torch.manual_seed(0)
+        if stage == "classification":
+            from backend.classification_model import SmallResNetSE
+
+            model = SmallResNetSE(num_classes=len(classification_inference.CLASS_NAMES))
+        else:
+            from backend.segmentation_model import UNet
+
+            model = UNet(n_channels=1, n_classes=1)
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        return model.to(device).eval()
+
+    return load
+
+
+def use_synthetic_models(stages) -> None:
+    """
+    Replace the registered loaders of the given stages with random models.
+    """
+    if stages:
+        onnx_runtime.set_backend("native")
+        quantization.set_mode("off")
+    for stage in stages:
+        loader = _stand_in_detector if stage == "detection" else _random_torch_model(stage)
+        registry.register(stage, loader)
+
+
+# ----------------------------------------------------------------------
+# Measurement helpers
+# ----------------------------------------------------------------------
+
+def peak_rss_mb() -> Optional[float]:
+    """
+    Peak resident set size of this process so far, in MiB (None where
+    the resource module is unavailable).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+
+def import_seconds(module: str, runs: int = 3) -> Optional[float]:
+    """
+    Median time to import a module in a fresh interpreter (None if the
+    import fails, e.g. an optional framework is not installed).
+    """
+    code = (
+        "import time; start = time.perf_counter(); "
+        f"import {module}; print(time.perf_counter() - start)"
+    )
+    samples = []
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        if proc.returncode != 0:
+            return None
+        samples.append(float(proc.stdout.strip().splitlines()[-1]))
+    return float(np.median(samples))
+
+
+def measure(fn: Callable[[], object], items: int, repeats: int, warmup: int = 2) -> dict:
+    """
+    Latency percentiles and throughput of repeated fn() calls, each
+    processing `items` images.
+    """
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    ms = np.array(samples) * 1000.0
+    return {
+        "n": repeats,
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+        "throughput_per_s": items * repeats / float(np.sum(samples)),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        proc = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True)
+    except OSError:
+        return None
+    return proc.stdout.strip() or None
+
+
+def _versions() -> Dict[str, Optional[str]]:
+    versions = {"python": platform.python_version(), "numpy": np.__version__}
+    for name in ("torch", "tensorflow"):
+        module = sys.modules.get(name)
+        versions[name] = getattr(module, "__version__", None)
+    return versions
+
+
+# ----------------------------------------------------------------------
+# Benchmarks
+# ----------------------------------------------------------------------
+
+def stage_benchmarks(size: int) -> Dict[str, Callable[[], object]]:
+    """
+    Single-image calls for one image size.
+    """
+    img = synthetic_image(size)
+    mask = synthetic_mask(size)
+    det_input = prepare_for_detection(img)
+    out = np.empty_like(img)
+    return {
+        "prepare_for_detection": lambda: prepare_for_detection(img),
+        "run_detection": lambda: detection_inference.run_detection(det_input),
+        "run_classification": lambda: classification_inference.run_classification(img),
+        "run_segmentation": lambda: segmentation_inference.run_segmentation(img),
+        "overlay_mask_on_image": lambda: overlay_mask_on_image(img, mask, out=out),
+        "full_pipeline_from_array": lambda: pipeline.full_pipeline_from_array(img),
+    }
+
+
+def batch_benchmarks(size: int, batch_size: int) -> Dict[str, Callable[[], object]]:
+    """
+    Batched calls over batch_size distinct images of one size.
+    """
+    images = [synthetic_image(size, seed=i) for i in range(batch_size)]
+    det_inputs = [prepare_for_detection(img) for img in images]
+    return {
+        "run_detection_batch": lambda: detection_inference.run_detection_batch(det_inputs),
+        "run_classification_batch": lambda: classification_inference.run_classification_batch(images),
+        "run_segmentation_batch": lambda: segmentation_inference.run_segmentation_batch(images),
+        "full_pipeline_batch": lambda: pipeline.full_pipeline_batch(images),
+    }
+
+
+def run_suite(
+    sizes: List[int],
+    batch_sizes: List[int],
+    batch_image_size: int,
+    repeats: int,
+    synthetic: List[str],
+    import_runs: int = 3,
+) -> dict:
+    """
+    Run every benchmark and return the JSON-serializable report.
+    """
+    imports = {}
+    if import_runs > 0:
+        for module in IMPORT_TARGETS:
+            imports[module] = import_seconds(module, import_runs)
+            print(f"import {module:20s} {_fmt_seconds(imports[module])}")
+
+    pipeline.disable_result_cache()
+    use_synthetic_models(synthetic)
+
+    names = onnx_runtime.active_models()
+    rss_before = peak_rss_mb()
+    registry.warmup(names)
+    report = registry.memory_report()
+    models = {}
+    for name in names:
+        models[name] = {
+            "load_seconds": report[name]["load_seconds"],
+            "weight_bytes": report[name]["weight_bytes"],
+            "synthetic": name in synthetic,
+        }
+        print(f"load   {name:20s} {_fmt_seconds(report[name]['load_seconds'])}"
+              f"{'  (synthetic)' if name in synthetic else ''}")
+
+    results = []
+    print(f"\n{'benchmark':>26} {'size':>5} {'batch':>5} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'img/s':>8} {'peak MB':>8}")
+
+    def record(name: str, size: int, batch: int, fn: Callable[[], object]) -> None:
+        row = {"benchmark": name, "image_size": size, "batch_size": batch}
+        row.update(measure(fn, batch, repeats))
+        results.append(row)
+        print(f"{name:>26} {size:>5} {batch:>5} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} "
+              f"{row['p99_ms']:>9.2f} {row['throughput_per_s']:>8.1f} {row['peak_rss_mb'] or 0:>8.0f}")
+
+    for size in sizes:
+        for name, fn in stage_benchmarks(size).items():
+            record(name, size, 1, fn)
+    for batch in batch_sizes:
+        for name, fn in batch_benchmarks(batch_image_size, batch).items():
+            record(name, batch_image_size, batch, fn)
+
+    return {
+        "meta": {
+            "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "versions": _versions(),
+            "backend": onnx_runtime.get_backend(),
+            "quantization": quantization.get_mode(),
+            "torch_execution": torch_execution.describe() if "torch" in sys.modules else None,
+            "repeats": repeats,
+        },
+        "imports": imports,
+        "models": models,
+        "model_load_rss_mb": {"before": rss_before, "after": peak_rss_mb()},
+        "results": results,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def _fmt_seconds(seconds: Optional[float]) -> str:
+    return "n/a" if seconds is None else f"{seconds * 1000.0:9.1f} ms"
+
+
+# ----------------------------------------------------------------------
+# Comparing runs
+# ----------------------------------------------------------------------
+
+def compare(baseline: dict, current: dict) -> List[dict]:
+    """
+    Match results of two reports by (benchmark, image_size, batch_size).
+
+    Returns
+    -------
+    rows : list of dict
+        One row per benchmark present in both, with both p50 latencies
+        and speedup = baseline p50 / current p50.
+    """
+    def key(row):
+        return row["benchmark"], row["image_size"], row["batch_size"]
+
+    old = {key(row): row for row in baseline["results"]}
+    rows = []
+    for row in current["results"]:
+        prev = old.get(key(row))
+        if prev is None:
+            continue
+        rows.append({
+            "benchmark": row["benchmark"],
+            "image_size": row["image_size"],
+            "batch_size": row["batch_size"],
+            "baseline_p50_ms": prev["p50_ms"],
+            "p50_ms": row["p50_ms"],
+            "speedup": prev["p50_ms"] / row["p50_ms"] if row["p50_ms"] else None,
+        })
+    return rows
+
+
+def _print_comparison(rows: List[dict], baseline_name: str) -> None:
+    print(f"\nvs. {baseline_name}")
+    print(f"{'benchmark':>26} {'size':>5} {'batch':>5} {'base p50':>9} {'p50 ms':>9} {'speedup':>8}")
+    for row in rows:
+        print(f"{row['benchmark']:>26} {row['image_size']:>5} {row['batch_size']:>5} "
+              f"{row['baseline_p50_ms']:>9.2f} {row['p50_ms']:>9.2f} {row['speedup']:>7.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256, 512, 1024],
+                        help="Square image sizes for the single-image benchmarks")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--batch-image-size", type=int, default=512,
+                        help="Image size for the batched benchmarks")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--import-runs", type=int, default=3,
+                        help="Fresh interpreters per import measurement (0 skips it)")
+    parser.add_argument("--synthetic", action="store_true",
+                        help="Use random models even where checkpoints exist")
+    parser.add_argument("--json", help="Write the report to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="Report from an earlier run to compare against")
+    args = parser.parse_args()
+
+    synthetic = [
+        stage for stage, path in MODEL_PATHS.items()
+        if args.synthetic or not os.path.exists(path)
+    ]
+    report = run_suite(
+        args.sizes, args.batch_sizes, args.batch_image_size, args.repeats, synthetic, args.import_runs
+    )
+    print(f"\npeak RSS {report['peak_rss_mb'] or 0:.0f} MB")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        _print_comparison(compare(baseline, report), args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Latency and accuracy of the PyTorch execution modes (channels_last, bf16).
+
+Each mode runs freshly loaded eager models over the same images and is
+compared with float32 NCHW: class-probability drift and top-1 agreement
+for the classifier, mask Dice for the UNet. Modes the CPU cannot run are
+reported and skipped.
+
+Run from the project root:
+
+    python -m benchmarks.torch_modes --data-dir data_samples --repeats 5 --json modes.json
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from backend import classification_inference, segmentation_inference, torch_execution
+from backend.quantization import mask_dice
+from utils.preprocessing import PreprocessContext
+
+VALID_EXTS = {".png", ".jpg", ".jpeg"}
+
+MODES = {
+    "float32": dict(channels_last=False, bf16=False),
+    "channels_last": dict(channels_last=True, bf16=False),
+    "bf16": dict(channels_last=False, bf16=True),
+    "channels_last+bf16": dict(channels_last=True, bf16=True),
+}
+
+
+def _run(model, inputs, repeats: int):
+    """
+    Outputs for every input, and the median latency per image in ms.
+    """
+    import torch
+
+    outputs, samples = [], []
+    with torch.no_grad():
+        for x in inputs:
+            t = torch.from_numpy(x)
+            out = torch_execution.forward(model, t)  # warm-up
+            for _ in range(repeats):
+                start = time.perf_counter()
+                out = torch_execution.forward(model, t)
+                samples.append((time.perf_counter() - start) / len(x))
+            outputs.append(out.numpy())
+    return outputs, float(np.median(samples)) * 1000.0
+
+
+def _softmax(x: np.ndarray) -> np.ndarray:
+    e = np.exp(x - x.max(axis=1, keepdims=True))
+    return e / e.sum(axis=1, keepdims=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--data-dir", default="data_samples")
+    parser.add_argument("--batch-size", type=int, default=1, help="UNet batch size")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    paths = [
+        os.path.join(args.data_dir, f)
+        for f in sorted(os.listdir(args.data_dir))
+        if os.path.splitext(f)[1].lower() in VALID_EXTS
+    ]
+    if not paths:
+        raise SystemExit(f"No images found in {args.data_dir}")
+
+    contexts = [PreprocessContext.from_path(p) for p in paths]
+    cls_inputs = [ctx.classification_input(classification_inference.INPUT_RESOLUTION) for ctx in contexts]
+    seg_all = np.concatenate([ctx.segmentation_input() for ctx in contexts])
+    seg_inputs = [seg_all[i:i + args.batch_size] for i in range(0, len(seg_all), args.batch_size)]
+
+    print(f"{len(paths)} images, bf16 supported: {torch_execution.bf16_supported()}")
+    print(
+        f"{'mode':>20} {'cls ms/img':>11} {'prob drift':>11} {'top-1':>7} "
+        f"{'seg ms/img':>11} {'dice mean':>10} {'dice min':>9}"
+    )
+
+    results, ref_probs, ref_masks = {}, None, None
+    for mode, options in MODES.items():
+        if options["bf16"] and not torch_execution.bf16_supported():
+            print(f"{mode:>20}  skipped (no bf16 support on this CPU)")
+            continue
+        torch_execution.set_modes(**options)
+
+        # Fresh eager models: channels_last converts a model in place
+        cls_out, cls_ms = _run(classification_inference._load_eager_model(), cls_inputs, args.repeats)
+        seg_out, seg_ms = _run(segmentation_inference._load_eager_model(), seg_inputs, args.repeats)
+
+        probs = np.concatenate([_softmax(o) for o in cls_out])
+        masks = np.concatenate(seg_out)[:, 0] > 0.0  # sigmoid(x) > 0.5
+        if ref_probs is None:
+            ref_probs, ref_masks = probs, masks
+
+        dice = [mask_dice(a, b) for a, b in zip(ref_masks, masks)]
+        row = {
+            "cls_ms": cls_ms,
+            "prob_drift_max": float(np.abs(probs - ref_probs).max()),
+            "top1_agreement": float((probs.argmax(1) == ref_probs.argmax(1)).mean()),
+            "seg_ms": seg_ms,
+            "dice_mean": float(np.mean(dice)),
+            "dice_min": float(np.min(dice)),
+        }
+        results[mode] = row
+        print(
+            f"{mode:>20} {cls_ms:>11.2f} {row['prob_drift_max']:>11.5f} {row['top1_agreement']:>7.1%} "
+            f"{seg_ms:>11.2f} {row['dice_mean']:>10.4f} {row['dice_min']:>9.4f}"
+        )
+
+    torch_execution.set_modes(channels_last=False, bf16=False)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
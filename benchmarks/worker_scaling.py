@@ -0,0 +1,55 @@
+"""
+Scaling benchmark: throughput of WorkerPool from 1 to N workers.
+
+Each configuration splits the available cores evenly between workers.
+Models are warmed in every worker before timing starts.
+
+Run from the project root:
+
+    python -m benchmarks.worker_scaling --data-dir data_samples --images 128 --max-workers 8
+"""
+import argparse
+import itertools
+import os
+import time
+
+from backend.worker_pool import WorkerPool, available_cores
+
+VALID_EXTS = {".png", ".jpg", ".jpeg"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--data-dir", default="data_samples")
+    parser.add_argument("--images", type=int, default=64, help="Images per run (samples repeated)")
+    parser.add_argument("--max-workers", type=int, default=len(available_cores()))
+    parser.add_argument("--batch-size", type=int, default=8)
+    args = parser.parse_args()
+
+    samples = [
+        os.path.join(args.data_dir, f)
+        for f in sorted(os.listdir(args.data_dir))
+        if os.path.splitext(f)[1].lower() in VALID_EXTS
+    ]
+    if not samples:
+        raise SystemExit(f"No images found in {args.data_dir}")
+    paths = list(itertools.islice(itertools.cycle(samples), args.images))
+
+    n_cores = len(available_cores())
+    counts = sorted({1, 2, 4, 8, 16, 32, args.max_workers} & set(range(1, args.max_workers + 1)))
+
+    print(f"{len(paths)} images, {n_cores} cores")
+    print(f"{'workers':>8} {'threads/worker':>15} {'img/s':>8} {'speedup':>8}")
+    base = None
+    for n in counts:
+        threads = max(1, n_cores // n)
+        with WorkerPool(n, threads_per_worker=threads, batch_size=args.batch_size) as pool:
+            start = time.perf_counter()
+            pool.map(paths)
+            rate = len(paths) / (time.perf_counter() - start)
+        base = base or rate
+        print(f"{n:>8} {threads:>15} {rate:>8.1f} {rate / base:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
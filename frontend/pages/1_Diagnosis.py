@@ -21,7 +21,10 @@ PROJECT_ROOT = os.path.dirname(
 if PROJECT_ROOT not in sys.path:
     sys.path.append(PROJECT_ROOT)
 
+from backend import onnx_runtime  # noqa: E402
+from backend.model_registry import registry  # noqa: E402
 from backend.pipeline import full_pipeline_from_array  # noqa: E402
+from utils.visualization import overlay_mask_on_image  # noqa: E402
 
 # -------------------------------------------------------------------
 # Helper functions
@@ -79,17 +82,52 @@ def load_image(file) -> np.ndarray:
     return np.array(img)
 
 
-def apply_overlay(img, mask, color_rgb, opacity=0.5):
+@st.cache_resource(show_spinner="Loading AI models...")
+def warm_models():
+    # Once per server process, shared by every session
+    registry.warmup(onnx_runtime.active_models())
+    return registry
+
+
+def analyze_upload(file) -> dict:
+    """
+    Decode the upload and run the pipeline once per uploaded file.
+
+    Widget changes rerun the whole script; keyed on the uploader's file_id,
+    the decoded image and predictions are reused from session_state instead
+    of running all three models again.
+    """
+    cached = st.session_state.get("diagnosis")
+    if cached is not None and cached["file_id"] == file.file_id:
+        return cached
+
+    img_rgb = load_image(file)
+    with st.spinner("Running AI models on the MRI..."):
+        # The overlay is rendered below in the user's color / opacity
+        result = full_pipeline_from_array(img_rgb, with_overlay=False)
+
+    cached = {"file_id": file.file_id, "image": img_rgb, "result": result}
+    st.session_state.diagnosis = cached
+    st.session_state.pop("overlay_cache", None)
+    return cached
+
+
+def cached_overlay(file_id, img, mask, color_rgb, opacity):
+    """
+    Recompute the overlay only when the file, color or opacity changes.
+
+    Every recompute gets a fresh array: earlier overlays may still be held
+    by the result kept in session_state for the report page.
+    """
     if mask is None:
         return img
-    overlay = img.copy().astype(np.float32)
-    tumor_mask = mask > 0
-    r, g, b = color_rgb
-    for c_idx, c_val in enumerate([r, g, b]):
-        overlay[tumor_mask, c_idx] = (
-            overlay[tumor_mask, c_idx] * (1 - opacity) + c_val * opacity
-        )
-    return overlay.astype(np.uint8)
+    key = (file_id, color_rgb, opacity)
+    cached = st.session_state.get("overlay_cache")
+    if cached is None or cached[0] != key:
+        overlay = overlay_mask_on_image(img, mask, color_rgb, opacity)
+        cached = (key, overlay)
+        st.session_state.overlay_cache = cached
+    return cached[1]
 
 
 apply_theme_css()
@@ -126,12 +164,12 @@ if uploaded is None:
     st.stop()
 
 # -------------------------------------------------------------------
-# Run pipeline
+# Run pipeline (once per uploaded file)
 # -------------------------------------------------------------------
-img_rgb = load_image(uploaded)
-
-with st.spinner("Running AI models on the MRI..."):
-    result = full_pipeline_from_array(img_rgb)
+warm_models()
+diagnosis = analyze_upload(uploaded)
+img_rgb = diagnosis["image"]
+result = diagnosis["result"]
 
 has_tumor = bool(result["has_tumor"])
 det_prob = float(result["detection_prob"])
@@ -139,10 +177,14 @@ label = result.get("predicted_label")
 class_probs = result.get("class_probs") or {}
 mask = result.get("segmentation_mask")
 
-overlay = apply_overlay(img_rgb, mask, color_map[color_choice], opacity)
+overlay = cached_overlay(
+    uploaded.file_id, img_rgb, mask, color_map[color_choice], opacity
+)
 
 # Save into session_state so Report page can use it
 st.session_state.last_result = {
+    # Identifies what the report depends on, so it can reuse a built PDF
+    "result_id": (uploaded.file_id, color_choice, opacity),
     "has_tumor": has_tumor,
     "detection_prob": det_prob,
     "predicted_label": label,
@@ -2,17 +2,11 @@
 
 import os
 import sys
-from io import BytesIO
 
-import numpy as np
 import streamlit as st
-from PIL import Image
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.lib.utils import ImageReader
 
 # -------------------------------------------------------------------
-# Make project root importable (if you ever need backend here)
+# Make project root importable
 # -------------------------------------------------------------------
 PROJECT_ROOT = os.path.dirname(
     os.path.dirname(
@@ -22,6 +16,8 @@ PROJECT_ROOT = os.path.dirname(
 if PROJECT_ROOT not in sys.path:
     sys.path.append(PROJECT_ROOT)
 
+from backend.report import render_report  # noqa: E402
+
 
 def apply_theme_css():
     theme = st.session_state.get("theme", "Dark")
@@ -102,98 +98,37 @@ st.markdown("---")
 st.markdown("### 📥 Export as PDF")
 
 def build_pdf() -> bytes:
-    buf = BytesIO()
-    c = canvas.Canvas(buf, pagesize=letter)
-    width, height = letter
-
-    # Title
-    c.setFont("Helvetica-Bold", 18)
-    c.drawString(50, height - 60, "Brain Tumor Analysis Report")
-
-    # Detection info
-    y = height - 100
-    c.setFont("Helvetica-Bold", 13)
-    c.drawString(50, y, "AI Findings")
-    y -= 20
-    c.setFont("Helvetica", 11)
-    c.drawString(50, y, f"Tumor detected: {has_tumor}")
-    y -= 16
-    c.drawString(50, y, f"Detection confidence: {det_prob:.2%}")
-    y -= 16
-    if has_tumor and label:
-        c.drawString(50, y, f"Predicted tumor type: {label.upper()}")
-        y -= 20
-
-    if has_tumor and class_probs:
-        c.setFont("Helvetica-Bold", 12)
-        c.drawString(50, y, "Class probabilities:")
-        y -= 16
-        c.setFont("Helvetica", 10)
-        for cls, p in class_probs.items():
-            c.drawString(60, y, f"- {cls}: {float(p):.2%}")
-            y -= 14
-
-    # Segmentation stats
-    if mask is not None:
-        tumor_pixels = int(np.sum(mask > 0))
-        total_pixels = int(mask.size)
-        coverage = tumor_pixels / total_pixels * 100 if total_pixels > 0 else 0.0
-        y -= 10
-        c.setFont("Helvetica-Bold", 12)
-        c.drawString(50, y, "Segmentation:")
-        y -= 16
-        c.setFont("Helvetica", 10)
-        c.drawString(60, y, f"Tumor pixels: {tumor_pixels:,}")
-        y -= 14
-        c.drawString(60, y, f"Coverage: {coverage:.2f}%")
-        y -= 24
-
-    # Doctor notes
-    c.setFont("Helvetica-Bold", 13)
-    c.drawString(50, y, "Doctor Notes")
-    y -= 18
-    c.setFont("Helvetica", 10)
-
-    text_obj = c.beginText(50, y)
-    wrap_width = 90  # characters per line approx
-    for line in doctor_notes.splitlines():
-        while len(line) > wrap_width:
-            text_obj.textLine(line[:wrap_width])
-            line = line[wrap_width:]
-        text_obj.textLine(line)
-    c.drawText(text_obj)
-
-    # Images at bottom
-    img_y = 140
-    img_w = 240
-    img_h = 240
-
-    img_io = BytesIO()
-    Image.fromarray(img_rgb).save(img_io, format="PNG")
-    img_io.seek(0)
-    c.drawImage(ImageReader(img_io), 50, img_y, width=img_w, height=img_h, preserveAspectRatio=True)
-
-    ov_io = BytesIO()
-    Image.fromarray(overlay).save(ov_io, format="PNG")
-    ov_io.seek(0)
-    c.drawImage(ImageReader(ov_io), 325, img_y, width=img_w, height=img_h, preserveAspectRatio=True)
-
-    # Footer
-    c.setFont("Helvetica", 8)
-    c.drawString(50, 40, "Generated by Brain Tumor AI Diagnostic System")
-
-    c.save()
-    buf.seek(0)
-    return buf.getvalue()
-
-
-pdf_bytes = build_pdf()
-
-st.download_button(
-    "⬇️ Download PDF Report",
-    data=pdf_bytes,
-    file_name="brain_tumor_report.pdf",
-    mime="application/pdf",
-)
+    result = {
+        "has_tumor": has_tumor,
+        "detection_prob": det_prob,
+        "predicted_label": label,
+        "class_probs": class_probs,
+        "segmentation_mask": mask,
+        "overlay_image": overlay,
+    }
+    # Keyed by the result: downsampled images are encoded once, so
+    # regenerating after editing the notes only lays out the text
+    return render_report(img_rgb, result, doctor_notes, key=res.get("result_id"))
+
+
+# Build the PDF only on request; typing in the notes box reruns this
+# script on every change and must not rebuild it each time.
+pdf_key = (res.get("result_id"), doctor_notes)
+pdf_state = st.session_state.get("report_pdf")
+
+if st.button("📄 Generate PDF Report"):
+    with st.spinner("Building PDF..."):
+        pdf_state = (pdf_key, build_pdf())
+    st.session_state.report_pdf = pdf_state
+
+if pdf_state is not None and pdf_state[0] == pdf_key:
+    st.download_button(
+        "⬇️ Download PDF Report",
+        data=pdf_state[1],
+        file_name="brain_tumor_report.pdf",
+        mime="application/pdf",
+    )
+elif pdf_state is not None:
+    st.info("Notes or diagnosis changed since the last PDF. Generate it again to download.")
 
 st.caption("The PDF includes AI findings, segmentation statistics, and the doctor notes you entered above.")
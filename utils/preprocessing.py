@@ -1,5 +1,8 @@
+import io
+import os
 import numpy as np
-from typing import Union
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple, Union
 from pathlib import Path
 
 import cv2
@@ -14,6 +17,10 @@ DET_IMG_SIZE = 224
 CLS_IMG_SIZE = 224
 SEG_IMG_SIZE = 224
 
+# Reduced-resolution JPEG decoding in PreprocessContext.from_path /
+# from_bytes (see there). Off unless BTD_FAST_DECODE=1.
+FAST_DECODE = os.environ.get("BTD_FAST_DECODE", "0") == "1"
+
 
 def _open_image(path_or_file: Union[str, Path, "IO"]) -> Image.Image:
     """
@@ -28,6 +35,18 @@ def _open_image(path_or_file: Union[str, Path, "IO"]) -> Image.Image:
 # Public API used by backend.pipeline and (previously) Streamlit
 # ----------------------------------------------------------------------
 
+def _decode_gray(path_or_file, min_size: Optional[Tuple[int, int]] = None) -> np.ndarray:
+    """
+    Decode a JPEG straight to 8-bit grayscale (its luma channel, no RGB
+    conversion). With min_size = (H, W) the DCT-domain scaling of the
+    decoder picks the smallest 1/1, 1/2, 1/4 or 1/8 scale that keeps both
+    sides at least that large.
+    """
+    with Image.open(path_or_file) as img:
+        img.draft("L", (min_size[1], min_size[0]) if min_size else img.size)
+        return np.asarray(img.convert("L"))
+
+
 def load_image_from_path(path: Union[str, Path]) -> np.ndarray:
     """
     Load an image from disk and return an RGB numpy array.
@@ -59,21 +78,13 @@ def load_image_from_streamlit(file) -> np.ndarray:
     return np.array(img)
 
 
-def prepare_for_detection(img_rgb: np.ndarray) -> np.ndarray:
-    """
-    Preprocess an RGB image for the detection model.
-
-    Steps:
-    - Convert to grayscale
-    - Resize to 224×224
-    - Scale to [0, 1]
-    - Return with shape (1, 224, 224, 1)  [NHWC]
-    """
+def _to_gray(img_rgb: np.ndarray) -> np.ndarray:
     if img_rgb.ndim == 3 and img_rgb.shape[2] == 3:
-        gray = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2GRAY)
-    else:
-        gray = img_rgb
+        return cv2.cvtColor(img_rgb, cv2.COLOR_RGB2GRAY)
+    return img_rgb
 
+
+def _detection_from_gray(gray: np.ndarray) -> np.ndarray:
     gray = cv2.resize(gray, (DET_IMG_SIZE, DET_IMG_SIZE), interpolation=cv2.INTER_AREA)
 
     x = gray.astype("float32")
@@ -85,6 +96,19 @@ def prepare_for_detection(img_rgb: np.ndarray) -> np.ndarray:
     return x
 
 
+def prepare_for_detection(img_rgb: np.ndarray) -> np.ndarray:
+    """
+    Preprocess an RGB image for the detection model.
+
+    Steps:
+    - Convert to grayscale
+    - Resize to 224×224
+    - Scale to [0, 1]
+    - Return with shape (1, 224, 224, 1)  [NHWC]
+    """
+    return _detection_from_gray(_to_gray(img_rgb))
+
+
 def prepare_for_classification(img_rgb: np.ndarray) -> np.ndarray:
     """
     Preprocess an RGB image for the classification model.
@@ -135,3 +159,245 @@ def prepare_for_segmentation_input(img_rgb: np.ndarray) -> np.ndarray:
     x = np.expand_dims(x, axis=0)     # (1, H, W)
     x = np.expand_dims(x, axis=0)     # (1, 1, H, W)
     return x
+
+
+# ----------------------------------------------------------------------
+# Classification input resolution
+# ----------------------------------------------------------------------
+
+@dataclass(frozen=True)
+class ResolutionPolicy:
+    """
+    Input resolution policy for the classifier.
+
+    The classifier is fully convolutional up to a global average pool, so
+    it accepts any input size. Feeding it the native resolution makes cost
+    grow with the upload (a 4000×3000 photo is 12 megapixels of
+    convolutions); the other modes bound it.
+
+    mode:
+    - "native":   use the image as is (default, original behavior)
+    - "max_side": downscale so the longer side is at most `size`,
+                  keeping the aspect ratio; smaller images are untouched
+    - "fixed":    resize to size × size
+    """
+
+    mode: str = "native"
+    size: int = CLS_IMG_SIZE
+
+    MODES = ("native", "max_side", "fixed")
+
+    def __post_init__(self):
+        if self.mode not in self.MODES:
+            raise ValueError(
+                f"Unknown resolution mode {self.mode!r}, expected one of {self.MODES}"
+            )
+        if self.size <= 0:
+            raise ValueError(f"Resolution size must be positive, got {self.size}")
+
+    @classmethod
+    def parse(cls, spec: str) -> "ResolutionPolicy":
+        """
+        Parse "native", "max_side:<N>" or "fixed:<N>".
+        """
+        mode, _, size = spec.strip().partition(":")
+        if mode == "native":
+            return cls("native")
+        if not size:
+            raise ValueError(f"Resolution policy {spec!r} needs a size, e.g. {mode}:512")
+        return cls(mode, int(size))
+
+    def __str__(self) -> str:
+        return "native" if self.mode == "native" else f"{self.mode}:{self.size}"
+
+    def target_size(self, h: int, w: int) -> Tuple[int, int]:
+        """
+        Output (H, W) for an input of size (h, w).
+        """
+        if self.mode == "fixed":
+            return self.size, self.size
+        if self.mode == "max_side" and max(h, w) > self.size:
+            scale = self.size / max(h, w)
+            return max(1, round(h * scale)), max(1, round(w * scale))
+        return h, w
+
+    def apply(self, gray: np.ndarray) -> np.ndarray:
+        h, w = gray.shape[:2]
+        out_h, out_w = self.target_size(h, w)
+        if (out_h, out_w) == (h, w):
+            return gray
+        return cv2.resize(gray, (out_w, out_h), interpolation=cv2.INTER_AREA)
+
+
+# ----------------------------------------------------------------------
+# Shared single-pass preprocessing
+# ----------------------------------------------------------------------
+
+class PreprocessContext:
+    """
+    Everything the three models need from one decoded image, computed once.
+
+    Grayscale conversion and every resized / normalized model input are
+    produced lazily on first access and memoized, so detection,
+    classification and segmentation share the work instead of each
+    converting the image on its own. Every input is numerically identical
+    to what the individual functions (prepare_for_detection,
+    run_classification, run_segmentation) produce.
+
+    Two grayscale images are kept: detection and classification use cv2's
+    RGB->gray, while segmentation was trained on PIL's convert("L"), whose
+    rounding differs by one grey level on some colours.
+
+    Contexts made with from_path / from_bytes(reduced=True) (the default
+    with BTD_FAST_DECODE=1) defer decoding JPEGs: every grayscale input is
+    decoded straight to grayscale, detection and segmentation at a
+    DCT-reduced scale just above 224 px, and the full RGB `image` only
+    when something asks for it (overlays). Inputs then
+    differ slightly from the full decode; benchmarks/fast_decode.py
+    reports by how much.
+
+    Parameters
+    ----------
+    img_rgb : np.ndarray
+        Shape (H, W, 3) RGB or (H, W) grayscale, dtype uint8.
+    """
+
+    def __init__(self, img_rgb: np.ndarray):
+        self._image = img_rgb
+        self._source: Optional[Callable[[], object]] = None
+        self._size = img_rgb.shape[:2]
+        self._memo: Dict[str, object] = {}
+
+    @classmethod
+    def from_path(cls, path: Union[str, Path], reduced: Optional[bool] = None) -> "PreprocessContext":
+        """
+        Decode an image file; with reduced (default FAST_DECODE), JPEGs
+        are decoded lazily and at reduced size where possible.
+        """
+        return cls._from_source(lambda: path, reduced)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, reduced: Optional[bool] = None) -> "PreprocessContext":
+        """
+        Same as from_path, for an encoded image in memory.
+        """
+        return cls._from_source(lambda: io.BytesIO(data), reduced)
+
+    @classmethod
+    def _from_source(cls, source: Callable[[], object], reduced: Optional[bool]) -> "PreprocessContext":
+        if reduced if reduced is not None else FAST_DECODE:
+            with Image.open(source()) as img:
+                if img.format == "JPEG":
+                    ctx = cls.__new__(cls)
+                    ctx._image, ctx._source = None, source
+                    ctx._size = (img.height, img.width)
+                    ctx._memo = {}
+                    return ctx
+        return cls(np.array(_open_image(source())))
+
+    @property
+    def image(self) -> np.ndarray:
+        """The RGB image, (H, W, 3) uint8 (decoded on first access if deferred)."""
+        if self._image is None:
+            self._image = np.array(_open_image(self._source()))
+        return self._image
+
+    def encoded(self) -> bytes:
+        """The encoded file data of a deferred context (see `reduced`)."""
+        source = self._source()
+        if isinstance(source, (str, Path)):
+            with open(source, "rb") as f:
+                return f.read()
+        return source.getvalue()
+
+    def _get(self, key: str, compute: Callable[[], object]):
+        if key not in self._memo:
+            self._memo[key] = compute()
+        return self._memo[key]
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """Original (H, W)."""
+        return self._size
+
+    @property
+    def reduced(self) -> bool:
+        """Whether model inputs come from the reduced JPEG decode (deferred context)."""
+        return self._source is not None
+
+    @property
+    def gray(self) -> np.ndarray:
+        """cv2 grayscale, shape (H, W), shared by detection and classification."""
+        if self._source is not None:
+            return self._get("gray", lambda: _decode_gray(self._source()))
+        return self._get("gray", lambda: _to_gray(self.image))
+
+    def _gray_at_least(self, size: Tuple[int, int]) -> np.ndarray:
+        """
+        Grayscale with both sides at least size = (H, W): DCT-reduced for
+        deferred JPEGs, otherwise the full-size gray.
+        """
+        if self._source is None:
+            return self.gray
+        return self._get(f"gray:{size[0]}x{size[1]}", lambda: _decode_gray(self._source(), size))
+
+    @property
+    def pil_gray(self) -> Image.Image:
+        """PIL "L" image, used by segmentation."""
+        if self._source is not None:
+            size = (SEG_IMG_SIZE, SEG_IMG_SIZE)
+            return self._get("pil_gray", lambda: Image.fromarray(self._gray_at_least(size)))
+        return self._get("pil_gray", lambda: Image.fromarray(self.image).convert("L"))
+
+    def detection_input(self) -> np.ndarray:
+        """
+        Same as prepare_for_detection(image): (1, 224, 224, 1) float32 [NHWC].
+        """
+        return self._get(
+            "detection", lambda: _detection_from_gray(self._gray_at_least((DET_IMG_SIZE, DET_IMG_SIZE)))
+        )
+
+    def classification_input(self, resolution: Optional[ResolutionPolicy] = None) -> np.ndarray:
+        """
+        Grayscale scaled to [0, 1]: (1, 1, H', W') float32 [NCHW], where
+        (H', W') is the original size under the default "native" policy.
+        """
+        resolution = resolution or ResolutionPolicy()
+
+        def compute():
+            if self._source is not None and resolution.mode != "native":
+                target = resolution.target_size(*self.size)
+                gray = self._gray_at_least(target)
+                if gray.shape != target:
+                    gray = cv2.resize(gray, target[::-1], interpolation=cv2.INTER_AREA)
+            else:
+                gray = resolution.apply(self.gray)
+            x = gray.astype("float32")
+            # Scanning the source dtype is cheaper than the float copy and
+            # gives the same answer
+            if gray.max() > 1.0:
+                x = x / 255.0
+            return x[np.newaxis, np.newaxis]
+
+        return self._get(f"classification:{resolution}", compute)
+
+    def segmentation_input(self) -> np.ndarray:
+        """
+        Same as torchvision Resize((224, 224)) + ToTensor() on the PIL
+        grayscale image: (1, 1, 224, 224) float32 in [0, 1] [NCHW].
+        """
+        def compute():
+            resized = self.pil_gray.resize((SEG_IMG_SIZE, SEG_IMG_SIZE), Image.BILINEAR)
+            x = np.asarray(resized, dtype="float32") / 255.0
+            return x[np.newaxis, np.newaxis]
+
+        return self._get("segmentation", compute)
+
+
+def as_preprocess_context(image) -> PreprocessContext:
+    """
+    Accept either a PreprocessContext or an RGB numpy image.
+    """
+    if isinstance(image, PreprocessContext):
+        return image
+    return PreprocessContext(image)
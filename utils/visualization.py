@@ -1,30 +1,58 @@
+from typing import Optional, Tuple
+
 import numpy as np
 
 
+def mask_bbox(mask: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Bounding box of the nonzero pixels of a (H, W) mask.
+
+    Returns
+    -------
+    bbox : tuple of int or None
+        (top, bottom, left, right) as slice bounds (bottom / right
+        exclusive), or None for an empty mask.
+    """
+    rows = np.flatnonzero(mask.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(mask[rows[0]:rows[-1] + 1].any(axis=0))
+    return int(rows[0]), int(rows[-1]) + 1, int(cols[0]), int(cols[-1]) + 1
+
+
 def overlay_mask_on_image(
     img_rgb: np.ndarray,
     mask: np.ndarray,
     color=(144, 238, 144),
     alpha: float = 0.6,
+    out: Optional[np.ndarray] = None,
 ) -> np.ndarray:
     """
-    Create a color overlay on the image wherever mask == 1.
+    Create a color overlay on the image wherever mask is nonzero.
+
+    Blending is done in 8-bit fixed point, alpha quantized to 1/256:
+    out = (pixel * (256 - a) + color * a + 128) >> 8 with a = round(alpha * 256),
+    and only inside the mask's bounding box; the rest of the image is a
+    plain copy.
 
     Parameters
     ----------
     img_rgb : np.ndarray
         Original RGB image, shape (H, W, 3), uint8.
     mask : np.ndarray
-        Binary mask, shape (H, W), values {0, 1}.
+        Binary mask, shape (H, W), bool or {0, 1}.
     color : tuple
         Overlay color (R, G, B) in 0–255.
     alpha : float
         Blending factor: 0 = original, 1 = full overlay color.
+    out : np.ndarray, optional
+        Preallocated (H, W, 3) uint8 buffer to write into; may be img_rgb
+        itself to blend in place.
 
     Returns
     -------
     blended : np.ndarray
-        RGB image with overlay, shape (H, W, 3), uint8.
+        RGB image with overlay, shape (H, W, 3), uint8 (`out` if given).
     """
     if img_rgb.ndim != 3 or img_rgb.shape[2] != 3:
         raise ValueError("img_rgb must have shape (H, W, 3)")
@@ -37,15 +65,29 @@ def overlay_mask_on_image(
             f"Mask shape {mask.shape} does not match image shape {(h, w)}"
         )
 
-    # Ensure mask is boolean
-    mask_bool = mask.astype(bool)
+    if out is None:
+        out = img_rgb.copy()
+    else:
+        if out.shape != img_rgb.shape or out.dtype != np.uint8:
+            raise ValueError(f"out must be a uint8 array of shape {img_rgb.shape}")
+        if out is not img_rgb:
+            np.copyto(out, img_rgb)
+
+    bbox = mask_bbox(mask)
+    if bbox is None:
+        return out
+    top, bottom, left, right = bbox
 
-    blended = img_rgb.astype("float32").copy()
-    overlay_color = np.array(color, dtype="float32")
+    a = int(round(min(max(alpha, 0.0), 1.0) * 256))
+    offset = np.array(color, dtype=np.uint16) * a + 128
 
-    # Apply blending where mask is True
-    blended[mask_bool] = (
-        (1.0 - alpha) * blended[mask_bool] + alpha * overlay_color
-    )
+    # (pixel * (256 - a) + color * a + 128) >> 8 stays below 2**16
+    region = out[top:bottom, left:right]
+    blended = region.astype(np.uint16)
+    blended *= 256 - a
+    blended += offset
+    blended >>= 8
+    inside = mask[top:bottom, left:right, None].astype(bool, copy=False)
+    np.copyto(region, blended, casting="unsafe", where=inside)
 
-    return blended.astype("uint8")
+    return out
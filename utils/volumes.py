@@ -0,0 +1,267 @@
+"""
+Reading MRI volumes (DICOM series, NIfTI) as lazily produced 2D slices.
+
+The 2D models expect 8-bit grayscale images, so every slice goes through
+an intensity window (DICOM WindowCenter / WindowWidth when present,
+otherwise robust percentiles sampled from a few slices) mapped to
+0..255. Slices are read one at a time: uncompressed NIfTI voxel data is
+memory-mapped, DICOM series read one file per slice, so a 200-slice
+volume is never expanded in RAM.
+
+    volume = open_volume("study/")          # or "scan.nii.gz"
+    for index, slice_u8 in volume.slices():
+        ...
+
+pydicom and nibabel are optional: pip install pydicom nibabel.
+"""
+import os
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+NIFTI_EXTS = (".nii", ".nii.gz")
+
+# Slices sampled to pick a percentile window
+WINDOW_SAMPLE_SLICES = 16
+
+
+def _require(module: str):
+    try:
+        return __import__(module)
+    except ImportError as exc:
+        raise ImportError(f"Reading this volume needs {module}: pip install {module}") from exc
+
+
+# ----------------------------------------------------------------------
+# Intensity windowing
+# ----------------------------------------------------------------------
+
+@dataclass(frozen=True)
+class Window:
+    """
+    Linear intensity window: [center - width / 2, center + width / 2] is
+    mapped to 0..255, values outside are clipped.
+    """
+
+    center: float
+    width: float
+
+    def apply(self, data: np.ndarray) -> np.ndarray:
+        """
+        Window a slice of modality values into (H, W) uint8.
+        """
+        low = self.center - self.width / 2.0
+        scale = 255.0 / max(self.width, 1e-6)
+        out = (np.asarray(data, dtype=np.float32) - low) * scale
+        return np.clip(out, 0.0, 255.0, out=out).astype(np.uint8)
+
+    @classmethod
+    def from_percentiles(cls, data: np.ndarray, low: float = 0.5, high: float = 99.5) -> "Window":
+        lo, hi = np.percentile(data, [low, high])
+        return cls(center=float(lo + hi) / 2.0, width=float(max(hi - lo, 1e-6)))
+
+
+# ----------------------------------------------------------------------
+# Volumes
+# ----------------------------------------------------------------------
+
+class Volume:
+    """
+    A stack of 2D slices read on demand.
+
+    Subclasses implement __len__ and read_slice; `spacing` is
+    (slice, row, column) spacing in mm.
+    """
+
+    name: str = ""
+    spacing: Tuple[float, float, float] = (1.0, 1.0, 1.0)
+    invert: bool = False
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def read_slice(self, index: int) -> np.ndarray:
+        """
+        Modality values (after rescale slope / intercept) of one slice,
+        (H, W) float32.
+        """
+        raise NotImplementedError
+
+    @property
+    def voxel_mm3(self) -> float:
+        return float(np.prod(self.spacing))
+
+    def default_window(self) -> Window:
+        """
+        Robust percentile window over a few evenly spaced slices.
+        """
+        n = len(self)
+        picks = np.unique(np.linspace(0, n - 1, min(n, WINDOW_SAMPLE_SLICES)).round().astype(int))
+        sample = np.concatenate([self.read_slice(int(i)).ravel() for i in picks])
+        return Window.from_percentiles(sample)
+
+    def slice_image(self, index: int, window: Optional[Window] = None) -> np.ndarray:
+        """
+        One slice windowed to (H, W) uint8, ready for the 2D models.
+        """
+        image = (window or self.default_window()).apply(self.read_slice(index))
+        return 255 - image if self.invert else image
+
+    def slices(
+        self,
+        window: Optional[Window] = None,
+        indices: Optional[Sequence[int]] = None,
+    ) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        Yield (index, (H, W) uint8 slice) lazily, in slice order (or the
+        given indices). The window is fixed once for the whole volume.
+        """
+        window = window or self.default_window()
+        for index in range(len(self)) if indices is None else indices:
+            yield index, self.slice_image(index, window)
+
+
+class NiftiVolume(Volume):
+    """
+    NIfTI volume; slices are taken along the third voxel axis and rotated
+    to the usual radiological display. Uncompressed files are
+    memory-mapped; a 4D file uses its first volume.
+    """
+
+    def __init__(self, path: str):
+        nib = _require("nibabel")
+
+        self.path = path
+        self.name = os.path.basename(path)
+        for ext in NIFTI_EXTS:
+            if self.name.endswith(ext):
+                self.name = self.name[: -len(ext)]
+        self._img = nib.load(path, mmap=True)
+        shape = self._img.shape
+        if len(shape) < 3:
+            raise ValueError(f"{path} is not a volume (shape {shape})")
+        self._extra = (0,) * (len(shape) - 3)
+        zooms = self._img.header.get_zooms()
+        self.spacing = (float(zooms[2]), float(zooms[1]), float(zooms[0]))
+
+    def __len__(self) -> int:
+        return self._img.shape[2]
+
+    def read_slice(self, index: int) -> np.ndarray:
+        # Only this slice is read; scaling is applied by nibabel
+        data = np.asarray(self._img.dataobj[(slice(None), slice(None), index) + self._extra], dtype=np.float32)
+        return np.rot90(data)
+
+
+class DicomSeries(Volume):
+    """
+    One DICOM series, one file per slice, ordered along the slice normal
+    (InstanceNumber when positions are missing). Only headers are read up
+    front; pixel data is read per slice.
+    """
+
+    def __init__(self, paths: Sequence[str]):
+        pydicom = _require("pydicom")
+
+        headers = [(p, pydicom.dcmread(p, stop_before_pixels=True)) for p in paths]
+        if not headers:
+            raise ValueError("Empty DICOM series")
+
+        positions = [_slice_position(ds) for _, ds in headers]
+        if all(pos is not None for pos in positions):
+            order = np.argsort(positions, kind="stable")
+            gaps = np.diff(np.sort(positions))
+        else:
+            order = np.argsort([int(getattr(ds, "InstanceNumber", 0) or 0) for _, ds in headers], kind="stable")
+            gaps = np.array([])
+        self.paths = [headers[i][0] for i in order]
+
+        first = headers[order[0]][1]
+        self.name = str(getattr(first, "SeriesInstanceUID", "") or os.path.dirname(self.paths[0]))
+        row_mm, col_mm = (float(v) for v in getattr(first, "PixelSpacing", (1.0, 1.0)))
+        slice_mm = float(np.median(gaps)) if gaps.size else float(getattr(first, "SliceThickness", 1.0) or 1.0)
+        self.spacing = (slice_mm, row_mm, col_mm)
+        self.invert = getattr(first, "PhotometricInterpretation", "") == "MONOCHROME1"
+        self._window = _dicom_window(first)
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def read_slice(self, index: int) -> np.ndarray:
+        pydicom = _require("pydicom")
+
+        ds = pydicom.dcmread(self.paths[index])
+        data = ds.pixel_array.astype(np.float32)
+        slope = float(getattr(ds, "RescaleSlope", 1.0) or 1.0)
+        intercept = float(getattr(ds, "RescaleIntercept", 0.0) or 0.0)
+        if slope != 1.0 or intercept != 0.0:
+            data = data * slope + intercept
+        return data
+
+    def default_window(self) -> Window:
+        return self._window or super().default_window()
+
+
+def _slice_position(ds) -> Optional[float]:
+    position = getattr(ds, "ImagePositionPatient", None)
+    orientation = getattr(ds, "ImageOrientationPatient", None)
+    if position is None or orientation is None:
+        return None
+    row, col = np.asarray(orientation[:3], float), np.asarray(orientation[3:], float)
+    return float(np.dot(np.asarray(position, float), np.cross(row, col)))
+
+
+def _dicom_window(ds) -> Optional[Window]:
+    center, width = getattr(ds, "WindowCenter", None), getattr(ds, "WindowWidth", None)
+    if center is None or width is None:
+        return None
+    # Multi-valued when the modality suggests several windows: take the first
+    if not isinstance(center, (int, float)):
+        center, width = center[0], width[0]
+    return Window(float(center), float(width))
+
+
+# ----------------------------------------------------------------------
+# Opening studies
+# ----------------------------------------------------------------------
+
+def read_dicom_series(directory: str) -> List[DicomSeries]:
+    """
+    Every DICOM series found in a directory tree, largest first.
+    """
+    pydicom = _require("pydicom")
+
+    by_uid = {}
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames.sort()
+        for fname in sorted(filenames):
+            path = os.path.join(dirpath, fname)
+            try:
+                ds = pydicom.dcmread(path, stop_before_pixels=True, specific_tags=["SeriesInstanceUID"])
+            except Exception:  # not DICOM
+                continue
+            by_uid.setdefault(str(getattr(ds, "SeriesInstanceUID", "")), []).append(path)
+
+    series = [DicomSeries(paths) for paths in by_uid.values()]
+    return sorted(series, key=len, reverse=True)
+
+
+def open_volume(path: str) -> Volume:
+    """
+    Open a NIfTI file, a DICOM file's series or the largest DICOM series
+    in a directory.
+    """
+    if path.endswith(NIFTI_EXTS):
+        return NiftiVolume(path)
+
+    directory = path if os.path.isdir(path) else os.path.dirname(path) or "."
+    series = read_dicom_series(directory)
+    if not series:
+        raise ValueError(f"No DICOM series found in {directory}")
+    if os.path.isdir(path):
+        return series[0]
+    for s in series:
+        if os.path.abspath(path) in map(os.path.abspath, s.paths):
+            return s
+    raise ValueError(f"{path} is not a readable DICOM file")